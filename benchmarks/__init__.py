@@ -0,0 +1,4 @@
+"""
+Benchmarks of the muncher hot paths, run them from the repository root, for example:
+python -m benchmarks.bench_cookies_information
+"""
@@ -0,0 +1,79 @@
+"""
+Compares the indexed CookiesInformation aggregation to the previous list scanning implementation on a synthetic
+schedule.
+"""
+import argparse
+import copy
+import random
+import time
+
+from html_extractor import CookiesInformation
+from utils import update_first_found_url
+
+PURPOSES = ['Performance', 'Targeting/Advertising', 'Strictly Necessary', 'Functionality', 'Unknown']
+
+
+class ListCookiesInformation(object):
+    """
+    The previous implementation, kept here as the baseline.
+    """
+
+    def __init__(self):
+        self.cookies_by_type = {}
+        self.cookies_count = 0
+
+    def add_cookie(self, new_cookie, url):
+        cookies = self.cookies_by_type.get(new_cookie['purpose'], [])
+        old_cookie = [cookie for cookie in cookies if cookie['name'] == new_cookie['name']]
+        if not old_cookie:
+            new_cookie['first_found_url'] = url
+            cookies.append(new_cookie)
+            self.cookies_count += 1
+        else:
+            update_first_found_url(old_cookie[0], url)
+        self.cookies_by_type[new_cookie['purpose']] = cookies
+
+
+def generate_rows(rows, distinct_cookies, cookies_per_url=10, seed=0):
+    """
+    :return: A list of (url, cookie) pairs ordered by url, like the rows streamed from the db.
+    """
+    generator = random.Random(seed)
+    names = ['cookie_{}'.format(index) for index in range(distinct_cookies)]
+    purposes = {name: generator.choice(PURPOSES) for name in names}
+    generated = []
+    url = None
+    for index in range(rows):
+        if index % cookies_per_url == 0:
+            path = '/'.join('p{}'.format(part) for part in range(generator.randint(0, 5)))
+            url = 'https://example.com/{}?page={}'.format(path, index // cookies_per_url)
+        name = generator.choice(names)
+        generated.append((url, {'name': name, 'purpose': purposes[name], 'domain': 'example.com'}))
+    return generated
+
+
+def measure(information, rows):
+    start = time.perf_counter()
+    for url, cookie in rows:
+        information.add_cookie(copy.copy(cookie), url)
+    return time.perf_counter() - start
+
+
+def main():
+    parser = argparse.ArgumentParser(description=__doc__)
+    parser.add_argument('--rows', type=int, default=100000)
+    parser.add_argument('--distinct', type=int, default=5000)
+    args = parser.parse_args()
+    rows = generate_rows(args.rows, args.distinct)
+    indexed = CookiesInformation(None)
+    indexed_time = measure(indexed, rows)
+    listed = ListCookiesInformation()
+    listed_time = measure(listed, rows)
+    assert indexed.cookies_by_type == listed.cookies_by_type, "the aggregations differ"
+    print("{} rows, {} distinct cookies".format(args.rows, indexed.cookies_count))
+    print("list scanning: {:.3f}s".format(listed_time))
+    print("indexed:       {:.3f}s ({:.1f}x)".format(indexed_time, listed_time / indexed_time))
+
+
+if __name__ == '__main__':
+    main()
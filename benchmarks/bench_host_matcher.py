@@ -0,0 +1,52 @@
+"""
+Compares the HostMatcher to the previous substring scanning of the urls for the start domains.
+"""
+import argparse
+import random
+import time
+
+from host_matcher import HostMatcher
+
+
+def substring_matches(domains, url):
+    """
+    The previous classification, kept here as the baseline.
+    """
+    return any([domain in url for domain in domains])
+
+
+def generate_urls(count, domains, seed=0):
+    generator = random.Random(seed)
+    hosts = ['www.{}'.format(domain) for domain in domains] + ['cdn.other-{}.net'.format(index) for index in range(50)]
+    return ['https://{}/{}?ref={}'.format(generator.choice(hosts),
+                                          '/'.join('part{}'.format(part) for part in range(generator.randint(0, 6))),
+                                          generator.choice(domains))
+            for _ in range(count)]
+
+
+def main():
+    parser = argparse.ArgumentParser(description=__doc__)
+    parser.add_argument('--urls', type=int, default=200000)
+    parser.add_argument('--domains', type=int, default=20)
+    args = parser.parse_args()
+    domains = ['customer-{}.com'.format(index) for index in range(args.domains)]
+    urls = generate_urls(args.urls, domains)
+
+    start = time.perf_counter()
+    substring_internal = sum(1 for url in urls if substring_matches(domains, url))
+    substring_time = time.perf_counter() - start
+
+    matcher = HostMatcher(domains)
+    start = time.perf_counter()
+    matcher_internal = sum(1 for url in urls if matcher.matches(url))
+    matcher_time = time.perf_counter() - start
+
+    print("{} urls, {} domains".format(args.urls, args.domains))
+    print("substring scanning: {:.3f}s, {} internal (query strings counted as internal)".format(
+        substring_time, substring_internal))
+    print("host matcher:       {:.3f}s, {} internal ({:.1f}x)".format(matcher_time, matcher_internal,
+                                                                     substring_time / matcher_time))
+
+
+if __name__ == '__main__':
+    main()
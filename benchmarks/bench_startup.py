@@ -0,0 +1,45 @@
+"""
+Measures the startup time of every cli entry point: importing the module, and importing it and loading the db
+models with and without the cached schema snapshot. Needs a reachable db for the model loading scenarios.
+"""
+import argparse
+import os
+import subprocess
+import sys
+import time
+
+ENTRY_POINTS = ['process1', 'process2', 'pipelined', 'csv_extractor', 'html_extractor', 'initial_db']
+REPOSITORY_ROOT = os.path.dirname(os.path.dirname(os.path.abspath(__file__)))
+
+
+def measure(code, repeat):
+    """
+    :return: The best wall time of running the code in a new interpreter.
+    """
+    times = []
+    for _ in range(repeat):
+        start = time.perf_counter()
+        subprocess.check_call([sys.executable, '-c', code], cwd=REPOSITORY_ROOT)
+        times.append(time.perf_counter() - start)
+    return min(times)
+
+
+def main():
+    parser = argparse.ArgumentParser(description=__doc__)
+    parser.add_argument('--repeat', type=int, default=5)
+    parser.add_argument('--no-db', dest='no_db', action='store_true', help="Only measure the imports.")
+    args = parser.parse_args()
+    print("{:<16}{:>10}{:>16}{:>16}".format('entry point', 'import', 'reflect models', 'cached models'))
+    for entry_point in ENTRY_POINTS:
+        import_time = measure('import {}'.format(entry_point), args.repeat)
+        if args.no_db:
+            print("{:<16}{:>9.3f}s".format(entry_point, import_time))
+            continue
+        load = 'import {}, db; db.get_models()'.format(entry_point)
+        reflect_time = measure('import db; db.invalidate_metadata_cache(); ' + load, args.repeat)
+        cached_time = measure(load, args.repeat)
+        print("{:<16}{:>9.3f}s{:>15.3f}s{:>15.3f}s".format(entry_point, import_time, reflect_time, cached_time))
+
+
+if __name__ == '__main__':
+    main()
@@ -0,0 +1,237 @@
+"""
+Offline end to end benchmarks: crawl throughput (process1), cookie extraction throughput (process2) and report
+generation (CsvExtractor, HtmlExtractor, with and without the cookie summary). Every scenario runs in a new process
+against a sqlite db, a local generated site and the cookiepedia stand-in, nothing reaches mysql or the real web. The
+results are saved to benchmarks/results/<commit>.json so they can be compared between commits, for example:
+python -m benchmarks.run --pages 500
+python -m benchmarks.run --compare 3654d4b
+"""
+import argparse
+import copy
+import datetime
+import json
+import os
+import platform
+import subprocess
+import sys
+import tempfile
+import time
+
+REPOSITORY_ROOT = os.path.dirname(os.path.dirname(os.path.abspath(__file__)))
+RESULTS_FOLDER = os.path.join(REPOSITORY_ROOT, 'benchmarks', 'results')
+SCENARIOS = ['crawl', 'extract', 'reports']
+# The throughput of every scenario, compared between commits.
+THROUGHPUT = {'crawl': 'urls_per_second', 'extract': 'urls_per_second', 'reports': 'rows_per_second'}
+
+
+def create_params(parser_args, work_dir):
+    """
+    :return: The config params of the benchmark schedules.
+    """
+    from initial_db import PARAMS
+    params = copy.deepcopy(PARAMS)
+    params.update(domains=parser_args.site, domain_only=False, depth=parser_args.pages, silent=True,
+                  logs_folder=os.path.join(work_dir, 'logs'), print_items=False, checkpoint=False,
+                  cookiepedia_url=parser_args.cookiepedia, workers=parser_args.workers,
+                  metrics={'port': None, 'snapshot_path': None})
+    params['page_load'] = dict(params['page_load'], mode=parser_args.page_load)
+    return params
+
+
+def seed_urls(session, schedule_id, urls):
+    import db
+    from utils import fingerprint_url
+    session.execute(db.UrlScans.__table__.insert(), [
+        {'schedule_id': schedule_id, 'url': url, 'url_hash': fingerprint_url(url)} for url in urls])
+    session.add(db.MuncherStats(schedule_id=schedule_id, url_last_result='finished'))
+    session.commit()
+
+
+def run_crawl(parser_args, session, params):
+    import db
+    from fixtures.fake_db import create_schedule
+    from process1 import prepare_schedule, crawl_schedule, finish_schedule
+    schedule_id = create_schedule(session, params)
+    stats, args, allowed_domains, job_dir = prepare_schedule(session, schedule_id)
+    start = datetime.datetime.now()
+    begin = time.perf_counter()
+    crawl_schedule(schedule_id, args, allowed_domains, job_dir)
+    seconds = time.perf_counter() - begin
+    finish_schedule(session, stats, job_dir, start)
+    urls = session.query(db.UrlScans).filter(db.UrlScans.schedule_id == schedule_id).count()
+    return {'seconds': seconds, 'urls': urls, 'urls_per_second': urls / seconds}
+
+
+def run_extract(parser_args, session, params):
+    from fixtures.fake_db import create_schedule
+    from fixtures.fake_site import page_urls
+    schedule_id = create_schedule(session, params)
+    seed_urls(session, schedule_id, page_urls(parser_args.site, parser_args.pages))
+    # process2 binds its session to db.engine on import, so it is imported once the fake db is configured.
+    import process2
+    begin = time.perf_counter()
+    result = process2.process_schedule(schedule_id, parser_args.os)
+    seconds = time.perf_counter() - begin
+    stats = process2.get_stats(schedule_id)
+    return {'seconds': seconds, 'result': result, 'urls': parser_args.pages, 'cookies': stats.cookies_extracted_fp,
+            'urls_per_second': parser_args.pages / seconds}
+
+
+def run_reports(parser_args, session, params):
+    import db
+    from cookie_summary import summarize_schedule
+    from csv_extractor import CsvExtractor
+    from fixtures.fake_db import create_schedule
+    from fixtures.fake_site import HEADER_COOKIES, page_urls
+    from html_extractor import HtmlExtractor
+    schedule_id = create_schedule(session, params)
+    seed_urls(session, schedule_id, page_urls(parser_args.site, parser_args.pages))
+    now = datetime.datetime.now()
+    session.execute(db.CookieInfo.__table__.insert(), [
+        {'cookie_name': name, 'about': 'About {}'.format(name), 'purpose': 'Performance', 'datetime': now}
+        for name in HEADER_COOKIES[::2]])
+    info_ids = dict(session.query(db.CookieInfo.cookie_name, db.CookieInfo.id))
+    url_ids = [url_id for url_id, in session.query(db.UrlScans.id).filter(db.UrlScans.schedule_id == schedule_id)]
+    cookies = []
+    for url_id in url_ids:
+        for name in HEADER_COOKIES:
+            cookies.append({'cookie_info_id': info_ids.get(name), 'cookie_source': 0, 'datetime': now,
+                            'cookie_attr': json.dumps({'name': name, 'value': str(url_id), 'domain': '127.0.0.1',
+                                                       'path': '/', 'httponly': False, 'secure': False})})
+    cookie_ids = db.insert_rows(session, db.Cookies.__table__, cookies)
+    session.execute(db.ExtractedCookies.__table__.insert(), [
+        {'url_id': url_ids[index // len(HEADER_COOKIES)], 'cookie_id': cookie_id}
+        for index, cookie_id in enumerate(cookie_ids)])
+    session.commit()
+    begin = time.perf_counter()
+    csv_extractor = CsvExtractor(schedule_id)
+    csv_extractor.extract()
+    csv_extractor.close()
+    csv_seconds = time.perf_counter() - begin
+    begin = time.perf_counter()
+    HtmlExtractor(schedule_id).generate_html()
+    html_seconds = time.perf_counter() - begin
+    begin = time.perf_counter()
+    summarize_schedule(session, schedule_id)
+    summary_seconds = time.perf_counter() - begin
+    begin = time.perf_counter()
+    HtmlExtractor(schedule_id).generate_html()
+    summary_html_seconds = time.perf_counter() - begin
+    return {'seconds': csv_seconds + html_seconds, 'csv_seconds': csv_seconds, 'html_seconds': html_seconds,
+            'summary_seconds': summary_seconds, 'summary_html_seconds': summary_html_seconds,
+            'rows': len(cookies), 'rows_per_second': len(cookies) / (csv_seconds + html_seconds)}
+
+
+def run_scenario(parser_args):
+    """
+    Runs a single scenario in this process and prints its result as the last line of the output.
+    """
+    from sqlalchemy.orm import Session
+    from fixtures.fake_db import use_fake_db
+    use_fake_db(parser_args.db)
+    import db
+    session = Session(db.engine)
+    scenario = {'crawl': run_crawl, 'extract': run_extract, 'reports': run_reports}[parser_args.scenario]
+    result = scenario(parser_args, session, create_params(parser_args, os.getcwd()))
+    session.close()
+    print(json.dumps(result))
+
+
+def spawn_scenario(scenario, parser_args, site, cookiepedia, work_dir, repeat):
+    """
+    :return: The result of the fastest run of the scenario, or its error in case it failed.
+    """
+    results = []
+    for run in range(repeat):
+        db_path = os.path.join(work_dir, '{}_{}.db'.format(scenario, run))
+        command = [sys.executable, '-m', 'benchmarks.run', '--scenario', scenario, '--db', db_path,
+                   '--site', site.start_url, '--cookiepedia', cookiepedia.path_format,
+                   '--pages', str(parser_args.pages), '--workers', str(parser_args.workers),
+                   '--page-load', parser_args.page_load, '--os', parser_args.os]
+        env = dict(os.environ, PYTHONPATH=REPOSITORY_ROOT)
+        process = subprocess.run(command, cwd=work_dir, env=env, stdout=subprocess.PIPE, stderr=subprocess.PIPE,
+                                 universal_newlines=True)
+        if process.returncode:
+            return {'error': process.stderr.strip().splitlines()[-1] if process.stderr.strip() else 'failed'}
+        results.append(json.loads(process.stdout.strip().splitlines()[-1]))
+    return min(results, key=lambda result: result['seconds'])
+
+
+def current_commit():
+    """
+    :return: The short hash of the checked out commit, with a -dirty suffix in case there are uncommitted changes.
+    """
+    commit = subprocess.check_output(['git', 'rev-parse', '--short', 'HEAD'], cwd=REPOSITORY_ROOT,
+                                     universal_newlines=True).strip()
+    dirty = subprocess.check_output(['git', 'status', '--porcelain', '--untracked-files=no'], cwd=REPOSITORY_ROOT,
+                                    universal_newlines=True).strip()
+    return commit + ('-dirty' if dirty else '')
+
+
+def compare(results, baseline_commit):
+    with open(os.path.join(RESULTS_FOLDER, '{}.json'.format(baseline_commit))) as baseline_file:
+        baseline = json.load(baseline_file)
+    print("\n{:<10}{:>14}{:>14}{:>10}".format('scenario', baseline_commit, results['commit'], 'ratio'))
+    for scenario, metric in THROUGHPUT.items():
+        old = baseline['scenarios'].get(scenario, {}).get(metric)
+        new = results['scenarios'].get(scenario, {}).get(metric)
+        if old and new:
+            print("{:<10}{:>14.1f}{:>14.1f}{:>9.2f}x".format(scenario, old, new, new / old))
+
+
+def main():
+    parser = argparse.ArgumentParser(description=__doc__, formatter_class=argparse.RawDescriptionHelpFormatter)
+    parser.add_argument('--scenarios', nargs='+', choices=SCENARIOS, default=SCENARIOS)
+    parser.add_argument('--pages', type=int, default=200, help="The amount of pages of the fake site.")
+    parser.add_argument('--fan-out', dest='fan_out', type=int, default=5)
+    parser.add_argument('--cookies-per-page', dest='cookies_per_page', type=int, default=3)
+    parser.add_argument('--latency', type=float, default=0, help="Seconds every response of the fake site is delayed.")
+    parser.add_argument('--workers', type=int, default=4, help="The amount of browsers of the extraction.")
+    parser.add_argument('--page-load', dest='page_load', choices=['browser', 'fast', 'http'], default='http',
+                        help="The page load mode of the extraction, browser and fast need the phantomJS driver.")
+    parser.add_argument('--os', dest='os', default='linux_64', choices=['linux_64', 'linux_32', 'mac', 'windows'])
+    parser.add_argument('--repeat', type=int, default=1)
+    parser.add_argument('--compare', dest='compare', default=None,
+                        help="The commit whose saved results are compared to this run.")
+    # The arguments of a single scenario run in a child process.
+    parser.add_argument('--scenario', choices=SCENARIOS, help=argparse.SUPPRESS)
+    parser.add_argument('--db', help=argparse.SUPPRESS)
+    parser.add_argument('--site', help=argparse.SUPPRESS)
+    parser.add_argument('--cookiepedia', help=argparse.SUPPRESS)
+    parser_args = parser.parse_args()
+    if parser_args.scenario:
+        run_scenario(parser_args)
+        return
+
+    from fixtures import cookiepedia_server, fake_site
+    site = fake_site.serve_in_background(pages=parser_args.pages, fan_out=parser_args.fan_out,
+                                         cookies_per_page=parser_args.cookies_per_page, latency=parser_args.latency)
+    cookiepedia = cookiepedia_server.serve_in_background()
+    results = {'commit': current_commit(), 'date': datetime.datetime.now().isoformat(),
+               'python': platform.python_version(),
+               'params': {name: getattr(parser_args, name) for name in
+                          ['pages', 'fan_out', 'cookies_per_page', 'latency', 'workers', 'page_load']},
+               'scenarios': {}}
+    with tempfile.TemporaryDirectory(prefix='muncher_bench_') as work_dir:
+        for scenario in parser_args.scenarios:
+            result = spawn_scenario(scenario, parser_args, site, cookiepedia, work_dir, parser_args.repeat)
+            results['scenarios'][scenario] = result
+            if 'error' in result:
+                print("{:<10} failed: {}".format(scenario, result['error']))
+            else:
+                print("{:<10}{:>9.3f}s{:>12.1f} {}".format(scenario, result['seconds'], result[THROUGHPUT[scenario]],
+                                                         THROUGHPUT[scenario].replace('_per_', '/')))
+    site.shutdown()
+    cookiepedia.shutdown()
+    if not os.path.exists(RESULTS_FOLDER):
+        os.makedirs(RESULTS_FOLDER)
+    results_path = os.path.join(RESULTS_FOLDER, '{}.json'.format(results['commit']))
+    with open(results_path, 'w') as results_file:
+        json.dump(results, results_file, indent=2)
+    print("saved the results to {}".format(results_path))
+    if parser_args.compare:
+        compare(results, parser_args.compare)
+
+
+if __name__ == '__main__':
+    main()
@@ -0,0 +1,249 @@
+"""
+A pool of headless browser workers that extract the cookies of urls concurrently.
+Every worker owns its own driver, the results are handed back to a single consumer so the db session is never shared
+between threads.
+"""
+import logging
+import queue
+import threading
+
+from selenium.common.exceptions import WebDriverException
+
+import metrics
+
+DEFAULT_WORKERS = 1
+DEFAULT_MAX_RETRIES = 2
+DEFAULT_MAX_PAGES = 200
+DEFAULT_MAX_MEMORY_MB = 500
+# The amount of seconds between the checks whether the pool was stopped while the task queue is full.
+TASK_PUT_TIMEOUT = 0.1
+_DONE = object()
+
+
+def extract_cookies(driver, url):
+    """
+    Loads the url in the browser and returns the cookies it set.
+    :param driver: The headless browser driver.
+    :param url: The url to load.
+    :return: The list of json cookies.
+    """
+    driver.get(url)
+    return driver.get_cookies()
+
+
+def reset_cookies(driver):
+    """
+    Removes the cookies the previous pages set.
+    :param driver: The headless browser driver.
+    """
+    driver.delete_all_cookies()
+
+
+def process_memory_mb(pid):
+    """
+    :param pid: The id of the process.
+    :return: The resident memory of the process in MB, None in case it can't be read (only supported on linux).
+    """
+    try:
+        with open('/proc/{}/status'.format(pid)) as status:
+            for line in status:
+                if line.startswith('VmRSS:'):
+                    return int(line.split()[1]) / 1024
+    except (IOError, ValueError):
+        pass
+    return None
+
+
+class DriverSession(object):
+    """
+    Reuses a single driver for many pages, its cookies are reset between the pages so every page is attributed only
+    the cookies it set. The driver is recycled after max_pages pages or once its memory passes max_memory_mb.
+    """
+
+    def __init__(self, create_driver, reset=reset_cookies, max_pages=DEFAULT_MAX_PAGES,
+                 max_memory_mb=DEFAULT_MAX_MEMORY_MB):
+        """
+        :param create_driver: A callable that creates a new driver.
+        :param reset: A callable that receives a driver and clears the state the previous page left.
+        :param max_pages: The amount of pages loaded by a driver before it is recycled, 0 means never.
+        :param max_memory_mb: The memory of the driver process in MB above which it is recycled, 0 means no limit.
+        """
+        self.create_driver = create_driver
+        self.reset = reset
+        self.max_pages = max_pages
+        self.max_memory_mb = max_memory_mb
+        self.driver = None
+        self.pages = 0
+        self.recycles = 0
+
+    def acquire(self):
+        """
+        :return: A driver without the state of the previous pages.
+        """
+        if self.driver is None:
+            self.driver = self.create_driver()
+            self.pages = 0
+        elif self.pages:
+            self.reset(self.driver)
+        return self.driver
+
+    def release(self):
+        """
+        Counts the loaded page and recycles the driver in case it reached its limits.
+        """
+        self.pages += 1
+        if (self.max_pages and self.pages >= self.max_pages) or self._memory_exceeded():
+            self.recycle()
+
+    def _memory_exceeded(self):
+        if not self.max_memory_mb:
+            return False
+        service = getattr(self.driver, 'service', None)
+        process = getattr(service, 'process', None)
+        memory = process_memory_mb(process.pid) if process else None
+        return memory is not None and memory > self.max_memory_mb
+
+    def recycle(self):
+        """
+        Quits the driver, a new one is created on the next acquire.
+        """
+        if self.driver is not None:
+            self.recycles += 1
+            metrics.increment('driver_recycles')
+        self.quit()
+
+    def quit(self):
+        driver, self.driver = self.driver, None
+        if driver is None:
+            return
+        try:
+            driver.quit()
+        except Exception as e:
+            logging.error("failed closing the browser: {}".format(e))
+
+
+class UrlResult(object):
+    def __init__(self, url_id, url, cookies, error=None):
+        self.url_id = url_id
+        self.url = url
+        self.cookies = cookies
+        self.error = error
+
+
+class BrowserPool(object):
+    def __init__(self, create_driver, workers=DEFAULT_WORKERS, max_retries=DEFAULT_MAX_RETRIES,
+                 extract=extract_cookies, reset=reset_cookies, max_pages=DEFAULT_MAX_PAGES,
+                 max_memory_mb=DEFAULT_MAX_MEMORY_MB):
+        """
+        :param create_driver: A callable that creates a new headless browser driver.
+        :param workers: The amount of browsers working concurrently.
+        :param max_retries: The amount of times a url is retried after its browser crashed.
+        :param extract: A callable that receives a driver and a url and returns the cookies of the url.
+        :param reset: A callable that receives a driver and clears the state the previous page left.
+        :param max_pages: The amount of pages loaded by a browser before it is recycled, 0 means never.
+        :param max_memory_mb: The memory of a browser in MB above which it is recycled, 0 means no limit.
+        """
+        self.create_driver = create_driver
+        self.workers = max(workers, 1)
+        self.max_retries = max_retries
+        self.extract = extract
+        self.reset = reset
+        self.max_pages = max_pages
+        self.max_memory_mb = max_memory_mb
+        self._tasks = None
+        self._results = None
+        self._stop = threading.Event()
+        self._feed_error = None
+
+    def run(self, urls):
+        """
+        Extracts the cookies of all of the urls.
+        In case the consumer stops early (or raises) the remaining urls are skipped and the browsers are quit, an error
+        raised while iterating the urls is raised to the consumer once the results of the fed urls were handed back.
+        :param urls: An iterable of (url id, url) tuples.
+        :return: A generator of UrlResult in the order they were extracted, it should be consumed by a single thread.
+        """
+        # A run that was stopped early may leave tasks and results behind.
+        self._tasks = queue.Queue(maxsize=self.workers * 2)
+        self._results = queue.Queue()
+        self._stop.clear()
+        self._feed_error = None
+        workers = [threading.Thread(target=self._work, name='browser-{}'.format(index), daemon=True)
+                   for index in range(self.workers)]
+        feeder = threading.Thread(target=self._feed, args=(urls,), name='browser-feeder', daemon=True)
+        for thread in workers + [feeder]:
+            thread.start()
+        try:
+            finished_workers = 0
+            while finished_workers < self.workers:
+                result = self._results.get()
+                if result is _DONE:
+                    finished_workers += 1
+                else:
+                    yield result
+        finally:
+            # Stops the feeding and waits for the workers to finish their current page and quit their browsers.
+            self._stop.set()
+            for thread in workers + [feeder]:
+                thread.join()
+        if self._feed_error is not None:
+            raise self._feed_error
+
+    def _feed(self, urls):
+        try:
+            for url_id, url in urls:
+                if not self._put((url_id, url)):
+                    break
+        except Exception as e:
+            logging.error("failed reading the urls: {}".format(e))
+            self._feed_error = e
+        finally:
+            # The workers skip the remaining tasks once stopped, so the sentinels always get through.
+            for _ in range(self.workers):
+                self._tasks.put(_DONE)
+
+    def _put(self, task):
+        """
+        :return: False in case the pool was stopped before the task was queued.
+        """
+        while not self._stop.is_set():
+            try:
+                self._tasks.put(task, timeout=TASK_PUT_TIMEOUT)
+                return True
+            except queue.Full:
+                pass
+        return False
+
+    def _work(self):
+        session = DriverSession(self.create_driver, self.reset, self.max_pages, self.max_memory_mb)
+        try:
+            while True:
+                task = self._tasks.get()
+                if task is _DONE:
+                    break
+                if self._stop.is_set():
+                    continue
+                url_id, url = task
+                for attempt in range(self.max_retries + 1):
+                    try:
+                        with metrics.timer('page_load_seconds'):
+                            result = UrlResult(url_id, url, self.extract(session.acquire(), url))
+                        session.release()
+                        metrics.increment('pages_extracted')
+                        break
+                    except WebDriverException as e:
+                        # The browser might have crashed, restart it before retrying.
+                        logging.error("browser failed on {} (attempt {}): {}".format(url, attempt + 1, e))
+                        metrics.increment('browser_crashes')
+                        session.recycle()
+                        result = UrlResult(url_id, url, [], e)
+                    except Exception as e:
+                        logging.error("failed extracting cookies from {}: {}".format(url, e))
+                        metrics.increment('page_errors')
+                        session.release()
+                        result = UrlResult(url_id, url, [], e)
+                        break
+                self._results.put(result)
+        finally:
+            session.quit()
+            self._results.put(_DONE)
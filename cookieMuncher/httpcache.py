@@ -0,0 +1,217 @@
+"""
+An on disk http cache for the re-scans of the same domains, the "http_cache" section of the config json.
+The responses are stored per domain and revalidated with ETag / Last-Modified (RFC2616Policy), so an unchanged page
+costs a conditional request instead of a full download while its url is still saved for the new schedule.
+The size of the cache is capped, the least recently used responses are evicted first. The cached responses and their
+sizes are tracked in a journal file of the cache, so opening the cache doesn't walk all of its folders.
+"""
+import logging
+import os
+import pickle
+import shutil
+import time
+from collections import OrderedDict
+from urllib.parse import urlparse
+
+from scrapy.http import Headers
+from scrapy.responsetypes import responsetypes
+from w3lib.http import headers_dict_to_raw, headers_raw_to_dict
+
+try:
+    from scrapy.utils.request import request_fingerprint
+except ImportError:
+    # Removed by the scrapy versions whose crawlers have a request fingerprinter.
+    request_fingerprint = None
+
+MAX_SIZE = 'HTTPCACHE_MAX_SIZE'
+
+DEFAULT_CACHE_DIR = 'httpcache'
+JOURNAL = 'journal'
+# The files of a cached response, named as the ones of the scrapy FilesystemCacheStorage.
+META_FILE = 'pickled_meta'
+HEADERS_FILE = 'response_headers'
+BODY_FILE = 'response_body'
+DEFAULT_MAX_SIZE_MB = 1024
+POLICIES = {
+    'rfc2616': 'scrapy.extensions.httpcache.RFC2616Policy',
+    'dummy': 'scrapy.extensions.httpcache.DummyPolicy',
+}
+DEFAULT_POLICY = 'rfc2616'
+# Server errors aren't cached so the next scan retries them.
+IGNORE_HTTP_CODES = [500, 502, 503, 504]
+
+logger = logging.getLogger(__name__)
+
+
+def cache_settings(params=None):
+    """
+    Validates the http cache section of the config and translates it to scrapy settings.
+    :param params: The http_cache section of the config json, may be None. Its params are enabled, dir, max_size_mb,
+    policy (rfc2616 or dummy) and expiration_secs.
+    :return: The scrapy settings of the cache, empty in case the cache isn't enabled.
+    """
+    params = dict(params.items()) if params else {}
+    if not params.get('enabled', False):
+        return {}
+    policy = params.get('policy', DEFAULT_POLICY)
+    if policy not in POLICIES:
+        raise ValueError("Unknown http cache policy {}, should be one of {}".format(policy, ', '.join(POLICIES)))
+    max_size_mb = params.get('max_size_mb', DEFAULT_MAX_SIZE_MB)
+    if not isinstance(max_size_mb, (int, float)) or max_size_mb < 0:
+        raise ValueError("The http cache max_size_mb should be a positive number, got {!r}".format(max_size_mb))
+    return {
+        'HTTPCACHE_ENABLED': True,
+        # Relative paths would be resolved against the .scrapy folder of the project.
+        'HTTPCACHE_DIR': os.path.abspath(params.get('dir', DEFAULT_CACHE_DIR)),
+        'HTTPCACHE_POLICY': POLICIES[policy],
+        'HTTPCACHE_STORAGE': 'cookieMuncher.httpcache.DomainCacheStorage',
+        'HTTPCACHE_EXPIRATION_SECS': params.get('expiration_secs', 0),
+        'HTTPCACHE_IGNORE_HTTP_CODES': IGNORE_HTTP_CODES,
+        MAX_SIZE: int(max_size_mb * 1024 * 1024),
+    }
+
+
+def entry_size(path):
+    """
+    :param path: The folder of a cached response.
+    :return: The amount of bytes the files of the response take.
+    """
+    return sum(entry.stat().st_size for entry in os.scandir(path) if entry.is_file())
+
+
+def create_fingerprint(spider):
+    """
+    :param spider: The spider of the crawl.
+    :return: A function that returns the hex fingerprint of a request, the one scrapy uses for the crawl.
+    """
+    fingerprinter = getattr(getattr(spider, 'crawler', None), 'request_fingerprinter', None)
+    if fingerprinter is not None:
+        return lambda request: fingerprinter.fingerprint(request).hex()
+    return request_fingerprint
+
+
+class DomainCacheStorage(object):
+    """
+    Stores the responses of every domain in its own folder and keeps the total size of the cache under
+    HTTPCACHE_MAX_SIZE bytes (0 means unlimited) by evicting the least recently used responses.
+    Implements the public cache storage interface of scrapy, the responses are kept in the files of the scrapy
+    FilesystemCacheStorage.
+    """
+
+    def __init__(self, settings):
+        self.cachedir = settings['HTTPCACHE_DIR']
+        self.expiration_secs = settings.getint('HTTPCACHE_EXPIRATION_SECS')
+        self.max_size = settings.getint(MAX_SIZE, 0)
+        self.size = 0
+        # The folders of the cached responses relative to the folder of the spider and their sizes, from the least to
+        # the most recently used.
+        self.entries = OrderedDict()
+        self.spider_dir = None
+        self.journal = None
+        self.fingerprint = None
+
+    def open_spider(self, spider):
+        logger.debug("using the http cache in %s", self.cachedir)
+        self.fingerprint = create_fingerprint(spider)
+        self.spider_dir = os.path.join(self.cachedir, spider.name)
+        os.makedirs(self.spider_dir, exist_ok=True)
+        self.entries = self._read_journal()
+        self.size = sum(self.entries.values())
+        self._write_journal()
+        self.journal = open(os.path.join(self.spider_dir, JOURNAL), 'a', buffering=1)
+        self._evict()
+
+    def close_spider(self, spider):
+        self.journal.close()
+        self._write_journal()
+
+    def retrieve_response(self, spider, request):
+        path = self._request_path(request)
+        metapath = os.path.join(self.spider_dir, path, META_FILE)
+        if not os.path.exists(metapath):
+            return None
+        mtime = os.stat(metapath).st_mtime
+        if 0 < self.expiration_secs < time.time() - mtime:
+            return None
+        with open(metapath, 'rb') as f:
+            meta = pickle.load(f)
+        with open(os.path.join(self.spider_dir, path, HEADERS_FILE), 'rb') as f:
+            headers = Headers(headers_raw_to_dict(f.read()))
+        with open(os.path.join(self.spider_dir, path, BODY_FILE), 'rb') as f:
+            body = f.read()
+        # Only the access time is updated, the modification time is used for the expiration.
+        os.utime(metapath, (time.time(), mtime))
+        if path in self.entries:
+            self.entries.move_to_end(path)
+            self._log(path, self.entries[path])
+        url = meta.get('response_url')
+        response_class = responsetypes.from_args(headers=headers, url=url, body=body)
+        return response_class(url=url, headers=headers, status=meta['status'], body=body)
+
+    def store_response(self, spider, request, response):
+        path = self._request_path(request)
+        rpath = os.path.join(self.spider_dir, path)
+        os.makedirs(rpath, exist_ok=True)
+        meta = {'url': request.url, 'method': request.method, 'status': response.status,
+                'response_url': response.url, 'timestamp': time.time()}
+        with open(os.path.join(rpath, META_FILE), 'wb') as f:
+            pickle.dump(meta, f, protocol=2)
+        with open(os.path.join(rpath, HEADERS_FILE), 'wb') as f:
+            f.write(headers_dict_to_raw(response.headers))
+        with open(os.path.join(rpath, BODY_FILE), 'wb') as f:
+            f.write(response.body)
+        self.size -= self.entries.pop(path, 0)
+        self.entries[path] = entry_size(rpath)
+        self.size += self.entries[path]
+        self._log(path, self.entries[path])
+        self._evict()
+
+    def _request_path(self, request):
+        """
+        :return: The folder of the cached response of the request, relative to the folder of the spider.
+        """
+        key = self.fingerprint(request)
+        return os.path.join(urlparse(request.url).netloc or '_', key[0:2], key)
+
+    def _evict(self):
+        while self.max_size and self.size > self.max_size and len(self.entries) > 1:
+            path, size = self.entries.popitem(last=False)
+            shutil.rmtree(os.path.join(self.spider_dir, path), ignore_errors=True)
+            self.size -= size
+            self._log(path, -1)
+            logger.debug("evicted %s from the http cache", path)
+
+    def _log(self, path, size):
+        """
+        Appends a use of a cached response to the journal, a negative size means the response was evicted.
+        """
+        self.journal.write('{} {}\n'.format(size, path))
+
+    def _read_journal(self):
+        """
+        :return: The cached responses and their sizes from the least to the most recently used, replayed from the
+        journal of the cache.
+        """
+        entries = OrderedDict()
+        journal_path = os.path.join(self.spider_dir, JOURNAL)
+        if not os.path.exists(journal_path):
+            return entries
+        with open(journal_path) as journal:
+            for line in journal:
+                size, _, path = line.rstrip('\n').partition(' ')
+                if not path or not size.lstrip('-').isdigit():
+                    # The last line of a crawl that was killed while writing it.
+                    continue
+                entries.pop(path, None)
+                if int(size) >= 0:
+                    entries[path] = int(size)
+        return entries
+
+    def _write_journal(self):
+        """
+        Compacts the journal to a single line for every cached response.
+        """
+        journal_path = os.path.join(self.spider_dir, JOURNAL)
+        with open(journal_path + '.tmp', 'w') as journal:
+            journal.writelines('{} {}\n'.format(size, path) for path, size in self.entries.items())
+        os.replace(journal_path + '.tmp', journal_path)
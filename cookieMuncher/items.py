@@ -14,3 +14,4 @@ class CookieMuncherItem(scrapy.Item):
     # name = scrapy.Field()
     time = Field()
     link = Field()
+    content_hash = Field()
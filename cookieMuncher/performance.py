@@ -0,0 +1,96 @@
+"""
+The performance profile of a crawl, the "performance" section of the config json.
+The profile is validated and translated to the matching scrapy settings, AutoThrottle adapts the delay of every domain
+to its latency so fast sites are crawled at full speed while slow sites aren't hammered into timeouts.
+"""
+
+# The params of the profile, the scrapy setting each one controls, its type and its minimal value.
+PROFILE_PARAMS = {
+    'concurrent_requests': ('CONCURRENT_REQUESTS', int, 1),
+    'concurrent_requests_per_domain': ('CONCURRENT_REQUESTS_PER_DOMAIN', int, 1),
+    'autothrottle': ('AUTOTHROTTLE_ENABLED', bool, None),
+    'autothrottle_start_delay': ('AUTOTHROTTLE_START_DELAY', float, 0),
+    'autothrottle_max_delay': ('AUTOTHROTTLE_MAX_DELAY', float, 0),
+    'autothrottle_target_concurrency': ('AUTOTHROTTLE_TARGET_CONCURRENCY', float, 0.1),
+    'download_timeout': ('DOWNLOAD_TIMEOUT', float, 1),
+    'retry_times': ('RETRY_TIMES', int, 0),
+    # Only used by the crawl of a single schedule, the dns cache belongs to the process.
+    'dns_cache_size': ('DNSCACHE_SIZE', int, 0),
+}
+
+DEFAULT_PROFILE = {
+    'concurrent_requests': 32,
+    'concurrent_requests_per_domain': 8,
+    'autothrottle': True,
+    'autothrottle_start_delay': 1.0,
+    'autothrottle_max_delay': 30.0,
+    'autothrottle_target_concurrency': 4.0,
+    'download_timeout': 30.0,
+    'retry_times': 2,
+    'dns_cache_size': 10000,
+}
+
+# The profile of the configs created before the performance section existed, the scrapy defaults they were crawled with.
+LEGACY_PROFILE = {
+    'concurrent_requests': 16,
+    'concurrent_requests_per_domain': 8,
+    'autothrottle': False,
+    'autothrottle_start_delay': 5.0,
+    'autothrottle_max_delay': 60.0,
+    'autothrottle_target_concurrency': 1.0,
+    'download_timeout': 180.0,
+    'retry_times': 2,
+    'dns_cache_size': 10000,
+}
+
+
+def validate_value(name, value):
+    """
+    :param name: The name of the profile param.
+    :param value: The value of the param from the config.
+    :return: The value converted to the type of the param.
+    """
+    _, param_type, minimum = PROFILE_PARAMS[name]
+    if param_type is bool:
+        if not isinstance(value, bool):
+            raise ValueError("The performance param {} should be true or false, got {!r}".format(name, value))
+        return value
+    if isinstance(value, bool) or not isinstance(value, (int, float)) or \
+            (param_type is int and not float(value).is_integer()):
+        raise ValueError("The performance param {} should be of type {}, got {!r}".format(name, param_type.__name__,
+                                                                                          value))
+    if value < minimum:
+        raise ValueError("The performance param {} should be at least {}, got {!r}".format(name, minimum, value))
+    return param_type(value)
+
+
+def create_profile(params=None, defaults=DEFAULT_PROFILE):
+    """
+    Validates the performance section of the config, missing params get their default value.
+    :param params: The performance section of the config json, may be None.
+    :param defaults: The profile the missing params are taken from.
+    :return: The full profile.
+    """
+    params = dict(params.items()) if params else {}
+    unknown = set(params) - set(PROFILE_PARAMS)
+    if unknown:
+        raise ValueError("Unknown performance params: {}".format(', '.join(sorted(unknown))))
+    profile = dict(defaults)
+    profile.update({name: validate_value(name, value) for name, value in params.items()})
+    if profile['autothrottle_start_delay'] > profile['autothrottle_max_delay']:
+        raise ValueError("The performance param autothrottle_start_delay can't be above autothrottle_max_delay")
+    if profile['autothrottle_target_concurrency'] > profile['concurrent_requests_per_domain']:
+        raise ValueError("The performance param autothrottle_target_concurrency can't be above "
+                         "concurrent_requests_per_domain")
+    if profile['concurrent_requests_per_domain'] > profile['concurrent_requests']:
+        raise ValueError("The performance param concurrent_requests_per_domain can't be above concurrent_requests")
+    return profile
+
+
+def profile_settings(params=None, defaults=DEFAULT_PROFILE):
+    """
+    :param params: The performance section of the config json, may be None.
+    :param defaults: The profile the missing params are taken from.
+    :return: The scrapy settings of the validated profile.
+    """
+    return {PROFILE_PARAMS[name][0]: value for name, value in create_profile(params, defaults).items()}
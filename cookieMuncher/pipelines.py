@@ -4,21 +4,166 @@
 #
 # Don't forget to add your pipeline to the ITEM_PIPELINES setting
 # See: http://doc.scrapy.org/en/latest/topics/item-pipeline.html
+import logging
+import queue
+import time
+
+from sqlalchemy import func
 from sqlalchemy.orm import Session
+from twisted.internet import defer, reactor, task
 
-from db import engine, UrlScans
+import db
+import metrics
+from utils import fingerprint_url
 
 SCHEDULE_ID = 'schedule_id'
+BATCH_SIZE = 'PIPELINE_BATCH_SIZE'
+FLUSH_INTERVAL = 'PIPELINE_FLUSH_INTERVAL'
+PRINT_ITEMS = 'PIPELINE_PRINT_ITEMS'
+RESUME = 'RESUME_CRAWL'
+
+DEFAULT_BATCH_SIZE = 100
+DEFAULT_FLUSH_INTERVAL = 5
+QUEUE_RETRY_DELAY = 0.1
+
 
 class CookiemuncherPipeline(object):
-    def __init__(self):
-        self.session = Session(engine)
+    """
+    Buffers the crawled urls and saves them to the db with a single multi-row insert once the buffer
+    reaches the batch size or the flush interval passes.
+    When a url queue is given the saved urls are also fed to it as (id, url) tuples, followed by None once the
+    crawl ends, the queue is the url_queue attribute of the spider. While the queue is full the items wait, which
+    slows down the crawler.
+    """
 
-    def process_item(self, item, spider):
-        self.session.add(UrlScans(schedule_id=spider.settings.get(SCHEDULE_ID), url=item['link']))
+    def __init__(self, batch_size=DEFAULT_BATCH_SIZE, flush_interval=DEFAULT_FLUSH_INTERVAL, print_items=True,
+                 resume=False):
+        self.session = Session(db.engine)
+        self.batch_size = max(batch_size, 1)
+        self.flush_interval = flush_interval
+        self.print_items = print_items
+        self.resume = resume
+        self.saved_urls = set()
+        self.url_queue = None
+        self.schedule_id = None
+        self.metrics = metrics.REGISTRY
+        self.last_queued_id = 0
+        self.buffer = []
+        self.last_flush = time.time()
+        self._flush_loop = None
+
+    @classmethod
+    def from_crawler(cls, crawler):
+        settings = crawler.settings
+        return cls(batch_size=settings.getint(BATCH_SIZE, DEFAULT_BATCH_SIZE),
+                   flush_interval=settings.getfloat(FLUSH_INTERVAL, DEFAULT_FLUSH_INTERVAL),
+                   print_items=settings.getbool(PRINT_ITEMS, True),
+                   resume=settings.getbool(RESUME, False))
+
+    def open_spider(self, spider):
+        self.schedule_id = spider.settings.get(SCHEDULE_ID)
+        # Passed to the spider since the settings are deep copied and a queue can't be.
+        self.url_queue = getattr(spider, 'url_queue', None)
+        self.metrics = metrics.schedule_registry(self.schedule_id)
+        if self.resume:
+            # The urls that were saved before the crawl stopped aren't saved again.
+            self.saved_urls = {url for url, in self.session.query(db.UrlScans.url).filter(
+                db.UrlScans.schedule_id == self.schedule_id)}
+        if self.url_queue is not None:
+            # Only the urls saved from now on are fed to the queue.
+            self.last_queued_id = self.session.query(func.max(db.UrlScans.id)).filter(
+                db.UrlScans.schedule_id == self.schedule_id).scalar() or 0
+        # Returns the connection to the pool, several crawls may share a single process.
         self.session.commit()
-        print('saved {} to the db!'.format(item['link']))
+        if self.flush_interval > 0:
+            # Makes sure the buffer is flushed even when the crawler is idle.
+            self._flush_loop = task.LoopingCall(self._flush_if_expired)
+            self._flush_loop.start(self.flush_interval, now=False)
+
+    def process_item(self, item, spider):
+        if self.resume:
+            if item['link'] in self.saved_urls:
+                return item
+            self.saved_urls.add(item['link'])
+        self.buffer.append({'schedule_id': self.schedule_id, 'url': item['link'],
+                            'url_hash': fingerprint_url(item['link']), 'content_hash': item.get('content_hash')})
+        if self.print_items:
+            print('buffered {} for the db!'.format(item['link']))
+        if len(self.buffer) >= self.batch_size:
+            queued = self.flush()
+        else:
+            queued = self._flush_if_expired()
+        if queued is not None:
+            return queued.addCallback(lambda _: item)
         return item
 
+    def flush(self):
+        """
+        Saves all of the buffered urls to the db with a single multi-row insert, in case it fails the urls are kept
+        in the buffer and saved by the next flush.
+        :return: A deferred that fires once the saved urls were fed to the url queue, None if there is no queue.
+        """
+        self.last_flush = time.time()
+        if not self.buffer:
+            return None
+        rows, self.buffer = self.buffer, []
+        try:
+            with self.metrics.timer('db_flush_seconds'):
+                self.session.execute(db.UrlScans.__table__.insert().values(rows))
+                self.session.commit()
+        except Exception as e:
+            self.session.rollback()
+            self.buffer = rows + self.buffer
+            logging.error("failed saving {} urls to the db, retrying with the next flush: {}".format(len(rows), e))
+            return None
+        self.metrics.increment('urls_saved', len(rows))
+        if self.print_items:
+            print('saved {} urls to the db!'.format(len(rows)))
+        if self.url_queue is None:
+            return None
+        saved = self.session.query(db.UrlScans.id, db.UrlScans.url) \
+            .filter(db.UrlScans.schedule_id == self.schedule_id, db.UrlScans.id > self.last_queued_id) \
+            .order_by(db.UrlScans.id).all()
+        self.session.commit()
+        if saved:
+            self.last_queued_id = saved[-1].id
+        return self._enqueue([(row.id, row.url) for row in saved])
+
+    def _enqueue(self, entries):
+        """
+        Feeds the entries to the url queue without blocking the reactor, while the queue is full it is retried later.
+        :return: A deferred that fires once all of the entries are in the queue.
+        """
+        done = defer.Deferred()
+        entries = list(entries)
+
+        def put():
+            while entries:
+                try:
+                    self.url_queue.put_nowait(entries[0])
+                except queue.Full:
+                    self.metrics.increment('url_queue_full')
+                    reactor.callLater(QUEUE_RETRY_DELAY, put)
+                    return
+                entries.pop(0)
+            done.callback(None)
+
+        put()
+        return done
+
+    def _flush_if_expired(self):
+        if self.flush_interval > 0 and time.time() - self.last_flush >= self.flush_interval:
+            return self.flush()
+        return None
+
     def close_spider(self, spider):
+        if self._flush_loop and self._flush_loop.running:
+            self._flush_loop.stop()
+        queued = self.flush()
+        if self.buffer:
+            logging.error("dropped {} urls that couldn't be saved to the db".format(len(self.buffer)))
         self.session.close()
+        if self.url_queue is not None:
+            # Lets the consumer know that there are no more urls.
+            queued = (queued or defer.succeed(None)).addCallback(lambda _: self._enqueue([None]))
+        return queued
@@ -1,15 +1,28 @@
+import logging
 from urllib.parse import urlparse
 
 from scrapy.spiders import CrawlSpider, Rule
 from scrapy.linkextractors import LinkExtractor
-from scrapy.crawler import CrawlerProcess
+from scrapy.crawler import Crawler, CrawlerProcess, CrawlerRunner
+from scrapy.settings import default_settings
+from scrapy.utils.log import configure_logging
+from twisted.internet import defer, reactor
 from datetime import datetime as dt
+import hashlib
 import random
 
 from sqlalchemy.orm import Session
 
 from cookieMuncher.items import CookieMuncherItem
-from db import engine, MuncherStats
+from cookieMuncher.performance import profile_settings
+from cookieMuncher.pipelines import BATCH_SIZE, FLUSH_INTERVAL, PRINT_ITEMS, RESUME, \
+    DEFAULT_BATCH_SIZE, DEFAULT_FLUSH_INTERVAL
+import db
+import metrics
+from host_matcher import HostMatcher
+from stats_accumulator import StatsAccumulator, DEFAULT_STATS_FLUSH_INTERVAL
+
+STATS_FLUSH_INTERVAL = 'STATS_FLUSH_INTERVAL'
 
 USER_AGENTS = [
     'Mozilla/5.0 (Windows NT 6.1) AppleWebKit/537.36 (KHTML, like Gecko) Chrome/41.0.2228.0 Safari/537.36',
@@ -28,54 +41,155 @@ class CookieMuncherSpider(CrawlSpider):
              callback="parse_item",
              follow=True),)
 
-    def __init__(self, start_urls, allowed_domains, schedule_id, *args, **kwargs):
+    def __init__(self, start_urls, allowed_domains, schedule_id, resume=False, url_queue=None, *args, **kwargs):
         super(CookieMuncherSpider, self).__init__(*args, **kwargs)
+        # Read by the pipeline, which feeds the saved urls to it.
+        self.url_queue = url_queue
         self.allowed_domains = allowed_domains
         self.start_urls = start_urls
         self.start_domains = [urlparse(url).netloc for url in start_urls]
-        self.crawled_internal_urls = 0
-        self.crawled_external_urls = 0
-        self.session = Session(engine)
-        self.stats = self.session.query(MuncherStats).filter(MuncherStats.schedule_id == schedule_id).scalar()
+        self.host_matcher = HostMatcher(self.start_domains)
+        initial = {'urls_scanned_fp': 0, 'urls_scanned_tp': 0}
+        if resume:
+            # A resumed crawl continues counting from where the previous run stopped.
+            session = Session(db.engine)
+            stats = session.query(db.MuncherStats).filter(db.MuncherStats.schedule_id == schedule_id).scalar()
+            initial = {'urls_scanned_fp': stats.urls_scanned_fp or 0, 'urls_scanned_tp': stats.urls_scanned_tp or 0}
+            session.close()
+        # The counters are written to the stats periodically, the interval is set by from_crawler().
+        self.progress = StatsAccumulator(schedule_id, initial=initial)
+        self.metrics = metrics.schedule_registry(schedule_id)
+
+    @classmethod
+    def from_crawler(cls, crawler, *args, **kwargs):
+        spider = super(CookieMuncherSpider, cls).from_crawler(crawler, *args, **kwargs)
+        spider.progress.interval = crawler.settings.getfloat(STATS_FLUSH_INTERVAL, DEFAULT_STATS_FLUSH_INTERVAL)
+        return spider
 
     def close(spider, reason):
-        spider.stats.urls_scanned_fp = spider.crawled_internal_urls
-        spider.stats.urls_scanned_tp = spider.crawled_external_urls
-        spider.stats.url_last_result = reason
-        spider.session.commit()
-        spider.session.close()
+        spider.progress.set('url_last_result', reason)
+        spider.progress.flush()
 
     def parse_item(self, response):
-        if any([domain in response.url for domain in self.start_domains]):
-            self.crawled_internal_urls += 1
+        if self.host_matcher.matches(response.url):
+            self.progress.increment('urls_scanned_fp')
+            self.metrics.increment('crawl_internal_pages')
         else:
-            self.crawled_external_urls += 1
+            self.progress.increment('urls_scanned_tp')
+            self.metrics.increment('crawl_external_pages')
+        if 'download_latency' in response.meta:
+            self.metrics.observe('crawl_download_seconds', response.meta['download_latency'])
         item = CookieMuncherItem()
         item['link'] = response.url
         item['time'] = dt.now()
+        item['content_hash'] = hashlib.sha1(response.body).hexdigest()
         return item
 
 
-def crawl(schedule_id, urls, allowed_domains, depth, silent, log_file, delay, user_agent):
+def build_settings(schedule_id, depth, delay, user_agent, batch_size=DEFAULT_BATCH_SIZE,
+                   flush_interval=DEFAULT_FLUSH_INTERVAL, print_items=True, job_dir=None, resume=False,
+                   crawl_settings=None, stats_interval=DEFAULT_STATS_FLUSH_INTERVAL):
     """
-    Start crawling with CookieMuncher spider.
-    :param urls: The list of urls from which the crawlers should start crawling
-    :param allowed_domains: The list of allowed domains, if empty list is passed all of the domains are allowed.
-    :param depth: The depth the crawler should crawl to.
-    :param silent: If True the crawler wont write any logs
-    :param log_file: The path to the log file.
+    Creates the scrapy settings of the crawl of a single schedule, see crawl() for the meaning of the arguments. The
+    logging isn't part of them since it is configured once for the whole process, and the url queue is passed to the
+    spider since the settings are deep copied.
+    :return: The settings dict.
     """
-    process = CrawlerProcess({
+    settings = dict(profile_settings() if crawl_settings is None else crawl_settings)
+    settings.update({
         'USER_AGENT': user_agent if user_agent else random.choice(USER_AGENTS),
         'DEPTH_LIMIT': depth,
-        'LOG_ENABLED': not silent,
-        'LOG_FILE': log_file,
         'DOWNLOAD_DELAY': delay,
         'COOKIES_ENABLED': False,
         'ITEM_PIPELINES': {
             'cookieMuncher.pipelines.CookiemuncherPipeline': 300
         },
+        BATCH_SIZE: batch_size,
+        FLUSH_INTERVAL: flush_interval,
+        PRINT_ITEMS: print_items,
+        RESUME: resume,
+        'JOBDIR': job_dir,
+        STATS_FLUSH_INTERVAL: stats_interval,
         'schedule_id': schedule_id
     })
-    process.crawl(CookieMuncherSpider, urls, allowed_domains, schedule_id)
+    return settings
+
+
+def crawl(schedule_id, urls, allowed_domains, depth, silent, log_file, delay, user_agent,
+          batch_size=DEFAULT_BATCH_SIZE, flush_interval=DEFAULT_FLUSH_INTERVAL, print_items=True, job_dir=None,
+          resume=False, url_queue=None, crawl_settings=None, stats_interval=DEFAULT_STATS_FLUSH_INTERVAL):
+    """
+    Start crawling with CookieMuncher spider.
+    :param urls: The list of urls from which the crawlers should start crawling
+    :param allowed_domains: The list of allowed domains, if empty list is passed all of the domains are allowed.
+    :param depth: The depth the crawler should crawl to.
+    :param silent: If True the crawler wont write any logs
+    :param log_file: The path to the log file.
+    :param batch_size: The amount of urls the pipeline buffers before saving them to the db.
+    :param flush_interval: The maximal amount of seconds the urls are kept in the buffer.
+    :param print_items: If True the pipeline prints every url it handles.
+    :param job_dir: The folder in which the state of the crawl is persisted, a crawl that was stopped can be resumed
+    from it. If None the state isn't persisted.
+    :param resume: If True continues a previous crawl of this schedule instead of starting a new one.
+    :param queue.Queue url_queue: If given the (id, url) of every saved url is fed to it, followed by None once the
+    crawl ends. The crawl slows down while the queue is full.
+    :param crawl_settings: The scrapy settings of the performance profile, if None the default profile is used.
+    :param stats_interval: The minimal amount of seconds between the writes of the crawl counters to the stats.
+    """
+    settings = build_settings(schedule_id, depth, delay, user_agent, batch_size=batch_size,
+                              flush_interval=flush_interval, print_items=print_items, job_dir=job_dir, resume=resume,
+                              crawl_settings=crawl_settings, stats_interval=stats_interval)
+    settings.update({'LOG_ENABLED': not silent, 'LOG_FILE': log_file})
+    process = CrawlerProcess(settings)
+    process.crawl(CookieMuncherSpider, urls, allowed_domains, schedule_id, resume=resume, url_queue=url_queue)
     process.start()  # the script will block here until the crawling is finished
+
+
+def configure_runner_logging(silent, log_file):
+    """
+    Configures the logging of all of the crawlers of a runner at once. The handler isn't installed as the scrapy root
+    handler, since every new crawler replaces that handler with one created from its own settings.
+    :param silent: If True the crawlers wont write any logs.
+    :param log_file: The path to the log file, if None the logs are written to stderr.
+    """
+    configure_logging(install_root_handler=False)
+    if silent:
+        handler = logging.NullHandler()
+    elif log_file:
+        handler = logging.FileHandler(log_file, encoding=default_settings.LOG_ENCODING)
+    else:
+        handler = logging.StreamHandler()
+    handler.setFormatter(logging.Formatter(fmt=default_settings.LOG_FORMAT, datefmt=default_settings.LOG_DATEFORMAT))
+    handler.setLevel(default_settings.LOG_LEVEL)
+    logging.root.setLevel(logging.NOTSET)
+    logging.root.addHandler(handler)
+
+
+def crawl_many(crawls, silent=False, log_file=None, max_concurrent=None):
+    """
+    Crawls several schedules at the same time in a single reactor, every schedule gets its own crawler with its own
+    settings, spider and stats. The script will block until all of the crawls are finished.
+    :param crawls: A list of dicts of the keyword arguments of crawl(), one for each schedule.
+    :param silent: If True the crawlers wont write any logs.
+    :param log_file: The path to the log file shared by all of the crawls, the logging of a process is global so the
+    silent and log_file of the crawls are ignored.
+    :param max_concurrent: The maximal amount of crawls running at the same time, if None all of them run at once.
+    """
+    configure_runner_logging(silent, log_file)
+    runner = CrawlerRunner()
+    semaphore = defer.DeferredSemaphore(max_concurrent or max(len(crawls), 1))
+    finished = []
+    for arguments in crawls:
+        arguments = dict(arguments)
+        schedule_id = arguments.pop('schedule_id')
+        urls = arguments.pop('urls')
+        allowed_domains = arguments.pop('allowed_domains')
+        arguments.pop('silent', None)
+        arguments.pop('log_file', None)
+        url_queue = arguments.pop('url_queue', None)
+        crawler = Crawler(CookieMuncherSpider, build_settings(schedule_id, **arguments))
+        finished.append(semaphore.run(runner.crawl, crawler, urls, allowed_domains, schedule_id,
+                                      resume=arguments.get('resume', False), url_queue=url_queue))
+    # A failed crawl doesn't stop the others.
+    defer.DeferredList(finished, consumeErrors=True).addBoth(lambda _: reactor.stop())
+    reactor.run()  # the script will block here until all of the crawls are finished
@@ -0,0 +1,118 @@
+"""
+An in-process cache of the cookie info ids, so the cookiepedia information of a cookie name is looked up in the db
+only once per run (or once per ttl) instead of once per extracted cookie.
+"""
+import dbm
+import time
+from collections import OrderedDict
+
+import db
+
+DEFAULT_MAX_SIZE = 100000
+DEFAULT_TTL = 24 * 60 * 60
+
+
+class DbmStore(object):
+    """
+    Persists the cache entries on the disk so the warm state survives between runs.
+    """
+
+    def __init__(self, path):
+        self.path = path
+        self._db = dbm.open(path, 'c')
+
+    def load(self):
+        """
+        :return: A list of (cookie name, cookie info id, time the entry was stored) tuples.
+        """
+        entries = []
+        for key in self._db.keys():
+            cookie_info_id, stored_at = self._db[key].decode().split(':')
+            entries.append((key.decode(), int(cookie_info_id), float(stored_at)))
+        return entries
+
+    def set(self, name, cookie_info_id, stored_at):
+        self._db[name.encode()] = '{}:{}'.format(cookie_info_id, stored_at).encode()
+
+    def close(self):
+        self._db.close()
+
+
+class CookieInfoCache(object):
+    """
+    A LRU cache with a ttl that maps cookie names to the id of their cookie info in the db.
+    """
+
+    def __init__(self, max_size=DEFAULT_MAX_SIZE, ttl=DEFAULT_TTL, store=None):
+        """
+        :param max_size: The maximal amount of cookie names kept in memory.
+        :param ttl: The amount of seconds an entry is valid, after that it is looked up in the db again.
+        :param DbmStore store: An optional on disk store for the entries.
+        """
+        self.max_size = max_size
+        self.ttl = ttl
+        self.store = store
+        self.hits = 0
+        self.misses = 0
+        self._entries = OrderedDict()
+
+    def warm(self, session):
+        """
+        Loads the entries from the disk store, in case it is empty loads all of the cookie infos from the db.
+        :param Session session: The session with the mysql db.
+        """
+        now = time.time()
+        entries = self.store.load() if self.store else []
+        if not entries:
+            entries = [(name, cookie_info_id, now) for name, cookie_info_id in
+                       session.query(db.CookieInfo.cookie_name, db.CookieInfo.id)]
+            if self.store:
+                for name, cookie_info_id, stored_at in entries:
+                    self.store.set(name, cookie_info_id, stored_at)
+        for name, cookie_info_id, stored_at in sorted(entries, key=lambda entry: entry[2]):
+            if now - stored_at < self.ttl:
+                self._put(name, cookie_info_id, stored_at)
+
+    def get(self, name):
+        """
+        :param name: The name of the cookie.
+        :return: The id of the cookie info or None in case it isn't cached or has expired.
+        """
+        entry = self._entries.get(name)
+        if entry is None or time.time() - entry[1] >= self.ttl:
+            self._entries.pop(name, None)
+            self.misses += 1
+            return None
+        self._entries.move_to_end(name)
+        self.hits += 1
+        return entry[0]
+
+    def set(self, name, cookie_info_id):
+        stored_at = time.time()
+        self._put(name, cookie_info_id, stored_at)
+        if self.store:
+            self.store.set(name, cookie_info_id, stored_at)
+
+    def _put(self, name, cookie_info_id, stored_at):
+        self._entries[name] = (cookie_info_id, stored_at)
+        self._entries.move_to_end(name)
+        while len(self._entries) > self.max_size:
+            self._entries.popitem(last=False)
+
+    def close(self):
+        if self.store:
+            self.store.close()
+
+    def __len__(self):
+        return len(self._entries)
+
+
+def create_cookie_cache(max_size=DEFAULT_MAX_SIZE, ttl=DEFAULT_TTL, store_path=None):
+    """
+    Creates the cookie info cache.
+    :param max_size: The maximal amount of cookie names kept in memory.
+    :param ttl: The amount of seconds an entry is valid.
+    :param store_path: The path of the on disk store, if None the cache is kept only in memory.
+    :return: The configured cache instance.
+    """
+    return CookieInfoCache(max_size=max_size, ttl=ttl, store=DbmStore(store_path) if store_path else None)
@@ -0,0 +1,172 @@
+"""
+A materialized summary of the cookies of a schedule in tblCookie_Summary: every distinct cookie (by purpose and name)
+with the url of the lowest depth it was found in and the amount of urls it was found in. The summary is built once
+after the cookie extraction with a single pass over the extracted cookies, so the reports read a row per distinct
+cookie instead of every extracted cookie, call `python cookie_summary.py -i <id>` to build it for older schedules.
+"""
+import json
+
+from sqlalchemy.orm import Session
+
+from cookiepedia import UNKNOWN_ABOUT, UNKNOWN_PURPOSE
+import db
+from extractor import STREAM_BATCH_SIZE
+from utils import find_depth_of_url, create_parser
+
+SUMMARY_BATCH_SIZE = 500
+
+
+def has_summary_table():
+    """
+    :return: True in case the summary table was created by initial_db.migrate().
+    """
+    return 'CookieSummary' in db.get_models()
+
+
+def clear_summary(session, schedule_id):
+    """
+    Removes the summary of the schedule in the transaction of the session, the reports aggregate the extracted cookies
+    themselves until a new summary is built.
+    :param Session session: The session with the db.
+    :param schedule_id: The id of the schedule.
+    """
+    if has_summary_table():
+        summary_table = db.CookieSummary.__table__
+        session.execute(summary_table.delete().where(summary_table.c.schedule_id == schedule_id))
+
+
+def schedule_cookie_ids(session, schedule_id):
+    """
+    :return: A query of the ids of the cookies extracted in the schedule.
+    """
+    return session.query(db.ExtractedCookies.cookie_id) \
+        .join(db.UrlScans, db.UrlScans.id == db.ExtractedCookies.url_id) \
+        .filter(db.UrlScans.schedule_id == schedule_id)
+
+
+def load_cookie_keys(session, schedule_id, batch_size=STREAM_BATCH_SIZE):
+    """
+    Parses the json of every cookie of the schedule once.
+    :return: A dict from the id of every cookie to its (purpose, name), and a dict from every (purpose, name) to the
+    about of its cookie info.
+    """
+    keys = {}
+    cookie_keys = {}
+    abouts = {}
+    rows = session.query(db.Cookies.id, db.Cookies.cookie_attr, db.CookieInfo.purpose, db.CookieInfo.about) \
+        .outerjoin(db.CookieInfo, db.CookieInfo.id == db.Cookies.cookie_info_id) \
+        .filter(db.Cookies.id.in_(schedule_cookie_ids(session, schedule_id).subquery())) \
+        .execution_options(stream_results=True) \
+        .yield_per(batch_size)
+    for row in rows:
+        key = (row.purpose if row.purpose is not None else UNKNOWN_PURPOSE, json.loads(row.cookie_attr)['name'])
+        # The many cookies of the same purpose and name share a single key.
+        key = keys.setdefault(key, key)
+        cookie_keys[row.id] = key
+        abouts.setdefault(key, row.about if row.about is not None else UNKNOWN_ABOUT)
+    return cookie_keys, abouts
+
+
+def aggregate(links, cookie_keys):
+    """
+    :param links: An iterable of the (url_id, url, cookie_id) of the extracted cookies, ordered by url.
+    :param cookie_keys: A dict from the id of every cookie to its (purpose, name).
+    :return: A dict from every (purpose, name) to its first found url, its depth, the amount of urls it was found in
+    and the id of its first cookie, in the order the cookies were first found.
+    """
+    entries = {}
+    current_url_id = None
+    depth = None
+    for url_id, url, cookie_id in links:
+        if url_id != current_url_id:
+            current_url_id = url_id
+            depth = find_depth_of_url(url)
+        key = cookie_keys[cookie_id]
+        entry = entries.get(key)
+        if entry is None:
+            entries[key] = {'first_found_url': url, 'first_found_depth': depth, 'url_count': 1,
+                            'cookie_id': cookie_id, 'last_url_id': url_id}
+            continue
+        if depth < entry['first_found_depth']:
+            entry['first_found_url'] = url
+            entry['first_found_depth'] = depth
+        if entry['last_url_id'] != url_id:
+            entry['url_count'] += 1
+            entry['last_url_id'] = url_id
+    return entries
+
+
+def summarize_schedule(session, schedule_id, batch_size=STREAM_BATCH_SIZE):
+    """
+    Builds the summary of the cookies of the schedule, replacing its previous summary.
+    :param Session session: The session with the db.
+    :param schedule_id: The id of the schedule.
+    :param batch_size: The amount of rows fetched from the db at once.
+    :return: The amount of distinct cookies in the summary, None in case the summary table doesn't exist.
+    """
+    if not has_summary_table():
+        return None
+    cookie_keys, abouts = load_cookie_keys(session, schedule_id, batch_size)
+    links = session.query(db.UrlScans.id, db.UrlScans.url, db.ExtractedCookies.cookie_id) \
+        .join(db.ExtractedCookies, db.ExtractedCookies.url_id == db.UrlScans.id) \
+        .filter(db.UrlScans.schedule_id == schedule_id) \
+        .order_by(db.UrlScans.id, db.ExtractedCookies.cookie_id) \
+        .execution_options(stream_results=True) \
+        .yield_per(batch_size)
+    entries = aggregate(links, cookie_keys)
+    clear_summary(session, schedule_id)
+    summary_table = db.CookieSummary.__table__
+    items = list(entries.items())
+    for start in range(0, len(items), SUMMARY_BATCH_SIZE):
+        batch = items[start:start + SUMMARY_BATCH_SIZE]
+        cookies = {row.id: row for row in session.query(db.Cookies.id, db.Cookies.cookie_attr, db.Cookies.datetime)
+                   .filter(db.Cookies.id.in_([entry['cookie_id'] for _, entry in batch]))}
+        session.execute(summary_table.insert().values([
+            {'schedule_id': schedule_id, 'purpose': purpose, 'cookie_name': name, 'about': abouts[(purpose, name)],
+             'cookie_attr': cookies[entry['cookie_id']].cookie_attr, 'datetime': cookies[entry['cookie_id']].datetime,
+             'first_found_url': entry['first_found_url'], 'first_found_depth': entry['first_found_depth'],
+             'url_count': entry['url_count']} for (purpose, name), entry in batch]))
+    session.commit()
+    return len(items)
+
+
+def load_summary(session, schedule_id):
+    """
+    :param Session session: The session with the db.
+    :param schedule_id: The id of the schedule.
+    :return: The summary rows of the schedule in the order the cookies were first found, an empty list in case the
+    summary wasn't built.
+    """
+    if not has_summary_table():
+        return []
+    return session.query(db.CookieSummary).filter(db.CookieSummary.schedule_id == schedule_id) \
+        .order_by(db.CookieSummary.id).all()
+
+
+def summary_cookie(row):
+    """
+    Same as enrich_cookie_row but for a summary row.
+    :param row: A row of the summary table.
+    :return: The cookie json.
+    """
+    cookie_json = json.loads(row.cookie_attr)
+    cookie_json['about'] = row.about
+    cookie_json['purpose'] = row.purpose
+    cookie_json['extraction_time'] = row.datetime
+    cookie_json['url_count'] = row.url_count
+    return cookie_json
+
+
+def main():
+    schedule_id = create_parser().parse_args().id
+    session = Session(db.engine)
+    count = summarize_schedule(session, schedule_id)
+    session.close()
+    if count is None:
+        print("The summary table doesn't exist, run initial_db.py --migrate first")
+    else:
+        print("summarized {} distinct cookies of schedule {}".format(count, schedule_id))
+
+
+if __name__ == '__main__':
+    main()
@@ -0,0 +1,177 @@
+"""
+A client for looking up cookie information in https://cookiepedia.co.uk.
+The lookups run in the background over a pooled http session so they don't stall the cookie extraction.
+"""
+import logging
+import threading
+import time
+from concurrent.futures import ThreadPoolExecutor
+
+import requests
+import urllib3
+from bs4 import BeautifulSoup as Soup
+from requests.adapters import HTTPAdapter
+from urllib3.util.retry import Retry
+
+import metrics
+
+# Remove annoying warning message when accessing https://cookiepedia.co.uk because of their broken
+# certificate.
+urllib3.disable_warnings(urllib3.exceptions.InsecureRequestWarning)
+
+SOUP_PARSER = 'html.parser'
+COOKIEPEDIA_PATH_FORMAT = 'https://cookiepedia.co.uk/cookies/{}'
+FOUND_COOKIE_H2 = 'About this cookie:'
+UNKNOWN_ABOUT = "There is not yet any general information about this cookie based on its name only. " \
+                "If you have any information about this cookie, please get in touch."
+UNKNOWN_PURPOSE = "Unknown"
+
+DEFAULT_CONCURRENCY = 4
+DEFAULT_RATE = 5
+DEFAULT_TIMEOUT = 10
+DEFAULT_RETRIES = 3
+DEFAULT_BACKOFF = 0.5
+RETRY_STATUSES = [429, 500, 502, 503, 504]
+
+
+def parse_cookie_page(page_content):
+    """
+    Parses the cookiepedia page of a cookie.
+    :param page_content: The html of the page.
+    :return: The about and purpose information of the cookie.
+    """
+    about = UNKNOWN_ABOUT
+    purpose = UNKNOWN_PURPOSE
+    soup = Soup(page_content, SOUP_PARSER)
+    h2 = soup.find('h2')
+    if h2 and h2.text == FOUND_COOKIE_H2:
+        paragraphs = soup.find('div', attrs={'id': 'content-left'}).find_all('p')
+        about = paragraphs[0].text
+        purpose = paragraphs[1].find('strong').text
+    return about, purpose
+
+
+def create_http_session(pool_size, retries=DEFAULT_RETRIES, backoff=DEFAULT_BACKOFF):
+    """
+    Creates a http session that reuses its connections and retries failed requests with an exponential backoff.
+    :param pool_size: The amount of connections kept open.
+    :param retries: The amount of times a failed request is retried.
+    :param backoff: The backoff factor between the retries.
+    :return: The configured session.
+    """
+    http = requests.Session()
+    retry = Retry(total=retries, backoff_factor=backoff, status_forcelist=RETRY_STATUSES)
+    adapter = HTTPAdapter(pool_connections=pool_size, pool_maxsize=pool_size, max_retries=retry)
+    http.mount('https://', adapter)
+    http.mount('http://', adapter)
+    return http
+
+
+class RateLimiter(object):
+    """
+    Spaces the requests evenly so no more than `rate` requests are sent per second.
+    """
+
+    def __init__(self, rate):
+        self.interval = 1.0 / rate if rate else 0
+        self._next = 0
+        self._lock = threading.Lock()
+
+    def wait(self):
+        with self._lock:
+            now = time.monotonic()
+            delay = self._next - now
+            self._next = max(now, self._next) + self.interval
+        if delay > 0:
+            time.sleep(delay)
+
+
+class CookiepediaClient(object):
+    def __init__(self, path_format=COOKIEPEDIA_PATH_FORMAT, concurrency=DEFAULT_CONCURRENCY, rate=DEFAULT_RATE,
+                 timeout=DEFAULT_TIMEOUT, retries=DEFAULT_RETRIES, backoff=DEFAULT_BACKOFF, verify=False):
+        """
+        :param path_format: The format of the url of a cookie page.
+        :param concurrency: The maximal amount of lookups running at the same time.
+        :param rate: The maximal amount of requests per second, 0 means unlimited.
+        :param timeout: The timeout in seconds of every request.
+        :param retries: The amount of times a failed request is retried.
+        :param backoff: The backoff factor between the retries.
+        :param verify: Whether to verify the certificate of the site.
+        """
+        self.path_format = path_format
+        self.timeout = timeout
+        self.verify = verify
+        self.http = create_http_session(concurrency, retries, backoff)
+        self.rate_limiter = RateLimiter(rate)
+        self._executor = ThreadPoolExecutor(max_workers=concurrency)
+        self._in_flight = {}
+        self._completed = []
+        self._failed = []
+        self._lock = threading.Lock()
+
+    def lookup(self, name):
+        """
+        Starts looking up the cookie in the background, a name that is already looked up isn't requested again.
+        :param name: The name of the cookie.
+        """
+        with self._lock:
+            if name in self._in_flight:
+                return
+            self._in_flight[name] = self._executor.submit(self._lookup, name)
+
+    def _lookup(self, name):
+        try:
+            self.rate_limiter.wait()
+            with metrics.timer('cookiepedia_seconds'):
+                response = self.http.get(self.path_format.format(name), timeout=self.timeout, verify=self.verify)
+            # An error page isn't saved as an unknown cookie, the cookie is looked up again by a later run.
+            response.raise_for_status()
+            about, purpose = parse_cookie_page(response.content)
+            metrics.increment('cookiepedia_lookups')
+            with self._lock:
+                self._completed.append((name, about, purpose))
+        except Exception as e:
+            logging.error("failed looking up the cookie {}: {}".format(name, e))
+            metrics.increment('cookiepedia_errors')
+            with self._lock:
+                self._failed.append(name)
+        finally:
+            with self._lock:
+                self._in_flight.pop(name, None)
+
+    def completed(self):
+        """
+        :return: The (name, about, purpose) of the lookups that finished since the last call.
+        """
+        with self._lock:
+            completed, self._completed = self._completed, []
+        return completed
+
+    def failed(self):
+        """
+        :return: The names of the lookups that failed since the last call.
+        """
+        with self._lock:
+            failed, self._failed = self._failed, []
+        return failed
+
+    def wait(self):
+        """
+        Waits for all of the lookups in flight to finish.
+        :return: The (name, about, purpose) of the lookups that finished since the last call.
+        """
+        while True:
+            with self._lock:
+                futures = list(self._in_flight.values())
+            if not futures:
+                return self.completed()
+            for future in futures:
+                future.result()
+
+    @property
+    def in_flight(self):
+        return len(self._in_flight)
+
+    def close(self):
+        self._executor.shutdown(wait=True)
+        self.http.close()
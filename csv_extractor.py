@@ -1,44 +1,23 @@
 import datetime
 
-from db import UrlScans, ExtractedCookies, Cookies
 from csv import writer
 
 from extractor import Extractor
-from utils import enrich_cookie, create_parser
+from utils import enrich_cookie_row, create_parser
 
 ROW_HEADERS = ['url', 'extraction time', 'name', 'purpose', 'about', 'domain', 'http only', 'secure', 'value',
                'expiration date']
 
 
-class UrlData(object):
-    def __init__(self, url, session):
-        self.url = url
-        self.session = session
-        self.cookies = []
-
-    def load_cookie_data(self):
-        """
-        Loads the data for the current url from the db.
-        """
-        extracted_cookies = self.session.query(ExtractedCookies).filter(ExtractedCookies.url_id == self.url.id).all()
-        cookies = [self.session.query(Cookies).get(extracted_cookie.cookie_id) for extracted_cookie in
-                   extracted_cookies]
-        cookie_jsons = [enrich_cookie(cookie, self.session) for cookie in cookies]
-        self.cookies = cookie_jsons
-
-    def write_to_csv(self, csv_writer):
-        """
-        Writes the data to the csv.
-        :param csv.writer csv_writer:
-        :return:
-        """
-        for cookie in self.cookies:
-            csv_writer.writerow(self._create_row_for_csv(cookie))
-
-    def _create_row_for_csv(self, cookie):
-        return [self.url.url, cookie['extraction_time'], cookie['name'], cookie['purpose'], cookie['about'],
-                cookie['domain'], cookie['httponly'], cookie['secure'],
-                cookie['value'], cookie.get('expires', 'No expiration date found!')]
+def create_row_for_csv(url, cookie):
+    """
+    :param url: The url in which the cookie was found.
+    :param cookie: The enriched cookie json.
+    :return: The csv row of the cookie.
+    """
+    return [url, cookie['extraction_time'], cookie['name'], cookie['purpose'], cookie['about'],
+            cookie['domain'], cookie['httponly'], cookie['secure'],
+            cookie['value'], cookie.get('expires', 'No expiration date found!')]
 
 
 class CsvExtractor(Extractor):
@@ -47,18 +26,18 @@ class CsvExtractor(Extractor):
         self._csv_writer = None
         self._output_file = None
         self._output_file_name = None
-        self._urls = None
 
     def extract(self):
         """
-        Writes the data found from this run to a csv file.
+        Writes the data found from this run to a csv file, the rows are written as they are streamed from the db.
         """
         self.csv_writer.writerow(ROW_HEADERS)
-        for url in self.urls:
-            print("writing {} to {}".format(url.url, self._output_file_name))
-            row = UrlData(url, self.session)
-            row.load_cookie_data()
-            row.write_to_csv(self.csv_writer)
+        current_url_id = None
+        for row in self.cookie_rows():
+            if row.url_id != current_url_id:
+                current_url_id = row.url_id
+                print("writing {} to {}".format(row.url, self._output_file_name))
+            self.csv_writer.writerow(create_row_for_csv(row.url, enrich_cookie_row(row)))
 
     @property
     def csv_writer(self):
@@ -73,12 +52,6 @@ class CsvExtractor(Extractor):
             self._output_file_name = "{} {}.csv".format(self.schedule.title, datetime.datetime.now())
         return self._output_file_name
 
-    @property
-    def urls(self):
-        if self._urls is None:
-            self._urls = self.session.query(UrlScans).filter(UrlScans.schedule_id == self.schedule.id)
-        return self._urls
-
     def close(self):
         self._csv_writer = None
         self._output_file.close()
@@ -89,6 +62,7 @@ def main():
     id = parser.parse_args().id
     extractor = CsvExtractor(schedule_id=id)
     extractor.extract()
+    extractor.close()
 
 
 if __name__ == '__main__':
@@ -1,27 +1,163 @@
+"""
+The connection to the mysql db and the models of its tables.
+Nothing is done on import, the engine is created on the first access to `db.engine` and the tables are reflected on
+the first access to a model (for example `db.UrlScans`). The reflected schema is pickled to METADATA_CACHE_PATH so
+the following runs skip the reflection, call invalidate_metadata_cache() after changing the schema.
+"""
+import os
+import pickle
+
+from sqlalchemy import create_engine, MetaData
 from sqlalchemy.engine.url import URL
 from sqlalchemy.ext.automap import automap_base
-from sqlalchemy import create_engine
 
 DB_URL = URL(drivername='mysql+pymysql', username='nir', password='geller', host='localhost',
              port=3306, database='Marketing')
 
-Base = automap_base()
+POOL_OPTIONS = {
+    'pool_size': 5,
+    'max_overflow': 10,
+    # Connections that were dropped by the server (for example after wait_timeout) are replaced transparently.
+    'pool_pre_ping': True,
+    'pool_recycle': 3600,
+}
+
+METADATA_CACHE_PATH = os.path.join(os.path.dirname(os.path.abspath(__file__)), '.db_metadata.pickle')
+
+# The mapped classes and the names of their tables.
+MODELS = {
+    'Cookies': 'tblCookies',
+    'CookieInfo': 'tblCookie_Info',
+    'CookieSummary': 'tblCookie_Summary',
+    'ExtractedCookies': 'tblExtracted_Cookies',
+    'MuncherConfig': 'tblMuncher_Config',
+    'MuncherSchedule': 'tblMuncher_Schedule',
+    'MuncherStats': 'tbl_Muncher_Stats',
+    'UrlScans': 'tblUrl_Scans',
+}
+
+_settings = {
+    'url': DB_URL,
+    'pool_options': POOL_OPTIONS,
+    'metadata_cache_path': METADATA_CACHE_PATH,
+}
+_engine = None
+_models = None
+# True once the db was checked to give consecutive ids to the rows of a multi-row insert.
+_consecutive_ids = False
+
+
+def configure(url=DB_URL, pool_options=POOL_OPTIONS, metadata_cache_path=METADATA_CACHE_PATH):
+    """
+    Changes the db the models are bound to, should be called before the engine or the models are used.
+    :param url: The url of the db.
+    :param pool_options: The keyword arguments of the connection pool passed to create_engine.
+    :param metadata_cache_path: The path of the pickled schema, if None the schema is reflected on every run.
+    """
+    global _engine, _models, _consecutive_ids
+    if _engine is not None:
+        _engine.dispose()
+    _settings.update(url=url, pool_options=pool_options, metadata_cache_path=metadata_cache_path)
+    _engine = None
+    _models = None
+    _consecutive_ids = False
+
+
+def get_engine():
+    """
+    :return: The engine of the db, created on the first call.
+    """
+    global _engine
+    if _engine is None:
+        _engine = create_engine(_settings['url'], **_settings['pool_options'])
+    return _engine
+
+
+def load_metadata():
+    """
+    Loads the schema of the db from its cached snapshot, in case there isn't one reflects it and caches it.
+    :return: The metadata of the db tables.
+    """
+    cache_path = _settings['metadata_cache_path']
+    if cache_path and os.path.exists(cache_path):
+        with open(cache_path, 'rb') as cache_file:
+            return pickle.load(cache_file)
+    metadata = MetaData()
+    metadata.reflect(bind=get_engine())
+    if cache_path:
+        with open(cache_path, 'wb') as cache_file:
+            pickle.dump(metadata, cache_file)
+    return metadata
+
+
+def invalidate_metadata_cache():
+    """
+    Removes the cached snapshot of the schema so the next run reflects the db again.
+    """
+    global _models
+    cache_path = _settings['metadata_cache_path']
+    if cache_path and os.path.exists(cache_path):
+        os.remove(cache_path)
+    _models = None
+
+
+def get_models():
+    """
+    :return: A dict from the name of every model to its mapped class, the classes are mapped on the first call.
+    """
+    global _models
+    if _models is None:
+        base = automap_base(metadata=load_metadata())
+        base.prepare()
+        _models = {name: getattr(base.classes, table) for name, table in MODELS.items()
+                   if table in base.metadata.tables}
+    return _models
+
 
-# engine, suppose it has two tables 'user' and 'address' set up
-engine = create_engine(DB_URL)
+def check_consecutive_ids(session):
+    """
+    Makes sure the rows of a single insert statement get consecutive ids, in a mysql setup that skips ids
+    (auto_increment_increment isn't 1, for example multi primary replication) the ids given by insert_rows would be
+    wrong.
+    :param Session session: The session with the db.
+    """
+    global _consecutive_ids
+    if _consecutive_ids:
+        return
+    if session.bind.dialect.name == 'mysql':
+        increment = session.execute('SELECT @@auto_increment_increment').scalar()
+        if int(increment) != 1:
+            raise RuntimeError("The rows of a multi-row insert don't get consecutive ids since "
+                               "auto_increment_increment is {}, it must be 1".format(increment))
+    _consecutive_ids = True
 
-# # reflect the tables
-Base.prepare(engine, reflect=True)
-#
-# # mapped classes are now created with names by default
-# # matching that of the table name.
-Cookies = Base.classes.tblCookies
-CookieInfo = Base.classes.tblCookie_Info
-ExtractedCookies = Base.classes.tblExtracted_Cookies
-MuncherConfig = Base.classes.tblMuncher_Config
-MuncherSchedule = Base.classes.tblMuncher_Schedule
-MuncherStats = Base.classes.tbl_Muncher_Stats
-UrlScans = Base.classes.tblUrl_Scans
 
+def insert_rows(session, table, rows):
+    """
+    Inserts the rows with a single multi-row insert.
+    :param Session session: The session with the db.
+    :param table: The table the rows are inserted to.
+    :param rows: A list of dicts from column name to value.
+    :return: The ids given to the rows, in the order of the rows.
+    """
+    check_consecutive_ids(session)
+    result = session.execute(table.insert().values(rows))
+    if session.bind.dialect.name == 'sqlite':
+        # Sqlite reports the id of the last row.
+        first_id = result.lastrowid - len(rows) + 1
+    else:
+        # MySQL reports the id of the first row, the rows of a single insert statement get consecutive ids
+        # (innodb_autoinc_lock_mode 0 or 1).
+        first_id = result.lastrowid
+    return list(range(first_id, first_id + len(rows)))
 
 
+def __getattr__(name):
+    if name == 'engine':
+        return get_engine()
+    if name in MODELS:
+        models = get_models()
+        if name not in models:
+            raise AttributeError("The table {} doesn't exist in the db".format(MODELS[name]))
+        return models[name]
+    raise AttributeError("module {} has no attribute {}".format(__name__, name))
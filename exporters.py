@@ -0,0 +1,226 @@
+"""
+Exports the cookies extracted in a schedule to files meant for analytics rather than for reading: gzip compressed csv,
+json lines and parquet. The rows are streamed from the db and written in batches, parquet needs the pyarrow package.
+"""
+import abc
+import csv
+import datetime
+import gzip
+import json
+
+from csv_extractor import ROW_HEADERS, create_row_for_csv
+from extractor import Extractor, STREAM_BATCH_SIZE
+from utils import enrich_cookie_row, create_parser as create_base_parser
+
+# The columns with few distinct values, stored once per file (or row group) and referenced by index.
+DICTIONARY_COLUMNS = ['url', 'name', 'purpose', 'about', 'domain']
+DEFAULT_PARQUET_COMPRESSION = 'snappy'
+# Every batch is a row group with its own dictionaries, bigger row groups compress better.
+PARQUET_BATCH_SIZE = 10000
+
+
+def create_record(url, cookie):
+    """
+    :param url: The url in which the cookie was found.
+    :param cookie: The enriched cookie json.
+    :return: A dict of the exported columns of the cookie, expires is left out for session cookies.
+    """
+    record = {'url': url, 'extraction_time': cookie['extraction_time'], 'name': cookie['name'],
+              'purpose': cookie['purpose'], 'about': cookie['about'], 'domain': cookie.get('domain'),
+              'httponly': cookie.get('httponly'), 'secure': cookie.get('secure'), 'value': cookie.get('value')}
+    if 'expires' in cookie:
+        record['expires'] = cookie['expires']
+    return record
+
+
+class BatchExtractor(Extractor, abc.ABC):
+    """
+    Writes the cookies of the schedule to a file in batches of rows, the subclasses define the file format.
+    """
+    extension = None
+
+    def __init__(self, schedule_id, batch_size=STREAM_BATCH_SIZE):
+        """
+        :param schedule_id: The id of the schedule.
+        :param batch_size: The amount of rows fetched from the db and written at once.
+        """
+        super(BatchExtractor, self).__init__(schedule_id)
+        self.batch_size = batch_size
+        self.rows_written = 0
+        self._output_file_name = None
+
+    @property
+    def output_file_name(self):
+        if not self._output_file_name:
+            self._output_file_name = "{} {}.{}".format(self.schedule.title, datetime.datetime.now(), self.extension)
+        return self._output_file_name
+
+    def extract(self):
+        """
+        Writes the cookies of this run to the output file, the rows are written as they are streamed from the db.
+        """
+        self.open()
+        batch = []
+        for row in self.cookie_rows(self.batch_size):
+            batch.append(create_record(row.url, enrich_cookie_row(row)))
+            if len(batch) >= self.batch_size:
+                self._write(batch)
+                batch = []
+        if batch:
+            self._write(batch)
+        print("wrote {} cookies to {}".format(self.rows_written, self.output_file_name))
+
+    def _write(self, records):
+        self.write_batch(records)
+        self.rows_written += len(records)
+
+    @abc.abstractmethod
+    def open(self):
+        pass
+
+    @abc.abstractmethod
+    def write_batch(self, records):
+        """
+        :param records: A list of dicts of the exported columns.
+        """
+        pass
+
+    @abc.abstractmethod
+    def close(self):
+        pass
+
+
+class GzipCsvExtractor(BatchExtractor):
+    """
+    The same rows as the CsvExtractor in a gzip compressed csv file.
+    """
+    extension = 'csv.gz'
+
+    def __init__(self, schedule_id, batch_size=STREAM_BATCH_SIZE, compression_level=6):
+        """
+        :param compression_level: The gzip compression level, from 1 (fastest) to 9 (smallest).
+        """
+        super(GzipCsvExtractor, self).__init__(schedule_id, batch_size)
+        self.compression_level = compression_level
+        self._output_file = None
+        self._csv_writer = None
+
+    def open(self):
+        self._output_file = gzip.open(self.output_file_name, 'wt', compresslevel=self.compression_level, newline='')
+        self._csv_writer = csv.writer(self._output_file)
+        self._csv_writer.writerow(ROW_HEADERS)
+
+    def write_batch(self, records):
+        self._csv_writer.writerows([create_row_for_csv(record['url'], record) for record in records])
+
+    def close(self):
+        self._csv_writer = None
+        if self._output_file:
+            self._output_file.close()
+
+
+class JsonLinesExtractor(BatchExtractor):
+    """
+    A json object for every cookie on its own line, gzip compressed unless asked otherwise.
+    """
+
+    def __init__(self, schedule_id, batch_size=STREAM_BATCH_SIZE, compress=True):
+        """
+        :param compress: If True the file is gzip compressed.
+        """
+        super(JsonLinesExtractor, self).__init__(schedule_id, batch_size)
+        self.compress = compress
+        self.extension = 'jsonl.gz' if compress else 'jsonl'
+        self._output_file = None
+
+    def open(self):
+        if self.compress:
+            self._output_file = gzip.open(self.output_file_name, 'wt')
+        else:
+            self._output_file = open(self.output_file_name, 'w')
+
+    def write_batch(self, records):
+        self._output_file.write(''.join(json.dumps(record, default=str) + '\n' for record in records))
+
+    def close(self):
+        if self._output_file:
+            self._output_file.close()
+
+
+class ParquetExtractor(BatchExtractor):
+    """
+    A parquet file with a row group for every batch, the repetitive columns are dictionary encoded.
+    """
+    extension = 'parquet'
+
+    def __init__(self, schedule_id, batch_size=PARQUET_BATCH_SIZE, compression=DEFAULT_PARQUET_COMPRESSION):
+        """
+        :param compression: The parquet compression codec, for example snappy, gzip, zstd or none.
+        """
+        try:
+            import pyarrow
+            import pyarrow.parquet
+        except ImportError:
+            raise ImportError("The parquet export needs the pyarrow package, install it with pip install pyarrow")
+        super(ParquetExtractor, self).__init__(schedule_id, batch_size)
+        self.compression = compression
+        self._pa = pyarrow
+        self._pq = pyarrow.parquet
+        self._writer = None
+        string = pyarrow.string()
+        dictionary = pyarrow.dictionary(pyarrow.int32(), string)
+        self.schema = pyarrow.schema([
+            ('url', dictionary), ('extraction_time', pyarrow.timestamp('us')), ('name', dictionary),
+            ('purpose', dictionary), ('about', dictionary), ('domain', dictionary), ('httponly', pyarrow.bool_()),
+            ('secure', pyarrow.bool_()), ('value', string), ('expires', string)])
+
+    def open(self):
+        self._writer = self._pq.ParquetWriter(self.output_file_name, self.schema, compression=self.compression,
+                                              use_dictionary=DICTIONARY_COLUMNS)
+
+    def write_batch(self, records):
+        columns = []
+        for field in self.schema:
+            values = [record.get(field.name) for record in records]
+            if field.name in DICTIONARY_COLUMNS:
+                columns.append(self._pa.array(values, self._pa.string()).dictionary_encode())
+            else:
+                columns.append(self._pa.array(values, field.type))
+        self._writer.write_table(self._pa.Table.from_arrays(columns, schema=self.schema))
+
+    def close(self):
+        if self._writer:
+            self._writer.close()
+
+
+EXTRACTORS = {
+    'csv.gz': GzipCsvExtractor,
+    'jsonl': JsonLinesExtractor,
+    'parquet': ParquetExtractor,
+}
+
+
+def create_parser():
+    parser = create_base_parser()
+    parser.add_argument('-f', '--format', dest='format', choices=sorted(EXTRACTORS), default='csv.gz',
+                        help="The format of the exported file.")
+    parser.add_argument('--batch-size', dest='batch_size', type=int, default=None,
+                        help="The amount of rows written at once, each format has its own default.")
+    return parser
+
+
+def main():
+    parser_args = create_parser().parse_args()
+    extractor_class = EXTRACTORS[parser_args.format]
+    if parser_args.batch_size:
+        extractor = extractor_class(parser_args.id, batch_size=parser_args.batch_size)
+    else:
+        extractor = extractor_class(parser_args.id)
+    try:
+        extractor.extract()
+    finally:
+        extractor.close()
+
+
+if __name__ == '__main__':
+    main()
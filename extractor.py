@@ -1,9 +1,29 @@
 from sqlalchemy.orm import Session
 
-from db import engine, MuncherSchedule
+import db
+
+STREAM_BATCH_SIZE = 1000
 
 
 class Extractor(object):
     def __init__(self, schedule_id):
-        self.session = Session(engine)
-        self.schedule = self.session.query(MuncherSchedule).get(schedule_id)
\ No newline at end of file
+        self.session = Session(db.engine)
+        self.schedule = self.session.query(db.MuncherSchedule).get(schedule_id)
+
+    def cookie_rows(self, batch_size=STREAM_BATCH_SIZE):
+        """
+        Streams every cookie extracted in this schedule along with its url and cookie info using a single query,
+        the rows are fetched from a server side cursor in batches so the memory usage doesn't depend on the
+        size of the schedule.
+        :param batch_size: The amount of rows fetched from the db at once.
+        :return: An iterable of rows ordered by url.
+        """
+        return self.session.query(db.UrlScans.id.label('url_id'), db.UrlScans.url, db.Cookies.datetime,
+                                  db.Cookies.cookie_attr, db.CookieInfo.about, db.CookieInfo.purpose) \
+            .join(db.ExtractedCookies, db.ExtractedCookies.url_id == db.UrlScans.id) \
+            .join(db.Cookies, db.Cookies.id == db.ExtractedCookies.cookie_id) \
+            .outerjoin(db.CookieInfo, db.CookieInfo.id == db.Cookies.cookie_info_id) \
+            .filter(db.UrlScans.schedule_id == self.schedule.id) \
+            .order_by(db.UrlScans.id, db.Cookies.id) \
+            .execution_options(stream_results=True) \
+            .yield_per(batch_size)
@@ -0,0 +1,3 @@
+"""
+Local stand-ins for the external services the muncher talks to, so it can be run and measured offline.
+"""
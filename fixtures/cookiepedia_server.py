@@ -0,0 +1,98 @@
+"""
+A local stand-in for https://cookiepedia.co.uk that answers cookie lookups offline.
+Start it with `python -m fixtures.cookiepedia_server --port 8000` and set the `cookiepedia_url` config param to
+http://localhost:8000/cookies/{}
+"""
+import argparse
+import threading
+import time
+from html import escape
+from http.server import BaseHTTPRequestHandler, ThreadingHTTPServer
+from urllib.parse import unquote
+
+COOKIES_PATH = '/cookies/'
+KNOWN_COOKIES = {
+    '_ga': ('This cookie name is associated with Google Universal Analytics.', 'Performance'),
+    '_gid': ('This cookie name is associated with Google Universal Analytics.', 'Performance'),
+    'NID': ('This domain is owned by Google Inc.', 'Targeting/Advertising'),
+    'PHPSESSID': ('Cookie generated by applications based on the PHP language.', 'Strictly Necessary'),
+}
+FOUND_PAGE = """<html><body><h2>About this cookie:</h2><div id="content-left">
+<p>{about}</p><p>The main purpose of this cookie is: <strong>{purpose}</strong></p></div></body></html>"""
+NOT_FOUND_PAGE = """<html><body><h2>Sorry, we don't know this cookie.</h2><div id="content-left">
+<p>There is no information about this cookie.</p></div></body></html>"""
+
+
+class CookiepediaHandler(BaseHTTPRequestHandler):
+    def do_GET(self):
+        if not self.path.startswith(COOKIES_PATH):
+            self.send_error(404)
+            return
+        if self.server.latency:
+            time.sleep(self.server.latency)
+        name = unquote(self.path[len(COOKIES_PATH):])
+        self.server.requests.append(name)
+        if name in self.server.failing:
+            self.send_error(500)
+            return
+        cookie = self.server.cookies.get(name)
+        page = FOUND_PAGE.format(about=escape(cookie[0]), purpose=escape(cookie[1])) if cookie else NOT_FOUND_PAGE
+        body = page.encode()
+        self.send_response(200)
+        self.send_header('Content-Type', 'text/html; charset=utf-8')
+        self.send_header('Content-Length', str(len(body)))
+        self.end_headers()
+        self.wfile.write(body)
+
+    def log_message(self, format, *args):
+        pass
+
+
+class CookiepediaServer(ThreadingHTTPServer):
+    daemon_threads = True
+
+    def __init__(self, address, cookies=None, latency=0, failing=()):
+        """
+        :param address: The (host, port) to listen on, port 0 picks a free port.
+        :param cookies: A dict from cookie name to its (about, purpose), defaults to KNOWN_COOKIES.
+        :param latency: The amount of seconds every response is delayed.
+        :param failing: The cookie names that are answered with a server error.
+        """
+        super(CookiepediaServer, self).__init__(address, CookiepediaHandler)
+        self.cookies = KNOWN_COOKIES if cookies is None else cookies
+        self.latency = latency
+        self.failing = set(failing)
+        self.requests = []
+
+    @property
+    def path_format(self):
+        """
+        :return: The value of the `cookiepedia_url` config param for this server.
+        """
+        host, port = self.server_address[:2]
+        return 'http://{}:{}{}{{}}'.format(host, port, COOKIES_PATH)
+
+
+def serve_in_background(host='127.0.0.1', port=0, cookies=None, latency=0, failing=()):
+    """
+    Starts the server in a daemon thread.
+    :return: The running server, call shutdown() to stop it.
+    """
+    server = CookiepediaServer((host, port), cookies, latency, failing)
+    threading.Thread(target=server.serve_forever, name='cookiepedia-server', daemon=True).start()
+    return server
+
+
+def main():
+    parser = argparse.ArgumentParser(description="A local stand-in for cookiepedia.")
+    parser.add_argument('--host', default='127.0.0.1')
+    parser.add_argument('--port', type=int, default=8000)
+    parser.add_argument('--latency', type=float, default=0, help="Seconds every response is delayed.")
+    args = parser.parse_args()
+    server = CookiepediaServer((args.host, args.port), latency=args.latency)
+    print("serving cookie lookups on {}".format(server.path_format))
+    server.serve_forever()
+
+
+if __name__ == '__main__':
+    main()
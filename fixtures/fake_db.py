@@ -0,0 +1,108 @@
+"""
+A sqlite stand-in for the mysql db, with the tables the muncher reflects in db.py.
+Call use_fake_db() before anything touches db.engine or the models, for example:
+    from fixtures.fake_db import use_fake_db
+    use_fake_db('/tmp/muncher.db')
+"""
+import datetime
+import json
+
+from sqlalchemy import create_engine, MetaData, Table, Column, Index, Integer, String, Text, DateTime
+
+import db
+from initial_db import NEW_TABLES
+
+
+def create_metadata():
+    """
+    :return: The metadata of the muncher tables, including the tables and columns initial_db adds.
+    """
+    metadata = MetaData()
+    Table('tblCookies', metadata,
+          Column('id', Integer, primary_key=True),
+          Column('cookie_info_id', Integer),
+          Column('cookie_source', Integer),
+          Column('cookie_attr', Text),
+          Column('cookie_hash', String(40)),
+          Column('datetime', DateTime),
+          Index('ix_cookie_hash', 'cookie_hash', unique=True))
+    Table('tblCookie_Info', metadata,
+          Column('id', Integer, primary_key=True),
+          Column('cookie_name', String(255)),
+          Column('purpose', String(255)),
+          Column('about', Text),
+          Column('datetime', DateTime))
+    Table('tblExtracted_Cookies', metadata,
+          Column('id', Integer, primary_key=True),
+          Column('url_id', Integer),
+          Column('cookie_id', Integer))
+    Table('tblMuncher_Config', metadata,
+          Column('id', Integer, primary_key=True),
+          Column('json_params', Text))
+    Table('tblMuncher_Schedule', metadata,
+          Column('id', Integer, primary_key=True),
+          Column('user_id', Integer),
+          Column('config_id', Integer),
+          Column('start_datetime', DateTime),
+          Column('title', String(255)),
+          Column('description', Text))
+    Table('tbl_Muncher_Stats', metadata,
+          Column('id', Integer, primary_key=True),
+          Column('schedule_id', Integer),
+          Column('urls_scanned_fp', Integer),
+          Column('urls_scanned_tp', Integer),
+          Column('url_last_result', String(255)),
+          Column('urls_log_path', String(255)),
+          Column('url_scan_duration', Integer),
+          Column('cookies_extracted_fp', Integer),
+          Column('cookies_log_path', String(255)),
+          Column('cookie_last_result', String(255)),
+          Column('cookie_scan_duration', Integer),
+          Column('cookie_cache_hits', Integer),
+          Column('cookie_cache_misses', Integer),
+          Column('metrics_json', Text),
+          Column('report_last_result', String(255)),
+          Column('crawl_heartbeat', DateTime))
+    Table('tblUrl_Scans', metadata,
+          Column('id', Integer, primary_key=True),
+          Column('schedule_id', Integer),
+          Column('url', String(2000)),
+          Column('url_hash', String(40)),
+          Column('content_hash', String(40)),
+          Index('ix_url_hash', 'schedule_id', 'url_hash'))
+    for table in NEW_TABLES:
+        table.tometadata(metadata)
+    return metadata
+
+
+def use_fake_db(path, create=True):
+    """
+    Binds the muncher models to a sqlite db.
+    :param path: The path of the sqlite file, every process and thread of a run should use the same file.
+    :param create: If True the tables are created in case they don't exist.
+    """
+    url = 'sqlite:///{}'.format(path)
+    if create:
+        engine = create_engine(url)
+        create_metadata().create_all(engine)
+        engine.dispose()
+    # Sqlite doesn't pool connections the way mysql does and the schema is reflected on every run.
+    db.configure(url, pool_options={}, metadata_cache_path=None)
+
+
+def create_schedule(session, params, title='Benchmark'):
+    """
+    Creates a config and a schedule that uses it.
+    :param Session session: The session with the db.
+    :param params: The json params of the config.
+    :param title: The title of the schedule.
+    :return: The id of the schedule.
+    """
+    config = db.MuncherConfig(json_params=json.dumps(params))
+    session.add(config)
+    session.commit()
+    schedule = db.MuncherSchedule(user_id=1, config_id=config.id, start_datetime=datetime.datetime.now(),
+                                  title=title, description='A schedule of the offline benchmarks')
+    session.add(schedule)
+    session.commit()
+    return schedule.id
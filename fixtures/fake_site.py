@@ -0,0 +1,126 @@
+"""
+A local generated website for crawling and extracting cookies offline.
+Every page links to `fan_out` other pages so the whole site is reachable from the first page, and sets cookies both
+in its headers (a site wide session cookie and a few tracking cookies) and from a script.
+Start it with `python -m fixtures.fake_site --pages 1000 --fan-out 5 --port 8001`.
+"""
+import argparse
+import threading
+import time
+from http.server import BaseHTTPRequestHandler, ThreadingHTTPServer
+
+PAGE_PATH = '/page/'
+# Names known by the cookiepedia stand-in are mixed with unknown ones so both lookup paths are exercised.
+HEADER_COOKIES = ['_ga', '_gid', 'NID', 'tracker_a', 'tracker_b', 'tracker_c']
+SCRIPT_COOKIES = ['_js_visit', '_js_ab_test', '_js_consent']
+PAGE_TEMPLATE = """<html><head><title>page {number}</title>
+<script>document.cookie = "{script_cookie}={number}; path=/";</script></head>
+<body><h1>page {number}</h1>{links}</body></html>"""
+
+
+class FakeSiteHandler(BaseHTTPRequestHandler):
+    def do_GET(self):
+        path = self.path.split('?')[0]
+        number = path[len(PAGE_PATH):] if path.startswith(PAGE_PATH) else None
+        if path == '/':
+            number = '0'
+        if number is None or not number.isdigit() or int(number) >= self.server.pages:
+            self.send_error(404)
+            return
+        if self.server.latency:
+            time.sleep(self.server.latency)
+        number = int(number)
+        body = self.server.render(number).encode()
+        self.send_response(200)
+        self.send_header('Content-Type', 'text/html; charset=utf-8')
+        self.send_header('Content-Length', str(len(body)))
+        for name, value in self.server.cookies(number):
+            self.send_header('Set-Cookie', '{}={}; Path=/; Max-Age=86400'.format(name, value))
+        self.end_headers()
+        self.wfile.write(body)
+
+    def log_message(self, format, *args):
+        pass
+
+
+class FakeSite(ThreadingHTTPServer):
+    daemon_threads = True
+
+    def __init__(self, address, pages=100, fan_out=5, cookies_per_page=3, latency=0):
+        """
+        :param address: The (host, port) to listen on, port 0 picks a free port.
+        :param pages: The amount of pages in the site.
+        :param fan_out: The amount of links in every page.
+        :param cookies_per_page: The amount of tracking cookies every page sets in its headers.
+        :param latency: The amount of seconds every response is delayed.
+        """
+        super(FakeSite, self).__init__(address, FakeSiteHandler)
+        self.pages = pages
+        self.fan_out = fan_out
+        self.cookies_per_page = min(cookies_per_page, len(HEADER_COOKIES))
+        self.latency = latency
+
+    def links(self, number):
+        """
+        :return: The numbers of the pages the page links to, page n links to the pages n * fan_out + 1 ...
+        n * fan_out + fan_out so the site is a tree reachable from page 0.
+        """
+        return [(number * self.fan_out + offset) % self.pages for offset in range(1, self.fan_out + 1)]
+
+    def cookies(self, number):
+        """
+        :return: The (name, value) of the cookies the page sets in its headers.
+        """
+        tracking = [(HEADER_COOKIES[(number + index) % len(HEADER_COOKIES)], 'p{}'.format(number))
+                    for index in range(self.cookies_per_page)]
+        return [('PHPSESSID', 'fake-session')] + tracking
+
+    def render(self, number):
+        links = ''.join('<a href="{}{}">page {}</a>'.format(PAGE_PATH, link, link) for link in self.links(number))
+        return PAGE_TEMPLATE.format(number=number, links=links,
+                                    script_cookie=SCRIPT_COOKIES[number % len(SCRIPT_COOKIES)])
+
+    @property
+    def start_url(self):
+        host, port = self.server_address[:2]
+        return 'http://{}:{}/'.format(host, port)
+
+    def page_urls(self):
+        return page_urls(self.start_url, self.pages)
+
+
+def page_urls(start_url, pages):
+    """
+    :param start_url: The url of the first page of the site.
+    :param pages: The amount of pages in the site.
+    :return: The urls of all of the pages of the site.
+    """
+    return [start_url] + ['{}{}{}'.format(start_url.rstrip('/'), PAGE_PATH, number) for number in range(1, pages)]
+
+
+def serve_in_background(host='127.0.0.1', port=0, pages=100, fan_out=5, cookies_per_page=3, latency=0):
+    """
+    Starts the site in a daemon thread.
+    :return: The running site, call shutdown() to stop it.
+    """
+    site = FakeSite((host, port), pages, fan_out, cookies_per_page, latency)
+    threading.Thread(target=site.serve_forever, name='fake-site', daemon=True).start()
+    return site
+
+
+def main():
+    parser = argparse.ArgumentParser(description="A local generated website that sets cookies.")
+    parser.add_argument('--host', default='127.0.0.1')
+    parser.add_argument('--port', type=int, default=8001)
+    parser.add_argument('--pages', type=int, default=100)
+    parser.add_argument('--fan-out', dest='fan_out', type=int, default=5)
+    parser.add_argument('--cookies-per-page', dest='cookies_per_page', type=int, default=3)
+    parser.add_argument('--latency', type=float, default=0, help="Seconds every response is delayed.")
+    args = parser.parse_args()
+    site = FakeSite((args.host, args.port), args.pages, args.fan_out, args.cookies_per_page, args.latency)
+    print("serving {} pages on {}".format(args.pages, site.start_url))
+    site.serve_forever()
+
+
+if __name__ == '__main__':
+    main()
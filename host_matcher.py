@@ -0,0 +1,71 @@
+"""
+Classifies urls as internal or external to a set of domains by their host name.
+"""
+import re
+from urllib.parse import urlparse
+
+NETLOC_PATTERN = re.compile(r'^[a-zA-Z][a-zA-Z0-9+.-]*://([^/?#]*)')
+
+
+def normalize_host(host):
+    """
+    :param host: A host name or a net location, for example www.Tumblr.com:443
+    :return: The lower case host name without a port or a trailing dot, for example www.tumblr.com
+    """
+    hostname = urlparse('//{}'.format(host)).hostname or ''
+    return hostname.rstrip('.')
+
+
+def extract_host(url):
+    """
+    A faster urlparse(url).hostname for absolute urls.
+    :param url: The url.
+    :return: The normalized host name of the url, an empty string if the url has no host.
+    """
+    match = NETLOC_PATTERN.match(url)
+    if not match:
+        return ''
+    netloc = match.group(1).rpartition('@')[2]
+    if netloc.startswith('['):
+        host = netloc[1:netloc.find(']')]
+    else:
+        host = netloc.partition(':')[0]
+    return host.lower().rstrip('.')
+
+
+class HostMatcher(object):
+    """
+    Matches a host name against a set of domains, a host matches a domain if it is the domain itself or one of its
+    sub domains. The lookup walks the suffixes of the host labels so it costs O(labels) set lookups no matter how
+    many domains there are.
+    """
+
+    def __init__(self, domains):
+        """
+        :param domains: An iterable of host names or net locations.
+        """
+        self.domains = frozenset(host for host in (normalize_host(domain) for domain in domains) if host)
+
+    def matches_host(self, host):
+        """
+        :param host: A normalized host name.
+        :return: True if the host is one of the domains or a sub domain of one of them.
+        """
+        if not host:
+            return False
+        if host in self.domains:
+            return True
+        # Checks the parent domains of the host from the longest to the shortest.
+        position = host.find('.')
+        while position != -1:
+            if host[position + 1:] in self.domains:
+                return True
+            position = host.find('.', position + 1)
+        return False
+
+    def matches(self, url):
+        """
+        :param url: The url to be checked.
+        :return: True if the host of the url is one of the domains or a sub domain of one of them.
+        """
+        return self.matches_host(extract_host(url))
@@ -1,80 +1,159 @@
 import json
+import os
+import tempfile
 
 import datetime
-from jinja2 import Template
+from jinja2 import Environment, FileSystemLoader, FileSystemBytecodeCache
 
-from db import UrlScans, ExtractedCookies, Cookies, MuncherConfig
+from cookie_summary import load_summary, summary_cookie
+import db
 from extractor import Extractor
-from utils import enrich_cookie, update_first_found_url, create_parser
+from utils import enrich_cookie_row, find_depth_of_url, create_parser
 
 TEMPLATE_FILE_NAME = 'html_report_Gareth.html'
+TEMPLATE_FOLDER = os.path.dirname(os.path.abspath(__file__))
+TEMPLATE_CACHE_FOLDER = os.path.join(tempfile.gettempdir(), 'cookie_muncher_templates')
 OUTPUT_FILE_TEMPLATE = '{} {}.html'
+PAGE_FILE_TEMPLATE = '{} {} page {}.html'
+
+_environment = None
+
+
+def get_template_environment():
+    """
+    Returns the jinja2 environment, the compiled templates are cached in memory and their bytecode on the disk so
+    the template isn't compiled again on every run.
+    :return: The jinja2 environment.
+    """
+    global _environment
+    if _environment is None:
+        if not os.path.exists(TEMPLATE_CACHE_FOLDER):
+            os.makedirs(TEMPLATE_CACHE_FOLDER)
+        _environment = Environment(loader=FileSystemLoader(TEMPLATE_FOLDER),
+                                   bytecode_cache=FileSystemBytecodeCache(TEMPLATE_CACHE_FOLDER))
+    return _environment
+
+
+def paginate(cookies_by_types, page_size):
+    """
+    Splits the cookies into pages of at most page_size cookies, a type may continue on the next page.
+    :param cookies_by_types: The cookies grouped by their type.
+    :param page_size: The maximal amount of cookies in a page, should be positive.
+    :return: A list of pages, each one a list of cookies grouped by their type.
+    """
+    if page_size <= 0:
+        raise ValueError("The page size should be positive, got {}".format(page_size))
+    pages = [[]]
+    page_count = 0
+    for cookies_by_type in cookies_by_types:
+        cookies = cookies_by_type['cookies']
+        position = 0
+        while position < len(cookies):
+            if page_count >= page_size:
+                pages.append([])
+                page_count = 0
+            chunk = cookies[position:position + page_size - page_count]
+            pages[-1].append(dict(cookies_by_type, cookies=chunk))
+            page_count += len(chunk)
+            position += len(chunk)
+    return pages
+
 
 class CookiesInformation(object):
     def __init__(self, session):
         self.session = session
         self.cookies_by_type = {}
         self.cookies_count = 0
+        # Maps (purpose, name) to the cookie and the depth of its first found url.
+        self._index = {}
 
-    def add_cookie(self, new_cookie, url):
+    def add_cookie(self, new_cookie, url, depth=None):
         """
         Adds a cookie, in case the cookie doesn't exists creates one, in case it does exists updates its first found url.
         :param new_cookie: The new cookie to be added
         :param url: The url from which to cookie was extracted.
+        :param depth: The depth of the url, calculated from the url in case it isn't given.
         """
-        cookies = self.cookies_by_type.get(new_cookie['purpose'], [])
-        old_cookie = [cookie for cookie in cookies if cookie['name'] == new_cookie['name']]
-        if not old_cookie:
+        if depth is None:
+            depth = find_depth_of_url(url)
+        key = (new_cookie['purpose'], new_cookie['name'])
+        entry = self._index.get(key)
+        if entry is None:
             new_cookie['first_found_url'] = url
-            cookies.append(new_cookie)
+            self.cookies_by_type.setdefault(new_cookie['purpose'], []).append(new_cookie)
+            self._index[key] = [new_cookie, depth]
             self.cookies_count += 1
-        else:
-            update_first_found_url(old_cookie[0], url)
-
-        self.cookies_by_type[new_cookie['purpose']] = cookies
+        elif depth < entry[1]:
+            entry[0]['first_found_url'] = url
+            entry[1] = depth
 
     @property
     def cookies(self):
-        return [{'type': cookie_type, 'cookies': self.cookies_by_type[cookie_type]} for cookie_type in
-                self.cookies_by_type.keys()]
+        return [{'type': cookie_type, 'cookies': self.cookies_by_type[cookie_type],
+                 'count': len(self.cookies_by_type[cookie_type])} for cookie_type in self.cookies_by_type.keys()]
 
 
 class HtmlExtractor(Extractor):
-    def __init__(self, schedule_id):
+    def __init__(self, schedule_id, page_size=None):
+        """
+        :param schedule_id: The id of the schedule.
+        :param page_size: The maximal amount of cookies in a single html file, if None the config param
+        report_page_size is used and in case it is missing the whole report is written to one file.
+        """
         super(HtmlExtractor, self).__init__(schedule_id)
         self.template_file_name = TEMPLATE_FILE_NAME
         self.cookies = CookiesInformation(self.session)
-        self.config = json.loads(self.session.query(MuncherConfig).get(self.schedule.config_id).json_params)
+        self.config = json.loads(self.session.query(db.MuncherConfig).get(self.schedule.config_id).json_params)
+        self.page_size = page_size if page_size is not None else self.config.get('report_page_size')
+        if self.page_size is not None and self.page_size <= 0:
+            raise ValueError("The page size should be positive, got {}".format(self.page_size))
 
     def generate_html(self):
         """
-        Loads all of the extracted cookies to the jinja2 template file.
+        Loads all of the extracted cookies to the jinja2 template file, the html is streamed to the output files.
+        :return: The paths of the html files.
         """
         self._extract_cookies()
-        with open(self.template_file_name) as template_file:
-            template = Template(template_file.read())
-            html = template.render(scan_date=self.schedule.start_datetime,
-                                   domain_name=self.config['domains'],
-                                   cookies_count=self.cookies.cookies_count,
-                                   unidentified_cookies_count=len(self.cookies.cookies_by_type['Unknown']),
-                                   cookies_by_types=self.cookies.cookies,
-                                   scan_title=self.schedule.title,
-                                   scan_description=self.schedule.description)
-            with open(OUTPUT_FILE_TEMPLATE.format(self.schedule.title, datetime.datetime.now()), 'w') as output:
-                output.write(html)
+        template = get_template_environment().get_template(self.template_file_name)
+        context = dict(scan_date=self.schedule.start_datetime,
+                       domain_name=self.config['domains'],
+                       cookies_count=self.cookies.cookies_count,
+                       unidentified_cookies_count=len(self.cookies.cookies_by_type.get('Unknown', [])),
+                       scan_title=self.schedule.title,
+                       scan_description=self.schedule.description)
+        now = datetime.datetime.now()
+        if not self.page_size:
+            file_names = [OUTPUT_FILE_TEMPLATE.format(self.schedule.title, now)]
+            pages = [self.cookies.cookies]
+        else:
+            pages = paginate(self.cookies.cookies, self.page_size)
+            file_names = [PAGE_FILE_TEMPLATE.format(self.schedule.title, now, number + 1)
+                          for number in range(len(pages))]
+        page_links = [os.path.basename(file_name) for file_name in file_names] if len(pages) > 1 else []
+        for number, (file_name, page) in enumerate(zip(file_names, pages)):
+            with open(file_name, 'w') as output:
+                template.stream(cookies_by_types=page, page_links=page_links, page_number=number + 1,
+                                **context).dump(output)
+        return file_names
 
     def _extract_cookies(self):
         """
-        Extracts all of the cookies and loads them to cookie container class.
+        Extracts all of the cookies and loads them to cookie container class, from the summary of the schedule in case
+        it was built.
         """
-        urls = self.session.query(UrlScans).filter(UrlScans.schedule_id == self.schedule.id).all()
-        for url in urls:
-            print("extracting data for {}".format(url.url))
-            extracted_cookies = self.session.query(ExtractedCookies).filter(ExtractedCookies.url_id == url.id).all()
-            cookies = [self.session.query(Cookies).get(extracted_cookie.cookie_id) for extracted_cookie
-                       in extracted_cookies]
-            for cookie in cookies:
-                self.cookies.add_cookie(enrich_cookie(cookie, self.session), url.url)
+        summary = load_summary(self.session, self.schedule.id)
+        if summary:
+            for row in summary:
+                self.cookies.add_cookie(summary_cookie(row), row.first_found_url, row.first_found_depth)
+            return
+        current_url_id = None
+        depth = None
+        for row in self.cookie_rows():
+            if row.url_id != current_url_id:
+                current_url_id = row.url_id
+                depth = find_depth_of_url(row.url)
+                print("extracting data for {}".format(row.url))
+            self.cookies.add_cookie(enrich_cookie_row(row), row.url, depth)
 
 
 def main():
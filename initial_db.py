@@ -1,6 +1,9 @@
+import argparse
 import datetime
 
-from db import MuncherSchedule, MuncherConfig, engine
+from cookieMuncher.performance import DEFAULT_PROFILE
+import db
+from sqlalchemy import inspect, Column, DateTime, Index, Integer, MetaData, String, Table, Text
 from sqlalchemy.orm import Session
 import json
 
@@ -9,6 +12,40 @@ DEFAULT_LOG_FOLDER = "logs"
 DEFAULT_OUTPUT_FOLDER = "output"
 
 DEFAULT_DELAY = 0
+DEFAULT_BATCH_SIZE = 100
+DEFAULT_FLUSH_INTERVAL = 5
+DEFAULT_STATS_FLUSH_INTERVAL = 5
+DEFAULT_JOBS_FOLDER = "jobs"
+DEFAULT_PIPELINE_QUEUE_SIZE = 500
+DEFAULT_COOKIE_BATCH_URLS = 20
+DEFAULT_WORKERS = 4
+DEFAULT_MAX_RETRIES = 2
+DEFAULT_DRIVER_MAX_PAGES = 200
+DEFAULT_DRIVER_MAX_MEMORY_MB = 500
+DEFAULT_COOKIE_CACHE_SIZE = 100000
+DEFAULT_COOKIEPEDIA_URL = 'https://cookiepedia.co.uk/cookies/{}'
+DEFAULT_COOKIEPEDIA_CONCURRENCY = 4
+DEFAULT_COOKIEPEDIA_RATE = 5
+DEFAULT_COOKIE_CACHE_TTL = 24 * 60 * 60
+DEFAULT_PAGE_LOAD = {
+    "mode": "browser",
+    "timeout": 30,
+    "settle_time": 1,
+    "blocked_resources": ["image", "font", "stylesheet", "media"],
+    "verify": True
+}
+DEFAULT_METRICS = {
+    "port": None,
+    "snapshot_path": None,
+    "snapshot_interval": 10
+}
+DEFAULT_HTTP_CACHE = {
+    "enabled": False,
+    "dir": "httpcache",
+    "max_size_mb": 1024,
+    "policy": "rfc2616",
+    "expiration_secs": 0
+}
 
 PARAMS = {
     "domain_only": True,
@@ -18,28 +55,166 @@ PARAMS = {
     "log_file": None,
     "logs_folder": DEFAULT_LOG_FOLDER,
     "user_agent": None,
-    "delay": DEFAULT_DELAY
+    "delay": DEFAULT_DELAY,
+    "batch_size": DEFAULT_BATCH_SIZE,
+    "flush_interval": DEFAULT_FLUSH_INTERVAL,
+    "stats_flush_interval": DEFAULT_STATS_FLUSH_INTERVAL,
+    "print_items": True,
+    "checkpoint": True,
+    "jobs_folder": DEFAULT_JOBS_FOLDER,
+    "cookie_cache_size": DEFAULT_COOKIE_CACHE_SIZE,
+    "cookie_cache_ttl": DEFAULT_COOKIE_CACHE_TTL,
+    "cookie_cache_path": None,
+    "internal_only": False,
+    "workers": DEFAULT_WORKERS,
+    "max_retries": DEFAULT_MAX_RETRIES,
+    "driver_max_pages": DEFAULT_DRIVER_MAX_PAGES,
+    "driver_max_memory_mb": DEFAULT_DRIVER_MAX_MEMORY_MB,
+    "cookie_batch_urls": DEFAULT_COOKIE_BATCH_URLS,
+    "dedup_cookies": True,
+    "cookie_hash_value": False,
+    "pipeline_queue_size": DEFAULT_PIPELINE_QUEUE_SIZE,
+    "cookiepedia_url": DEFAULT_COOKIEPEDIA_URL,
+    "cookiepedia_concurrency": DEFAULT_COOKIEPEDIA_CONCURRENCY,
+    "cookiepedia_rate": DEFAULT_COOKIEPEDIA_RATE,
+    "performance": DEFAULT_PROFILE,
+    "http_cache": DEFAULT_HTTP_CACHE,
+    "incremental": False,
+    "previous_schedule": None,
+    "page_load": DEFAULT_PAGE_LOAD,
+    "metrics": DEFAULT_METRICS
+}
+
+# Columns that were added to the existing tables after they were created.
+NEW_COLUMNS = {
+    'tbl_Muncher_Stats': [
+        Column('cookie_cache_hits', Integer),
+        Column('cookie_cache_misses', Integer),
+        Column('metrics_json', Text),
+        Column('report_last_result', String(255)),
+        Column('crawl_heartbeat', DateTime),
+    ],
+    'tblCookies': [
+        Column('cookie_hash', String(40)),
+    ],
+    'tblUrl_Scans': [
+        Column('url_hash', String(40)),
+        Column('content_hash', String(40)),
+    ]
+}
+
+# Indexes that were added to the existing tables, from the index name to its table, columns and uniqueness.
+NEW_INDEXES = {
+    'ix_cookie_hash': ('tblCookies', ['cookie_hash'], True),
+    'ix_url_hash': ('tblUrl_Scans', ['schedule_id', 'url_hash'], False),
 }
 
 
+# Tables that were added to the db after it was created.
+NEW_TABLES = [
+    Table('tblCookie_Summary', MetaData(),
+          Column('id', Integer, primary_key=True),
+          Column('schedule_id', Integer, nullable=False),
+          Column('purpose', String(255)),
+          Column('cookie_name', String(255)),
+          Column('about', Text),
+          Column('cookie_attr', Text),
+          Column('first_found_url', String(2000)),
+          Column('first_found_depth', Integer),
+          Column('url_count', Integer),
+          Column('datetime', DateTime),
+          Index('ix_cookie_summary_schedule', 'schedule_id')),
+]
+
+
 def create_config(session, params=PARAMS):
-    config = MuncherConfig(json_params=json.dumps(params))
+    config = db.MuncherConfig(json_params=json.dumps(params))
     session.add(config)
     session.commit()
     return config
 
 
+def add_missing_columns(engine, new_columns=NEW_COLUMNS):
+    """
+    Adds the columns that don't exist yet in the db tables.
+    :param engine: The engine of the mysql db.
+    :param new_columns: The new columns of each table.
+    """
+    inspector = inspect(engine)
+    for table_name, columns in new_columns.items():
+        existing = {column['name'] for column in inspector.get_columns(table_name)}
+        for column in columns:
+            if column.name not in existing:
+                engine.execute('ALTER TABLE {} ADD COLUMN {} {}'.format(
+                    table_name, column.name, column.type.compile(dialect=engine.dialect)))
+    # The cached snapshot of the schema doesn't contain the new columns.
+    db.invalidate_metadata_cache()
+
+
+def add_missing_indexes(engine, new_indexes=NEW_INDEXES):
+    """
+    Creates the indexes that don't exist yet in the db tables.
+    :param engine: The engine of the mysql db.
+    :param new_indexes: The new indexes, from the index name to its table, columns and uniqueness.
+    """
+    inspector = inspect(engine)
+    for index_name, (table_name, columns, unique) in new_indexes.items():
+        if index_name not in {index['name'] for index in inspector.get_indexes(table_name)}:
+            engine.execute('CREATE {}INDEX {} ON {} ({})'.format('UNIQUE ' if unique else '', index_name, table_name,
+                                                                ', '.join(columns)))
+
+
+def add_missing_tables(engine, new_tables=NEW_TABLES):
+    """
+    Creates the tables that don't exist yet in the db.
+    :param engine: The engine of the mysql db.
+    :param new_tables: The new tables.
+    """
+    for table in new_tables:
+        table.create(engine, checkfirst=True)
+    # The cached snapshot of the schema doesn't contain the new tables.
+    db.invalidate_metadata_cache()
+
+
 def create_schedule(session, user_id, config_id):
-    schedule = MuncherSchedule(user_id=user_id, config_id=config_id, start_datetime=datetime.datetime.now(),
-                               title="Test run",
-                               description="This is a test description, blah blah blah blah blah blah.......... "
-                                           "\n blah blah blah blah blah blah.....")
+    schedule = db.MuncherSchedule(user_id=user_id, config_id=config_id, start_datetime=datetime.datetime.now(),
+                                  title="Test run",
+                                  description="This is a test description, blah blah blah blah blah blah.......... "
+                                              "\n blah blah blah blah blah blah.....")
     session.add(schedule)
     session.commit()
 
 
-if __name__ == '__main__':
+def migrate(engine):
+    """
+    Brings the schema of an existing db up to date, no rows are added.
+    :param engine: The engine of the mysql db.
+    """
+    add_missing_tables(engine)
+    add_missing_columns(engine)
+    add_missing_indexes(engine)
+
+
+def seed(engine):
+    """
+    Adds a test config with the default params and a schedule that uses it.
+    :param engine: The engine of the mysql db.
+    """
     session = Session(engine)
     config = create_config(session)
     create_schedule(session, 2, config.id)
     session.close()
+
+
+def create_parser():
+    parser = argparse.ArgumentParser(description="Migrates the schema of the muncher db and / or seeds a test run.")
+    parser.add_argument('--migrate', dest='migrate', action='store_true',
+                        help="Only add the missing tables, columns and indexes, without the test config and schedule.")
+    return parser
+
+
+if __name__ == '__main__':
+    parser_args = create_parser().parse_args()
+    migrate(db.engine)
+    if not parser_args.migrate:
+        seed(db.engine)
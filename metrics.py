@@ -0,0 +1,263 @@
+"""
+Timings and counters of the hot paths (crawling, db flushes, page loads, cookiepedia lookups) while a run is in
+progress. The metrics are kept in a process wide registry, exposed on a local prometheus style text endpoint and / or a
+periodic json snapshot file, and rolled up into the muncher stats once the run ends. The crawls of a process that
+crawls several schedules also keep their own registry, so every schedule is rolled up with only its own metrics.
+"""
+import bisect
+import json
+import logging
+import threading
+import time
+from contextlib import contextmanager
+from http.server import BaseHTTPRequestHandler, HTTPServer
+
+PREFIX = 'cookiemuncher_'
+# The upper bounds in seconds of the histogram buckets.
+DEFAULT_BUCKETS = [0.005, 0.01, 0.025, 0.05, 0.1, 0.25, 0.5, 1, 2.5, 5, 10, 30, 60]
+DEFAULT_SNAPSHOT_INTERVAL = 10
+
+
+class Histogram(object):
+    def __init__(self, buckets=DEFAULT_BUCKETS):
+        self.buckets = list(buckets)
+        # The last bucket holds the values above all of the bounds.
+        self.counts = [0] * (len(self.buckets) + 1)
+        self.count = 0
+        self.sum = 0.0
+        self.max = 0.0
+
+    def observe(self, value):
+        self.counts[bisect.bisect_left(self.buckets, value)] += 1
+        self.count += 1
+        self.sum += value
+        self.max = max(self.max, value)
+
+    def quantile(self, q):
+        """
+        :param q: The quantile, between 0 and 1.
+        :return: The upper bound of the bucket of the quantile, the maximal value in case it is above all of the
+        bounds.
+        """
+        if not self.count:
+            return 0
+        rank = q * self.count
+        cumulative = 0
+        for bound, count in zip(self.buckets, self.counts):
+            cumulative += count
+            if cumulative >= rank:
+                return bound
+        return self.max
+
+    def to_dict(self):
+        return {'count': self.count, 'sum': round(self.sum, 4),
+                'avg': round(self.sum / self.count, 4) if self.count else 0,
+                'p50': self.quantile(0.5), 'p95': self.quantile(0.95), 'max': round(self.max, 4)}
+
+
+class Registry(object):
+    """
+    The counters and histograms of a process, safe to update from several threads.
+    """
+
+    def __init__(self, parent=None):
+        """
+        :param Registry parent: A registry that gets every update as well, for example the process wide registry
+        of the registry of a single schedule.
+        """
+        self.parent = parent
+        self._lock = threading.Lock()
+        self.reset()
+
+    def reset(self):
+        with self._lock:
+            self.started_at = time.time()
+            self.counters = {}
+            self.histograms = {}
+
+    def increment(self, name, amount=1):
+        with self._lock:
+            self.counters[name] = self.counters.get(name, 0) + amount
+        if self.parent is not None:
+            self.parent.increment(name, amount)
+
+    def observe(self, name, value):
+        with self._lock:
+            if name not in self.histograms:
+                self.histograms[name] = Histogram()
+            self.histograms[name].observe(value)
+        if self.parent is not None:
+            self.parent.observe(name, value)
+
+    @contextmanager
+    def timer(self, name):
+        """
+        Observes the amount of seconds the block took in the histogram of the name.
+        """
+        start = time.time()
+        try:
+            yield
+        finally:
+            self.observe(name, time.time() - start)
+
+    def snapshot(self):
+        """
+        :return: A json serializable dict of the current metrics.
+        """
+        with self._lock:
+            uptime = time.time() - self.started_at
+            return {
+                'uptime_seconds': round(uptime, 2),
+                'counters': dict(self.counters),
+                'per_second': {name: round(value / uptime, 4) if uptime else 0
+                               for name, value in self.counters.items()},
+                'histograms': {name: histogram.to_dict() for name, histogram in self.histograms.items()},
+            }
+
+    def prometheus_text(self):
+        """
+        :return: The metrics in the prometheus text exposition format.
+        """
+        lines = []
+        with self._lock:
+            for name, value in sorted(self.counters.items()):
+                metric = '{}{}_total'.format(PREFIX, name)
+                lines += ['# TYPE {} counter'.format(metric), '{} {}'.format(metric, value)]
+            for name, histogram in sorted(self.histograms.items()):
+                metric = PREFIX + name
+                lines.append('# TYPE {} histogram'.format(metric))
+                cumulative = 0
+                for bound, count in zip(histogram.buckets + ['+Inf'], histogram.counts):
+                    cumulative += count
+                    lines.append('{}_bucket{{le="{}"}} {}'.format(metric, bound, cumulative))
+                lines += ['{}_sum {}'.format(metric, histogram.sum), '{}_count {}'.format(metric, histogram.count)]
+        return '\n'.join(lines) + '\n'
+
+
+REGISTRY = Registry()
+increment = REGISTRY.increment
+observe = REGISTRY.observe
+timer = REGISTRY.timer
+
+_schedule_registries = {}
+_schedule_registries_lock = threading.Lock()
+
+
+def schedule_registry(schedule_id):
+    """
+    :param schedule_id: The id of the schedule.
+    :return: The registry of the metrics of the schedule, its updates are counted in the process wide registry too.
+    """
+    with _schedule_registries_lock:
+        if schedule_id not in _schedule_registries:
+            _schedule_registries[schedule_id] = Registry(parent=REGISTRY)
+        return _schedule_registries[schedule_id]
+
+
+def create_handler(registry):
+    class MetricsHandler(BaseHTTPRequestHandler):
+        def do_GET(self):
+            if self.path == '/metrics':
+                body, content_type = registry.prometheus_text(), 'text/plain; version=0.0.4'
+            elif self.path == '/metrics.json':
+                body, content_type = json.dumps(registry.snapshot()), 'application/json'
+            else:
+                self.send_error(404)
+                return
+            body = body.encode()
+            self.send_response(200)
+            self.send_header('Content-Type', content_type)
+            self.send_header('Content-Length', str(len(body)))
+            self.end_headers()
+            self.wfile.write(body)
+
+        def log_message(self, format, *args):
+            pass
+
+    return MetricsHandler
+
+
+class MetricsReporter(object):
+    """
+    Serves the metrics on http://127.0.0.1:<port>/metrics (and /metrics.json) and / or writes a json snapshot to a
+    file every interval, both in background threads.
+    """
+
+    def __init__(self, registry=REGISTRY, port=None, snapshot_path=None, snapshot_interval=DEFAULT_SNAPSHOT_INTERVAL):
+        """
+        :param Registry registry: The registry of the reported metrics.
+        :param port: The port of the http endpoint, None means no endpoint.
+        :param snapshot_path: The path of the json snapshot file, None means no snapshot.
+        :param snapshot_interval: The amount of seconds between the snapshots.
+        """
+        self.registry = registry
+        self.snapshot_path = snapshot_path
+        self.snapshot_interval = snapshot_interval
+        self._stop = threading.Event()
+        self._server = None
+        if port is not None:
+            try:
+                self._server = HTTPServer(('127.0.0.1', port), create_handler(registry))
+            except OSError as e:
+                # For example when several processes are configured with the same port.
+                logging.error("failed serving the metrics on port {}: {}".format(port, e))
+        self._threads = []
+
+    @property
+    def port(self):
+        return self._server.server_address[1] if self._server else None
+
+    def start(self):
+        if self._server:
+            self._threads.append(threading.Thread(target=self._server.serve_forever, name='metrics-server',
+                                                  daemon=True))
+        if self.snapshot_path:
+            self._threads.append(threading.Thread(target=self._write_snapshots, name='metrics-snapshot',
+                                                  daemon=True))
+        for thread in self._threads:
+            thread.start()
+        return self
+
+    def _write_snapshots(self):
+        while not self._stop.wait(self.snapshot_interval):
+            self.write_snapshot()
+
+    def write_snapshot(self):
+        try:
+            with open(self.snapshot_path, 'w') as snapshot_file:
+                json.dump(self.registry.snapshot(), snapshot_file, indent=2)
+        except IOError as e:
+            logging.error("failed writing the metrics snapshot: {}".format(e))
+
+    def stop(self):
+        self._stop.set()
+        if self._server:
+            self._server.shutdown()
+            self._server.server_close()
+        if self.snapshot_path:
+            self.write_snapshot()
+
+
+def start_reporting(params=None, registry=REGISTRY):
+    """
+    :param params: The metrics section of the config json, may be None. Its params are port, snapshot_path and
+    snapshot_interval.
+    :param Registry registry: The registry of the reported metrics.
+    :return: The started reporter.
+    """
+    params = dict(params.items()) if params else {}
+    return MetricsReporter(registry, port=params.get('port'), snapshot_path=params.get('snapshot_path'),
+                           snapshot_interval=params.get('snapshot_interval', DEFAULT_SNAPSHOT_INTERVAL)).start()
+
+
+def roll_up(stats, section, registry=REGISTRY):
+    """
+    Saves the snapshot of the metrics in the metrics_json column of the stats, under the section of the run so the
+    crawl and the cookie extraction of a schedule don't override each other.
+    :param stats: The stats of the schedule.
+    :param section: The name of the run, for example 'crawl'.
+    :param Registry registry: The registry of the metrics.
+    """
+    metrics = json.loads(stats.metrics_json) if stats.metrics_json else {}
+    metrics[section] = registry.snapshot()
+    stats.metrics_json = json.dumps(metrics)
@@ -0,0 +1,431 @@
+"""
+A long running service that processes the pending schedules on its own instead of running process1, process2 and the
+extractors by hand for every schedule.
+The db is polled for schedules whose crawl, cookie extraction or reports haven't finished, several schedules are
+processed at the same time with a limit on the amount of schedules crawling the same domain.
+Every crawl runs in its own process since the twisted reactor can't be restarted, the cookie extraction and the
+reports run in a pool of long lived worker processes which keep their cookie info cache warm between schedules.
+The status of the reports and the heartbeat of the running crawls are kept in the stats, run initial_db.py --migrate
+first. A schedule that is being crawled by another process (a fresh heartbeat) is left alone.
+"""
+import argparse
+import datetime
+import json
+import logging
+import multiprocessing
+import os
+import signal
+import subprocess
+import sys
+import threading
+import time
+from collections import Counter
+from concurrent.futures import ProcessPoolExecutor, ThreadPoolExecutor
+from concurrent.futures.process import BrokenProcessPool
+from urllib.parse import urlparse
+
+from sqlalchemy import and_, not_, or_
+from sqlalchemy.orm import Session
+
+from cookie_cache import create_cookie_cache
+import db
+from stats_accumulator import DEFAULT_HEARTBEAT_INTERVAL
+from utils import check_directory_exists
+
+FINISHED = 'finished'
+PENDING = 'pending'
+ABORTED = 'aborted'
+CRAWL = 'crawl'
+COOKIES = 'cookies'
+REPORTS = 'reports'
+
+DEFAULT_WORKERS = 2
+DEFAULT_PER_DOMAIN = 1
+DEFAULT_POLL_INTERVAL = 30
+DEFAULT_MAX_RETRIES = 2
+DEFAULT_RETRY_DELAY = 60
+# The amount of seconds without a heartbeat after which a crawl is considered stopped.
+HEARTBEAT_GRACE = 3 * DEFAULT_HEARTBEAT_INTERVAL
+DEFAULT_LOG_FILE = os.path.join('orchestrator_logs', 'orchestrator.log')
+PROCESS1_PATH = os.path.join(os.path.dirname(os.path.abspath(__file__)), 'process1.py')
+
+# The cookie info cache of a worker process, shared by all of the schedules the process handles.
+_cookie_cache = None
+
+
+def create_parser():
+    """
+    Creates the parser with all of the expected arguments.
+    :return: The configured parser instance.
+    """
+    parser = argparse.ArgumentParser(description="Processes the pending schedules in the background.")
+    parser.add_argument('-w', '--workers', dest='workers', type=int, default=DEFAULT_WORKERS,
+                        help="The maximal amount of schedules processed at the same time.")
+    parser.add_argument('--per-domain', dest='per_domain', type=int, default=DEFAULT_PER_DOMAIN,
+                        help="The maximal amount of schedules crawling the same domain at the same time.")
+    parser.add_argument('--poll-interval', dest='poll_interval', type=float, default=DEFAULT_POLL_INTERVAL,
+                        help="The amount of seconds between the checks for pending schedules.")
+    parser.add_argument('--max-retries', dest='max_retries', type=int, default=DEFAULT_MAX_RETRIES,
+                        help="The amount of times a failed schedule is retried.")
+    parser.add_argument('--retry-delay', dest='retry_delay', type=float, default=DEFAULT_RETRY_DELAY,
+                        help="The amount of seconds before the first retry, doubled on every retry.")
+    parser.add_argument('--since', dest='since', type=int, default=0,
+                        help="Only schedules with an id of at least this value are processed.")
+    parser.add_argument('--os', dest='os', type=str, default='linux_64',
+                        choices=['linux_64', 'linux_32', 'mac', 'windows'],
+                        help="Choose which operation system the script will run "
+                             "(this is relevant for the headless browser driver).")
+    parser.add_argument('--metrics-file', dest='metrics_file', type=str, default=None,
+                        help="A json file to which the metrics are written after every poll.")
+    parser.add_argument('--log-file', dest='log_file', type=str, default=DEFAULT_LOG_FILE,
+                        help="The path to the log file.")
+    return parser
+
+
+def next_stage(stats):
+    """
+    :param stats: The stats of the schedule, None in case it wasn't crawled yet.
+    :return: The first stage of the schedule that hasn't finished, None in case the schedule was fully processed.
+    """
+    if stats is None or stats.url_last_result != FINISHED:
+        return CRAWL
+    if stats.cookie_last_result != FINISHED:
+        return COOKIES
+    # The schedules whose reports were generated before the orchestrator tracked them have no report status.
+    if stats.report_last_result not in (None, FINISHED):
+        return REPORTS
+    return None
+
+
+def schedule_domains(config):
+    """
+    :param config: The config of the schedule.
+    :return: The net locations of the domains the schedule crawls.
+    """
+    return {urlparse(domain).netloc for domain in json.loads(config.json_params)['domains'].split()}
+
+
+def extract_schedule(schedule_id, os_system):
+    """
+    Extracts the cookies of the schedule, runs in the worker processes.
+    :param schedule_id: The id of the schedule.
+    :param os_system: The operation system the script runs on.
+    :return: The result of the cookie extraction.
+    """
+    global _cookie_cache
+    import process2
+    if _cookie_cache is None:
+        # Only kept in memory, the worker processes can't share a single on disk store.
+        _cookie_cache = create_cookie_cache()
+        _cookie_cache.warm(process2.session)
+        process2.session.commit()
+    return process2.process_schedule(schedule_id, os_system, cache=_cookie_cache)
+
+
+def generate_reports(schedule_id):
+    """
+    Generates the csv and html reports of the schedule, runs in the worker processes.
+    :param schedule_id: The id of the schedule.
+    """
+    from csv_extractor import CsvExtractor
+    from html_extractor import HtmlExtractor
+    csv_extractor = CsvExtractor(schedule_id)
+    try:
+        csv_extractor.extract()
+    finally:
+        csv_extractor.close()
+        csv_extractor.session.close()
+    html_extractor = HtmlExtractor(schedule_id)
+    try:
+        html_extractor.generate_html()
+    finally:
+        html_extractor.session.close()
+
+
+class Job(object):
+    def __init__(self, schedule_id, domains):
+        self.schedule_id = schedule_id
+        self.domains = domains
+        self.attempts = 0
+        self.retry_at = 0
+
+
+class Metrics(object):
+    """
+    Counts the schedules that went through the orchestrator, safe to update from several threads.
+    """
+
+    def __init__(self):
+        self.started_at = time.time()
+        self.counters = Counter()
+        self.stage_seconds = Counter()
+        self.queue_depth = 0
+        self.running = 0
+        self._lock = threading.Lock()
+
+    def increment(self, name, amount=1):
+        with self._lock:
+            self.counters[name] += amount
+
+    def add_stage_time(self, stage, seconds):
+        with self._lock:
+            self.counters['{}_runs'.format(stage)] += 1
+            self.stage_seconds[stage] += seconds
+
+    def snapshot(self):
+        """
+        :return: A json serializable dict of the current metrics.
+        """
+        with self._lock:
+            uptime = time.time() - self.started_at
+            return {
+                'uptime_seconds': round(uptime),
+                'queue_depth': self.queue_depth,
+                'running': self.running,
+                'counters': dict(self.counters),
+                'schedules_per_hour': round(self.counters['completed'] * 3600 / uptime, 2) if uptime else 0,
+                'average_stage_seconds': {stage: round(seconds / self.counters['{}_runs'.format(stage)], 2)
+                                          for stage, seconds in self.stage_seconds.items()},
+            }
+
+
+class Orchestrator(object):
+    def __init__(self, workers=DEFAULT_WORKERS, per_domain=DEFAULT_PER_DOMAIN, poll_interval=DEFAULT_POLL_INTERVAL,
+                 max_retries=DEFAULT_MAX_RETRIES, retry_delay=DEFAULT_RETRY_DELAY, since=0, os_system='linux_64',
+                 metrics_file=None):
+        """
+        :param workers: The maximal amount of schedules processed at the same time.
+        :param per_domain: The maximal amount of schedules crawling the same domain at the same time.
+        :param poll_interval: The amount of seconds between the checks for pending schedules.
+        :param max_retries: The amount of times a failed schedule is retried, after that it is skipped until the
+        orchestrator is restarted.
+        :param retry_delay: The amount of seconds before the first retry, doubled on every retry.
+        :param since: Only schedules with an id of at least this value are processed.
+        :param os_system: The operation system the script runs on.
+        :param metrics_file: A json file to which the metrics are written after every poll.
+        """
+        self.workers = workers
+        self.per_domain = per_domain
+        self.poll_interval = poll_interval
+        self.max_retries = max_retries
+        self.retry_delay = retry_delay
+        self.since = since
+        self.os_system = os_system
+        self.metrics_file = metrics_file
+        self.metrics = Metrics()
+        self.jobs = {}
+        self.running = set()
+        self.failed = set()
+        self.domain_counts = Counter()
+        self._lock = threading.Lock()
+        self._stop = threading.Event()
+        self._threads = ThreadPoolExecutor(max_workers=workers)
+        self._processes = self._create_processes()
+
+    def _create_processes(self):
+        # Spawned so the workers don't inherit the connections of the orchestrator.
+        return ProcessPoolExecutor(max_workers=self.workers, mp_context=multiprocessing.get_context('spawn'))
+
+    def pending_schedules(self, session):
+        """
+        :param Session session: The session with the mysql db.
+        :return: The (id, domains) of the schedules whose crawl, cookie extraction or reports haven't finished,
+        ordered by id. The schedules that are being crawled by another process are left out.
+        """
+        crawling = and_(db.MuncherStats.crawl_heartbeat.isnot(None),
+                        db.MuncherStats.crawl_heartbeat > datetime.datetime.now() - datetime.timedelta(
+                            seconds=HEARTBEAT_GRACE),
+                        or_(db.MuncherStats.url_last_result.is_(None), db.MuncherStats.url_last_result != FINISHED))
+        rows = session.query(db.MuncherSchedule.id, db.MuncherConfig) \
+            .join(db.MuncherConfig, db.MuncherConfig.id == db.MuncherSchedule.config_id) \
+            .outerjoin(db.MuncherStats, db.MuncherStats.schedule_id == db.MuncherSchedule.id) \
+            .filter(db.MuncherSchedule.id >= self.since,
+                    or_(db.MuncherStats.id.is_(None),
+                        db.MuncherStats.url_last_result.is_(None), db.MuncherStats.url_last_result != FINISHED,
+                        db.MuncherStats.cookie_last_result.is_(None), db.MuncherStats.cookie_last_result != FINISHED,
+                        db.MuncherStats.report_last_result != FINISHED),
+                    not_(crawling)) \
+            .order_by(db.MuncherSchedule.id).all()
+        return [(schedule_id, schedule_domains(config)) for schedule_id, config in rows]
+
+    def dispatch(self, session):
+        """
+        Starts processing the pending schedules as long as there are free workers and their domains are below the
+        concurrency limit.
+        :param Session session: The session with the mysql db.
+        """
+        now = time.time()
+        waiting = 0
+        for schedule_id, domains in self.pending_schedules(session):
+            with self._lock:
+                if schedule_id in self.running or schedule_id in self.failed:
+                    continue
+                job = self.jobs.setdefault(schedule_id, Job(schedule_id, domains))
+                if job.retry_at > now or len(self.running) >= self.workers or \
+                        any(self.domain_counts[domain] >= self.per_domain for domain in domains):
+                    waiting += 1
+                    continue
+                self.running.add(schedule_id)
+                self.domain_counts.update(domains)
+            self._threads.submit(self._process, job)
+        session.commit()
+        with self._lock:
+            self.metrics.queue_depth = waiting
+            self.metrics.running = len(self.running)
+
+    def _process(self, job):
+        """
+        Runs the stages of the schedule that haven't finished yet, a failed schedule is retried later. The domains
+        of the schedule only count towards the concurrency limit while it crawls.
+        :param Job job: The schedule being processed.
+        """
+        session = Session(db.engine)
+        crawling = True
+        try:
+            self.metrics.increment('started')
+            stats = session.query(db.MuncherStats).filter(db.MuncherStats.schedule_id == job.schedule_id).scalar()
+            stage = next_stage(stats)
+            if stage is None:
+                return
+            if stage == CRAWL:
+                self._timed(CRAWL, self._crawl, job.schedule_id, stats is not None)
+                session.expire_all()
+                stats = session.query(db.MuncherStats).filter(
+                    db.MuncherStats.schedule_id == job.schedule_id).scalar()
+                if stats is None or stats.url_last_result != FINISHED:
+                    raise RuntimeError("the crawl ended with {}".format(stats and stats.url_last_result))
+                stage = COOKIES
+            crawling = False
+            self._release_domains(job)
+            session.close()
+            if stage == COOKIES:
+                # Marked before the extraction so the reports are retried in case the orchestrator stops in between.
+                self._set_report_result(session, job.schedule_id, PENDING)
+                result = self._timed(COOKIES, self._run_in_worker, extract_schedule, job.schedule_id, self.os_system)
+                if result != FINISHED:
+                    raise RuntimeError("the cookie extraction ended with {}".format(result))
+            try:
+                self._timed(REPORTS, self._run_in_worker, generate_reports, job.schedule_id)
+            except Exception:
+                self._set_report_result(session, job.schedule_id, ABORTED)
+                raise
+            self._set_report_result(session, job.schedule_id, FINISHED)
+            self.metrics.increment('completed')
+            logging.info("schedule {} finished".format(job.schedule_id))
+        except Exception as e:
+            self._failed(job, e)
+        finally:
+            session.close()
+            if crawling:
+                self._release_domains(job)
+            with self._lock:
+                self.running.discard(job.schedule_id)
+
+    def _release_domains(self, job):
+        with self._lock:
+            self.domain_counts.subtract(job.domains)
+
+    @staticmethod
+    def _set_report_result(session, schedule_id, result):
+        session.query(db.MuncherStats).filter(db.MuncherStats.schedule_id == schedule_id) \
+            .update({'report_last_result': result}, synchronize_session=False)
+        session.commit()
+        session.close()
+
+    def _run_in_worker(self, function, *args):
+        """
+        Runs the function in the worker processes, the pool is replaced in case a worker process died.
+        :return: The result of the function.
+        """
+        with self._lock:
+            processes = self._processes
+        try:
+            return processes.submit(function, *args).result()
+        except BrokenProcessPool:
+            with self._lock:
+                if self._processes is processes:
+                    logging.warning("a worker process died, starting new worker processes")
+                    self._processes = self._create_processes()
+            processes.shutdown(wait=False)
+            raise
+
+    def _crawl(self, schedule_id, resume):
+        """
+        Crawls the schedule in a new process.
+        :param schedule_id: The id of the schedule.
+        :param resume: If True continues the previous crawl of the schedule.
+        """
+        command = [sys.executable, PROCESS1_PATH, '-i', str(schedule_id)] + (['--resume'] if resume else [])
+        subprocess.run(command, check=True)
+
+    def _timed(self, stage, function, *args):
+        start = time.time()
+        try:
+            return function(*args)
+        finally:
+            self.metrics.add_stage_time(stage, time.time() - start)
+
+    def _failed(self, job, error):
+        job.attempts += 1
+        if job.attempts > self.max_retries:
+            logging.error("schedule {} failed, giving up after {} attempts: {}".format(job.schedule_id, job.attempts,
+                                                                                      error))
+            self.metrics.increment('failed')
+            with self._lock:
+                self.failed.add(job.schedule_id)
+            return
+        job.retry_at = time.time() + self.retry_delay * 2 ** (job.attempts - 1)
+        logging.warning("schedule {} failed, retrying later: {}".format(job.schedule_id, error))
+        self.metrics.increment('retried')
+
+    def write_metrics(self):
+        snapshot = self.metrics.snapshot()
+        logging.info("metrics: {}".format(json.dumps(snapshot)))
+        if self.metrics_file:
+            with open(self.metrics_file, 'w') as metrics_file:
+                json.dump(snapshot, metrics_file, indent=2)
+
+    def run(self):
+        """
+        Polls the db for pending schedules until stop() is called, then waits for the running schedules.
+        """
+        session = Session(db.engine)
+        try:
+            while not self._stop.is_set():
+                try:
+                    self.dispatch(session)
+                except Exception as e:
+                    logging.error("failed polling the schedules: {}".format(e))
+                    session.rollback()
+                self.write_metrics()
+                self._stop.wait(self.poll_interval)
+        finally:
+            session.close()
+            self._threads.shutdown(wait=True)
+            self._processes.shutdown(wait=True)
+            self.write_metrics()
+
+    def stop(self, *_):
+        self._stop.set()
+
+
+def main():
+    parser_args = create_parser().parse_args()
+    if not hasattr(db.MuncherStats, 'report_last_result') or not hasattr(db.MuncherStats, 'crawl_heartbeat'):
+        print("The stats table has no report status or heartbeat column, run initial_db.py --migrate first")
+        return
+    check_directory_exists(os.path.dirname(parser_args.log_file) or '.')
+    logging.basicConfig(filename=parser_args.log_file, level=logging.INFO,
+                        format='%(asctime)s %(levelname)s %(message)s')
+    orchestrator = Orchestrator(workers=parser_args.workers, per_domain=parser_args.per_domain,
+                                poll_interval=parser_args.poll_interval, max_retries=parser_args.max_retries,
+                                retry_delay=parser_args.retry_delay, since=parser_args.since,
+                                os_system=parser_args.os, metrics_file=parser_args.metrics_file)
+    signal.signal(signal.SIGTERM, orchestrator.stop)
+    signal.signal(signal.SIGINT, orchestrator.stop)
+    logging.info("orchestrator started at {}".format(datetime.datetime.now()))
+    orchestrator.run()
+
+
+if __name__ == '__main__':
+    main()
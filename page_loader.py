@@ -0,0 +1,189 @@
+"""
+The ways a page is loaded for extracting its cookies, the "page_load" section of the config json.
+browser - The page and all of its resources are loaded in phantomJS.
+fast - The page is loaded in phantomJS without the heavy resources that don't set cookies (images, fonts, stylesheets,
+       media), the load is cut after a timeout and the cookies set by scripts are given a settle window.
+http - Only the Set-Cookie headers of the page and its redirects are captured, no javascript is run.
+"""
+import time
+from email.utils import formatdate
+
+import requests
+from selenium import webdriver
+from selenium.common.exceptions import TimeoutException
+from selenium.webdriver.common.desired_capabilities import DesiredCapabilities
+
+from browser_pool import extract_cookies
+
+BROWSER = 'browser'
+FAST = 'fast'
+HTTP = 'http'
+MODES = [BROWSER, FAST, HTTP]
+
+# The url patterns of the resources of every type, phantomJS doesn't report the type of a requested resource.
+RESOURCE_PATTERNS = {
+    'image': r'\.(png|jpe?g|gif|bmp|svg|webp|ico)(\?|$)',
+    'font': r'\.(woff2?|ttf|otf|eot)(\?|$)',
+    'stylesheet': r'\.css(\?|$)',
+    'media': r'\.(mp4|webm|ogg|mp3|wav|avi|mov)(\?|$)',
+}
+DEFAULT_BLOCKED_RESOURCES = ['image', 'font', 'stylesheet', 'media']
+DEFAULT_PAGE_TIMEOUT = 30
+DEFAULT_SETTLE_TIME = 1
+DEFAULT_VERIFY = True
+
+# Runs inside phantomJS with the page as this, aborts the requests of the blocked resources.
+BLOCK_RESOURCES_SCRIPT = """
+var patterns = arguments[0].map(function (pattern) { return new RegExp(pattern, 'i'); });
+this.onResourceRequested = function (requestData, networkRequest) {
+    for (var i = 0; i < patterns.length; i++) {
+        if (patterns[i].test(requestData.url)) {
+            networkRequest.abort();
+            return;
+        }
+    }
+};
+"""
+EXECUTE_PHANTOM_SCRIPT = 'executePhantomScript'
+# The cookies of the page only include the cookies visible to its url, the whole cookie jar is cleared from phantom.
+CLEAR_COOKIES_SCRIPT = 'phantom.clearCookies();'
+CLEAR_STORAGE_SCRIPT = 'try { window.localStorage.clear(); window.sessionStorage.clear(); } catch (e) {}'
+
+
+def create_browser(driver_path, log_file, blocked_resources=(), page_timeout=None):
+    """
+    :param driver_path: the path to the driver.
+    :param log_file: The path to the log file of the driver.
+    :param blocked_resources: The types of the resources that aren't loaded.
+    :param page_timeout: The maximal amount of seconds a page is loaded, None means no limit.
+    :return: A new phantomJS driver.
+    """
+    capabilities = dict(DesiredCapabilities.PHANTOMJS)
+    if 'image' in blocked_resources:
+        capabilities['phantomjs.page.settings.loadImages'] = False
+    driver = webdriver.PhantomJS(executable_path=driver_path, service_log_path=log_file,
+                                 desired_capabilities=capabilities)
+    driver.command_executor._commands[EXECUTE_PHANTOM_SCRIPT] = ('POST', '/session/$sessionId/phantom/execute')
+    if page_timeout:
+        driver.set_page_load_timeout(page_timeout)
+    if blocked_resources:
+        driver.execute(EXECUTE_PHANTOM_SCRIPT, {
+            'script': BLOCK_RESOURCES_SCRIPT,
+            'args': [[RESOURCE_PATTERNS[resource] for resource in blocked_resources]]})
+    return driver
+
+
+def reset_browser(driver):
+    """
+    Clears the cookies and the storage the previous page left in the browser.
+    :param driver: The phantomJS driver.
+    """
+    driver.execute_script(CLEAR_STORAGE_SCRIPT)
+    driver.execute(EXECUTE_PHANTOM_SCRIPT, {'script': CLEAR_COOKIES_SCRIPT, 'args': []})
+
+
+def create_fast_load(settle_time=DEFAULT_SETTLE_TIME):
+    """
+    :param settle_time: The amount of seconds the scripts of the page get for setting cookies after it loaded.
+    :return: A callable that receives a driver and a url and returns the cookies of the url.
+    """
+    def load(driver, url):
+        try:
+            driver.get(url)
+        except TimeoutException:
+            # The page took too long, the cookies that were already set are still returned.
+            pass
+        if settle_time:
+            time.sleep(settle_time)
+        return driver.get_cookies()
+    return load
+
+
+def is_http_only(cookie):
+    """
+    :param http.cookiejar.Cookie cookie: A cookie from a Set-Cookie header.
+    :return: True in case the header has the HttpOnly flag, the cookie jar keeps the name of the flag as the site
+    spelled it.
+    """
+    return any(name.lower() == 'httponly' for name in cookie._rest)
+
+
+def cookie_to_json(cookie):
+    """
+    :param http.cookiejar.Cookie cookie: A cookie from a Set-Cookie header.
+    :return: The cookie in the json form of the browser cookies.
+    """
+    cookie_json = {'name': cookie.name, 'value': cookie.value, 'domain': cookie.domain, 'path': cookie.path,
+                   'secure': bool(cookie.secure), 'httponly': is_http_only(cookie)}
+    if cookie.expires is not None:
+        cookie_json['expiry'] = cookie.expires
+        cookie_json['expires'] = formatdate(cookie.expires, usegmt=True)
+    return cookie_json
+
+
+class HttpFetcher(object):
+    """
+    Fetches the pages with plain http requests, takes the place of the browser driver in the http mode.
+    """
+
+    def __init__(self, timeout=DEFAULT_PAGE_TIMEOUT, verify=DEFAULT_VERIFY):
+        """
+        :param timeout: The timeout in seconds of every request.
+        :param verify: Whether to verify the certificates of the sites.
+        """
+        self.timeout = timeout
+        self.verify = verify
+        self.http = requests.Session()
+
+    def get_cookies(self, url):
+        """
+        :param url: The url to fetch.
+        :return: The json cookies set by the page and its redirects.
+        """
+        self.http.get(url, timeout=self.timeout, verify=self.verify)
+        return [cookie_to_json(cookie) for cookie in self.http.cookies]
+
+    def reset(self):
+        self.http.cookies.clear()
+
+    def quit(self):
+        self.http.close()
+
+
+def fetch_over_http(fetcher, url):
+    return fetcher.get_cookies(url)
+
+
+def reset_http(fetcher):
+    fetcher.reset()
+
+
+def create_page_loader(params, driver_path, log_file):
+    """
+    Validates the page load section of the config.
+    :param params: The page_load section of the config json, may be None. Its params are mode, timeout, settle_time,
+    blocked_resources and verify (whether the http mode verifies the certificates of the sites).
+    :param driver_path: the path to the driver.
+    :param log_file: The path to the log file of the driver.
+    :return: A callable that creates a new driver, a callable that receives a driver and a url and returns the
+    cookies of the url, and a callable that clears the state a page left in the driver.
+    """
+    params = dict(params.items()) if params else {}
+    mode = params.get('mode', BROWSER)
+    if mode not in MODES:
+        raise ValueError("Unknown page load mode {}, should be one of {}".format(mode, ', '.join(MODES)))
+    timeout = params.get('timeout', DEFAULT_PAGE_TIMEOUT)
+    if mode == HTTP:
+        verify = params.get('verify', DEFAULT_VERIFY)
+        if not isinstance(verify, bool):
+            raise ValueError("The page load param verify should be true or false, got {!r}".format(verify))
+        return lambda: HttpFetcher(timeout, verify), fetch_over_http, reset_http
+    if mode == BROWSER:
+        return lambda: create_browser(driver_path, log_file), extract_cookies, reset_browser
+    blocked_resources = list(params.get('blocked_resources', DEFAULT_BLOCKED_RESOURCES))
+    unknown = set(blocked_resources) - set(RESOURCE_PATTERNS)
+    if unknown:
+        raise ValueError("Unknown resource types: {}, should be any of {}".format(
+            ', '.join(sorted(unknown)), ', '.join(RESOURCE_PATTERNS)))
+    return lambda: create_browser(driver_path, log_file, blocked_resources, timeout), \
+        create_fast_load(params.get('settle_time', DEFAULT_SETTLE_TIME)), reset_browser
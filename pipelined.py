@@ -0,0 +1,122 @@
+"""
+Runs the crawling (process1) and the cookie extraction (process2) of a schedule at the same time.
+Every url the crawler saves is fed through a bounded queue to the browser workers, when the extraction falls behind
+the queue fills up and the crawler slows down.
+"""
+import argparse
+import datetime
+import json
+import logging
+import queue
+import shutil
+import threading
+
+from dotmap import DotMap
+from sqlalchemy.orm import Session
+
+import process2
+from cookie_summary import clear_summary
+import db
+import metrics
+from process1 import create_muncher_stats, format_arguments, generate_job_dir, crawl_schedule, FINISHED
+from stats_accumulator import Heartbeat
+from utils import get_param
+
+DEFAULT_QUEUE_SIZE = 500
+ABORTED = 'aborted'
+
+
+def create_parser():
+    """
+    Creates the parser with all of the expected arguments.
+    :return: The configured parser instance.
+    """
+    parser = argparse.ArgumentParser(description="Crawls a schedule and extracts its cookies at the same time.")
+    parser.add_argument('-i', '--id', dest='id', required=True, type=int,
+                        help="The id of the MuncherSchedule.")
+    parser.add_argument('--os', dest='os', type=str, default='linux_64',
+                        choices=['linux_64', 'linux_32', 'mac', 'windows'],
+                        help="Choose which operation system the script will run "
+                             "(this is relevant for the headless browser driver).")
+    return parser
+
+
+def extract_from_queue(url_queue, schedule_id, args, driver_path):
+    """
+    Extracts the cookies of the urls in the queue until None is received, runs in its own thread and is the only
+    user of the process2 session.
+    :param queue.Queue url_queue: The queue of the (id, url) of the crawled urls.
+    :param schedule_id: The schedule id for this run.
+    :param args: The process2 formatted args from the config table.
+    :param driver_path: the path to the driver.
+    """
+    stats = process2.get_stats(schedule_id)
+    # The summary of a previous extraction of the schedule is stale once the crawl changes its urls.
+    clear_summary(process2.session, schedule_id)
+    process2.session.commit()
+    urls = iter(url_queue.get, None)
+    start = datetime.datetime.now()
+    try:
+        process2.extract_cookies(urls, stats, args, driver_path)
+        stats.cookie_last_result = result = FINISHED
+    except Exception as e:
+        logging.error(e)
+        stats.cookie_last_result = result = ABORTED
+        # Keeps draining the queue so the crawler isn't blocked forever.
+        for _ in urls:
+            pass
+    finally:
+        stats.cookie_scan_duration = (datetime.datetime.now() - start).seconds
+        # Committed first, a failed summary rolls back the session.
+        process2.session.commit()
+    if result == FINISHED:
+        process2.summarize(schedule_id)
+    process2.session.close()
+
+
+def run(parser_args):
+    """
+    Crawls the schedule and extracts its cookies.
+    :param parser_args: The parsed cli arguments.
+    """
+    start = datetime.datetime.now()
+    session = Session(db.engine)
+    schedule = session.query(db.MuncherSchedule).get(parser_args.id)
+    config = session.query(db.MuncherConfig).get(schedule.config_id)
+    crawl_args, allowed_domains = format_arguments(DotMap(json.loads(config.json_params)), parser_args.id)
+    stats = create_muncher_stats(session, parser_args.id)
+    if stats:
+        extract_args, driver_path = process2.format_arguments(DotMap(json.loads(config.json_params)),
+                                                              parser_args.os, parser_args.id)
+        job_dir = generate_job_dir(crawl_args, parser_args.id)
+        stats.urls_log_path = crawl_args.log_file
+        session.commit()
+        logging.basicConfig(filename=extract_args.log_file, level=logging.ERROR)
+        url_queue = queue.Queue(maxsize=get_param(crawl_args, 'pipeline_queue_size', DEFAULT_QUEUE_SIZE))
+        extractor = threading.Thread(target=extract_from_queue, name='cookie-extraction',
+                                     args=(url_queue, parser_args.id, extract_args, driver_path))
+        reporter = metrics.start_reporting(get_param(crawl_args, 'metrics', None))
+        extractor.start()
+        heartbeat = Heartbeat([parser_args.id]).start()
+        try:
+            crawl_schedule(parser_args.id, crawl_args, allowed_domains, job_dir, url_queue=url_queue)
+        finally:
+            heartbeat.stop()
+            if extractor.is_alive():
+                # Makes sure the extraction ends even if the crawl failed before closing the pipeline.
+                url_queue.put(None)
+            stats.url_scan_duration = (datetime.datetime.now() - start).seconds
+            session.commit()
+            extractor.join()
+            reporter.stop()
+            metrics.roll_up(stats, 'pipelined')
+            session.commit()
+        # The spider saves the result of the crawl using its own session.
+        session.refresh(stats)
+        if job_dir and stats.url_last_result == FINISHED:
+            shutil.rmtree(job_dir, ignore_errors=True)
+    session.close()
+
+
+if __name__ == '__main__':
+    run(create_parser().parse_args())
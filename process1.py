@@ -9,12 +9,36 @@ from sqlalchemy.orm import Session
 from dotmap import DotMap
 from sqlalchemy import exists
 
-from cookieMuncher.spiders.cookie_muncher import crawl
+from cookieMuncher.httpcache import cache_settings
+from cookieMuncher.performance import DEFAULT_PROFILE, LEGACY_PROFILE, profile_settings
+from cookieMuncher.pipelines import DEFAULT_BATCH_SIZE, DEFAULT_FLUSH_INTERVAL
+from cookieMuncher.spiders.cookie_muncher import crawl, crawl_many
 import os
 import json
+import shutil
 from urllib.parse import urlparse
-from db import engine, MuncherConfig, MuncherSchedule, MuncherStats
-from utils import check_directory_exists, LOG_FIXTURE, create_parser
+import db
+import metrics
+from stats_accumulator import DEFAULT_STATS_FLUSH_INTERVAL, Heartbeat, has_heartbeat_column
+from utils import check_directory_exists, LOG_FIXTURE, create_parser as create_base_parser, get_param
+
+DEFAULT_JOBS_FOLDER = 'jobs'
+FINISHED = 'finished'
+
+
+def create_parser():
+    """
+    Creates the parser with all of the expected arguments.
+    :return: The configured parser instance.
+    """
+    parser = create_base_parser()
+    parser.add_argument('-r', '--resume', dest='resume', action='store_true',
+                        help='Resume a crawl of the schedule that was stopped before it finished.')
+    parser.add_argument('--also', dest='also', type=int, nargs='+', default=[],
+                        help='The ids of more schedules that are crawled at the same time in this process.')
+    parser.add_argument('--max-concurrent', dest='max_concurrent', type=int, default=None,
+                        help='The maximal amount of schedules crawled at the same time, by default all of them.')
+    return parser
 
 
 def generate_file_name(folder, schedule_id, fixture):
@@ -37,10 +61,16 @@ def generate_netlocations_from_domains(domains):
 
 def format_arguments(args, schedule_id):
     """
-    Formats the arguments given to the script.
+    Formats the arguments given to the script, the performance profile and the http cache config are validated and
+    translated to the scrapy settings of the crawl.
     :param args: The args given to the script.
     :return: The formatted args.
     """
+    # Configs created before the performance section existed keep crawling with the scrapy defaults.
+    crawl_settings = profile_settings(get_param(args, 'performance', None),
+                                      DEFAULT_PROFILE if 'performance' in args else LEGACY_PROFILE)
+    crawl_settings.update(cache_settings(get_param(args, 'http_cache', None)))
+    args.crawl_settings = crawl_settings
     allowed_domains = []
     if args.domain_only:
         allowed_domains = generate_netlocations_from_domains(args.domains)
@@ -53,21 +83,116 @@ def format_arguments(args, schedule_id):
     return args, allowed_domains
 
 
-def create_muncher_stats(session, schedule_id):
+def generate_job_dir(args, schedule_id):
     """
-    Creates the stats table for this schedule, if a table already exists for this schedule aborts the run.
+    :param args: The args from the config table.
+    :param schedule_id: The schedule id for this run.
+    :return: The folder in which the state of the crawl is persisted, None in case checkpoints are disabled.
+    """
+    if not get_param(args, 'checkpoint', True):
+        return None
+    return os.path.join(get_param(args, 'jobs_folder', DEFAULT_JOBS_FOLDER), 'schedule_{}'.format(schedule_id))
+
+
+def create_muncher_stats(session, schedule_id, resume=False):
+    """
+    Creates the stats table for this schedule, if a table already exists for this schedule aborts the run unless
+    the crawl is resumed.
     :param Session session: The session with the mysql db.
     :param schedule_id: The schedule id for this run.
+    :param resume: If True the existing stats of the schedule are returned.
     :return: True if the stats was created successfully false otherwise.
     """
-    if session.query(exists().where(MuncherStats.schedule_id == schedule_id)).scalar():
-        print("There is already a muncher stats with the schedule id of {}".format(schedule_id))
-        return None
+    if session.query(exists().where(db.MuncherStats.schedule_id == schedule_id)).scalar():
+        if resume:
+            stats = session.query(db.MuncherStats).filter(db.MuncherStats.schedule_id == schedule_id).scalar()
+            if stats.url_last_result == FINISHED:
+                print("The crawl of schedule {} has already finished".format(schedule_id))
+                return None
+        else:
+            print("There is already a muncher stats with the schedule id of {}".format(schedule_id))
+            return None
     else:
-        stats = MuncherStats(schedule_id=schedule_id)
+        stats = db.MuncherStats(schedule_id=schedule_id)
         session.add(stats)
-        session.commit()
-        return stats
+    if has_heartbeat_column():
+        # Keeps the orchestrator from crawling the schedule too until the heartbeat of the crawl starts.
+        stats.crawl_heartbeat = datetime.now()
+    session.commit()
+    return stats
+
+
+def crawl_arguments(schedule_id, args, allowed_domains, job_dir, resume=False, url_queue=None):
+    """
+    :param schedule_id: The schedule id for this run.
+    :param args: The formatted args from the config table.
+    :param allowed_domains: The list of allowed domains.
+    :param job_dir: The folder in which the state of the crawl is persisted.
+    :param resume: If True continues a previous crawl of this schedule.
+    :param queue.Queue url_queue: If given the saved urls are fed to it.
+    :return: The keyword arguments of the crawl of the schedule.
+    """
+    return dict(schedule_id=schedule_id, urls=args.domains, allowed_domains=allowed_domains, depth=args.depth,
+                silent=args.silent, log_file=args.log_file, delay=args.delay, user_agent=args.user_agent,
+                batch_size=get_param(args, 'batch_size', DEFAULT_BATCH_SIZE),
+                flush_interval=get_param(args, 'flush_interval', DEFAULT_FLUSH_INTERVAL),
+                print_items=get_param(args, 'print_items', True),
+                job_dir=job_dir, resume=resume, url_queue=url_queue, crawl_settings=args.crawl_settings,
+                stats_interval=get_param(args, 'stats_flush_interval', DEFAULT_STATS_FLUSH_INTERVAL))
+
+
+def crawl_schedule(schedule_id, args, allowed_domains, job_dir, resume=False, url_queue=None):
+    """
+    Crawls the domains of the schedule, the script will block until the crawling is finished.
+    :param schedule_id: The schedule id for this run.
+    :param args: The formatted args from the config table.
+    :param allowed_domains: The list of allowed domains.
+    :param job_dir: The folder in which the state of the crawl is persisted.
+    :param resume: If True continues a previous crawl of this schedule.
+    :param queue.Queue url_queue: If given the saved urls are fed to it.
+    """
+    crawl(**crawl_arguments(schedule_id, args, allowed_domains, job_dir, resume, url_queue))
+
+
+def prepare_schedule(session, schedule_id, resume=False):
+    """
+    Creates the stats of the schedule and formats its config.
+    :param Session session: The session with the mysql db.
+    :param schedule_id: The schedule id for this run.
+    :param resume: If True continues a previous crawl of this schedule.
+    :return: The stats, formatted args, allowed domains and job dir of the schedule, None in case it can't be
+    crawled.
+    """
+    schedule = session.query(db.MuncherSchedule).get(schedule_id)
+    config = session.query(db.MuncherConfig).get(schedule.config_id)
+    # Formatted first so an invalid config doesn't leave behind the stats of a crawl that never started.
+    args, allowed_domains = format_arguments(DotMap(json.loads(config.json_params)), schedule_id)
+    stats = create_muncher_stats(session, schedule_id, resume)
+    if not stats:
+        return None
+    job_dir = generate_job_dir(args, schedule_id)
+    stats.urls_log_path = args.log_file
+    session.commit()
+    return stats, args, allowed_domains, job_dir
+
+
+def finish_schedule(session, stats, job_dir, start, resume=False):
+    """
+    Saves the duration of the crawl and removes its persisted state in case it finished.
+    :param Session session: The session with the mysql db.
+    :param stats: The stats of the schedule.
+    :param job_dir: The folder in which the state of the crawl is persisted.
+    :param start: The time the crawl started.
+    :param resume: If True the crawl continued a previous crawl of this schedule.
+    """
+    previous_duration = (stats.url_scan_duration or 0) if resume else 0
+    stats.url_scan_duration = previous_duration + (datetime.now() - start).seconds
+    metrics.roll_up(stats, 'crawl', metrics.schedule_registry(stats.schedule_id))
+    session.commit()
+    # The spider saves the result of the crawl using its own session.
+    session.refresh(stats)
+    if job_dir and stats.url_last_result == FINISHED:
+        shutil.rmtree(job_dir, ignore_errors=True)
 
 
 def run(parser):
@@ -77,18 +202,32 @@ def run(parser):
     :return: A configured crawler instance.
     """
     start = datetime.now()
-    session = Session(engine)
-    id = parser.parse_args().id
-    schedule = session.query(MuncherSchedule).get(id)
-    config = session.query(MuncherConfig).get(schedule.config_id)
-    stats = create_muncher_stats(session, id)
-    if stats:
-        args, allowed_domains = format_arguments(DotMap(json.loads(config.json_params)), id)
-        stats.urls_log_path = args.log_file
-        session.commit()
-        crawl(id, args.domains, allowed_domains, args.depth, args.silent, args.log_file, args.delay, args.user_agent)
-        stats.url_scan_duration = (datetime.now() - start).seconds
-        session.commit()
+    session = Session(db.engine)
+    parser_args = parser.parse_args()
+    schedules = []
+    for id in [parser_args.id] + parser_args.also:
+        prepared = prepare_schedule(session, id, parser_args.resume)
+        if prepared:
+            schedules.append((id,) + prepared)
+    # The crawls of a single process are reported together, the reporting is configured by the first schedule.
+    reporter = metrics.start_reporting(get_param(schedules[0][2], 'metrics', None) if schedules else None)
+    heartbeat = Heartbeat([id for id, _, _, _, _ in schedules]).start()
+    try:
+        if len(schedules) == 1:
+            id, stats, args, allowed_domains, job_dir = schedules[0]
+            crawl_schedule(id, args, allowed_domains, job_dir, parser_args.resume)
+        elif schedules:
+            # The logging of a process is global, the crawls share the log file of the first schedule.
+            crawl_many([crawl_arguments(id, args, allowed_domains, job_dir, parser_args.resume)
+                        for id, stats, args, allowed_domains, job_dir in schedules],
+                       silent=all(args.silent for _, _, args, _, _ in schedules),
+                       log_file=next((args.log_file for _, _, args, _, _ in schedules if args.log_file), None),
+                       max_concurrent=parser_args.max_concurrent)
+    finally:
+        heartbeat.stop()
+    reporter.stop()
+    for id, stats, args, allowed_domains, job_dir in schedules:
+        finish_schedule(session, stats, job_dir, start, parser_args.resume)
     session.close()
 
 
@@ -2,27 +2,32 @@ import argparse
 import json
 import os
 import datetime
-import requests
-from bs4 import BeautifulSoup as Soup
 import logging
+from urllib.parse import urlparse
 from dotmap import DotMap
-from sqlalchemy import exists
+from sqlalchemy import and_, exists, bindparam
 from sqlalchemy.orm import Session
 
 from progress.bar import Bar
-from db import engine, MuncherSchedule, MuncherConfig, UrlScans, Cookies, ExtractedCookies, CookieInfo, MuncherStats
-from utils import LOG_FIXTURE, check_directory_exists
-from selenium import webdriver
+from progress.counter import Counter
 
-# Remove annoying warning message when accessing https://cookiepedia.co.uk because of their broken
-# certificate.
-import urllib3
-
-urllib3.disable_warnings(urllib3.exceptions.InsecureRequestWarning)
+from browser_pool import BrowserPool, DEFAULT_WORKERS, DEFAULT_MAX_RETRIES, DEFAULT_MAX_PAGES, DEFAULT_MAX_MEMORY_MB
+from cookie_cache import create_cookie_cache, DEFAULT_MAX_SIZE, DEFAULT_TTL
+from cookie_summary import clear_summary, summarize_schedule
+from cookiepedia import CookiepediaClient, COOKIEPEDIA_PATH_FORMAT, DEFAULT_CONCURRENCY, DEFAULT_RATE, \
+    DEFAULT_TIMEOUT, DEFAULT_RETRIES
+import db
+import metrics
+from host_matcher import HostMatcher
+from page_loader import create_page_loader
+from stats_accumulator import StatsAccumulator, DEFAULT_STATS_FLUSH_INTERVAL
+from utils import LOG_FIXTURE, DEFAULT_HASH_ATTRIBUTES, check_directory_exists, get_param, hash_cookie
 
 DEFAULT_LOG_FOLDER = 'cookies_logs'
 DEFAULT_OUTPUT_FOLDER = 'cookies_output'
 OUTPUT_CSV_FILE_HEADERS = ['datetime', 'url', 'cookies', 'about', 'purpose']
+DEFAULT_BATCH_URLS = 20
+CARRY_OVER_BATCH_SIZE = 500
 DRIVER_FOLDER = os.path.join('.', 'drivers')
 DRIVER_NAMES = {
     'windows': 'windows_phantom.exe',
@@ -30,12 +35,8 @@ DRIVER_NAMES = {
     'linux_32': 'linux_32_phantom',
     'mac': 'mac_phantom'
 }
-SOUP_PARSER = 'html.parser'
-COOKIEPEDIA_PATH_FORMAT = 'https://cookiepedia.co.uk/cookies/{}'
-FOUND_COOKIE_H2 = 'About this cookie:'
-CACHE = dict()
 
-session = Session(engine)
+session = Session(db.engine)
 
 
 def create_parser():
@@ -83,98 +84,426 @@ def format_arguments(args, os_system, schedule_id):
     return args, driver_path
 
 
-def scrap_cookie(cookie, url):
+class CookieInfoResolver(object):
     """
-    Scrape the https://cookiepedia.co.uk website for information on the specific cookie
-    :param cookie: The json cookie retrieved using phantomJs.
-    :param url: The url from which the cookie was loaded.
-    :return: The id of the item created in the db for the cookie.
-    """
-    about = "There is not yet any general information about this cookie based on its name only. If you have any information about this cookie, please get in touch."
-    purpose = "Unknown"
-    page_content = requests.get(COOKIEPEDIA_PATH_FORMAT.format(cookie['name']), verify=False).content
-    soup = Soup(page_content, SOUP_PARSER)
-    if soup.find('h2').text == FOUND_COOKIE_H2:
-        paragraphs = soup.find('div', attrs={'id': 'content-left'}).find_all('p')
-        about = paragraphs[0].text
-        purpose = paragraphs[1].find('strong').text
-    info = CookieInfo(cookie_name=cookie['name'], purpose=purpose, about=about,
-                      datetime=datetime.datetime.now())
-    session.add(info)
-    session.commit()
-    return info.id
+    Collects the cookies whose name isn't in the db yet, looks them up in https://cookiepedia.co.uk in the background
+    and writes the results back to the db in bulk.
+    """
+
+    def __init__(self, client, cache):
+        """
+        :param CookiepediaClient client: The client used for the lookups.
+        :param CookieInfoCache cache: The cookie info cache, updated with the resolved cookies.
+        """
+        self.client = client
+        self.cache = cache
+        self.pending = {}
+
+    def __contains__(self, name):
+        return name in self.pending
 
+    def add(self, name, cookie_id):
+        """
+        Marks the cookie as waiting for the information about its name.
+        :param name: The name of the cookie.
+        :param cookie_id: The id of the cookie in the db.
+        """
+        if name not in self.pending:
+            self.pending[name] = []
+            self.client.lookup(name)
+        self.pending[name].append(cookie_id)
 
-def handle_cookie(cookie, url):
+    def flush(self, wait=False):
+        """
+        Saves the lookups that finished to the db and links the waiting cookies to them. The cookies of a failed
+        lookup stay without information, the next cookie of the same name is looked up again.
+        :param wait: If True waits for all of the lookups in flight to finish first.
+        """
+        results = self.client.wait() if wait else self.client.completed()
+        for name in self.client.failed():
+            self.pending.pop(name, None)
+        if results:
+            names = [name for name, _, _ in results]
+            # Another process might have saved some of the names since they were looked up.
+            existing = {name for name, in session.query(db.CookieInfo.cookie_name)
+                        .filter(db.CookieInfo.cookie_name.in_(names))}
+            missing = [result for result in results if result[0] not in existing]
+            if missing:
+                now = datetime.datetime.now()
+                session.execute(db.CookieInfo.__table__.insert(),
+                                [{'cookie_name': name, 'about': about, 'purpose': purpose, 'datetime': now}
+                                 for name, about, purpose in missing])
+            info_ids = dict(session.query(db.CookieInfo.cookie_name, db.CookieInfo.id)
+                            .filter(db.CookieInfo.cookie_name.in_(names)))
+            updates = []
+            for name in names:
+                self.cache.set(name, info_ids[name])
+                updates.extend({'cookie_id': cookie_id, 'info_id': info_ids[name]}
+                               for cookie_id in self.pending.pop(name, []))
+            if updates:
+                cookies = db.Cookies.__table__
+                session.execute(cookies.update().where(cookies.c.id == bindparam('cookie_id'))
+                                .values(cookie_info_id=bindparam('info_id')), updates)
+            session.commit()
+        if wait and self.pending:
+            logging.error("could not find information about the cookies: {}".format(', '.join(self.pending)))
+
+
+def get_cookie_info_id(cookie, cache, resolver):
     """
-    Returns information about the specific cookie as found in https://cookiepedia.co.uk either from cache or from
-    the scarping the site.
-    :param UrlScans url: The url item in the db.
+    Returns the id of the information about the specific cookie as found in https://cookiepedia.co.uk either from
+    the cache or the db.
     :param cookie: The json cookie retrieved using phantomJs.
-    :return:about and purpose information about the cookie.
+    :param CookieInfoCache cache: The cookie info cache.
+    :param CookieInfoResolver resolver: The cookies waiting for a cookiepedia lookup.
+    :return: The id of the cookie info in the db or None in case it wasn't looked up yet.
+    """
+    cookie_info_id = cache.get(cookie['name'])
+    if cookie_info_id is None and cookie['name'] not in resolver:
+        row = session.query(db.CookieInfo.id).filter(db.CookieInfo.cookie_name == cookie['name']).first()
+        if row:
+            cookie_info_id = row.id
+            cache.set(cookie['name'], cookie_info_id)
+    return cookie_info_id
+
+
+class CookieWriter(object):
+    """
+    Collects the cookies of a window of urls and saves them to the db at once, the cookies and their links to the
+    urls are written with multi-row inserts and committed at once, the amount of cookies is counted in the progress
+    of the schedule.
+    """
+
+    def __init__(self, progress, cache, resolver, batch_urls=DEFAULT_BATCH_URLS):
+        """
+        :param StatsAccumulator progress: The progress counters of the schedule.
+        :param CookieInfoCache cache: The cookie info cache.
+        :param CookieInfoResolver resolver: The cookies waiting for a cookiepedia lookup.
+        :param batch_urls: The amount of urls whose cookies are saved together.
+        """
+        self.progress = progress
+        self.cache = cache
+        self.resolver = resolver
+        self.batch_urls = max(batch_urls, 1)
+        self.results = []
+
+    def add(self, result):
+        """
+        :param UrlResult result: The cookies extracted from the url by the browser pool.
+        """
+        self.results.append(result)
+        if len(self.results) >= self.batch_urls:
+            self.flush()
+
+    def flush(self):
+        """
+        Saves the cookies of all of the collected urls.
+        """
+        results, self.results = self.results, []
+        cookies = [(result.url_id, cookie) for result in results for cookie in result.cookies]
+        if not cookies:
+            return
+        info_ids = {}
+        for _, cookie in cookies:
+            if cookie['name'] not in info_ids:
+                info_ids[cookie['name']] = get_cookie_info_id(cookie, self.cache, self.resolver)
+        with metrics.timer('cookie_flush_seconds'):
+            cookie_ids, inserted = self._save_cookies([cookie for _, cookie in cookies], info_ids)
+            session.execute(db.ExtractedCookies.__table__.insert().values([
+                {'url_id': url_id, 'cookie_id': cookie_id} for (url_id, _), cookie_id in zip(cookies, cookie_ids)]))
+            session.commit()
+        self.progress.increment('cookies_extracted_fp', len(cookies))
+        metrics.increment('cookies_extracted', len(cookies))
+        for cookie_id, name in inserted:
+            if info_ids[name] is None:
+                self.resolver.add(name, cookie_id)
+
+    def _save_cookies(self, cookies, info_ids):
+        """
+        Inserts a row for every cookie.
+        :param cookies: The json cookies.
+        :param info_ids: A dict from the cookie names to the ids of their cookie info.
+        :return: The ids of the cookies, and the (id, name) of every row that was inserted.
+        """
+        now = datetime.datetime.now()
+        cookie_ids = db.insert_rows(session, db.Cookies.__table__, [
+            {'cookie_info_id': info_ids[cookie['name']], 'cookie_source': 0, 'cookie_attr': json.dumps(cookie),
+             'datetime': now} for cookie in cookies])
+        return cookie_ids, [(cookie_id, cookie['name']) for cookie_id, cookie in zip(cookie_ids, cookies)]
+
+
+class DedupCookieWriter(CookieWriter):
+    """
+    Saves every distinct cookie of the schedule only once, the cookies are identified by a hash of their identifying
+    attributes and a repeated sighting only adds a link to the url, the saved cookie is the first sighting.
     """
-    if session.query(exists().where(CookieInfo.cookie_name == cookie['name'])).scalar():
-        cookie_info_id = session.query(CookieInfo).filter(CookieInfo.cookie_name == cookie['name']).scalar().id
-    else:
-        cookie_info_id = scrap_cookie(cookie, url)
-    Cookie = Cookies(cookie_info_id=cookie_info_id, cookie_source=0, cookie_attr=json.dumps(cookie),
-                     datetime=datetime.datetime.now())
-    session.add(Cookie)
-    session.commit()
-    return Cookie.id
 
+    def __init__(self, progress, cache, resolver, batch_urls=DEFAULT_BATCH_URLS, attributes=DEFAULT_HASH_ATTRIBUTES):
+        """
+        :param attributes: The cookie attributes that are hashed.
+        """
+        super(DedupCookieWriter, self).__init__(progress, cache, resolver, batch_urls)
+        self.attributes = list(attributes)
+        self.hash_ids = {}
 
-def handle_url(url, driver, stats):
+    def _save_cookies(self, cookies, info_ids):
+        hashes = [hash_cookie(cookie, self.progress.schedule_id, self.attributes) for cookie in cookies]
+        new_cookies = {}
+        for cookie_hash, cookie in zip(hashes, cookies):
+            if cookie_hash not in self.hash_ids:
+                new_cookies.setdefault(cookie_hash, cookie)
+        inserted = []
+        if new_cookies:
+            # The cookies might have been saved by a previous run of the schedule.
+            self.hash_ids.update(self._load_ids(new_cookies))
+            missing = {cookie_hash: cookie for cookie_hash, cookie in new_cookies.items()
+                       if cookie_hash not in self.hash_ids}
+            if missing:
+                now = datetime.datetime.now()
+                session.execute(db.Cookies.__table__.insert()
+                                .prefix_with('IGNORE', dialect='mysql')
+                                .prefix_with('OR IGNORE', dialect='sqlite')
+                                .values([{'cookie_info_id': info_ids[cookie['name']], 'cookie_source': 0,
+                                          'cookie_attr': json.dumps(cookie), 'cookie_hash': cookie_hash,
+                                          'datetime': now} for cookie_hash, cookie in missing.items()]))
+                missing_ids = self._load_ids(missing)
+                self.hash_ids.update(missing_ids)
+                inserted = [(missing_ids[cookie_hash], cookie['name']) for cookie_hash, cookie in missing.items()]
+        return [self.hash_ids[cookie_hash] for cookie_hash in hashes], inserted
+
+    @staticmethod
+    def _load_ids(hashes):
+        """
+        :param hashes: The hashes of the cookies.
+        :return: A dict from the hash to the id of every cookie that is already saved.
+        """
+        return dict(session.query(db.Cookies.cookie_hash, db.Cookies.id).filter(
+            db.Cookies.cookie_hash.in_(list(hashes))))
+
+
+def create_cookie_writer(args, progress, cache, resolver):
     """
-    Retrieves the cookies from the url.
-    :param UrlScans url: The url item in the db.
-    :param driver: The headless browser driver
-    :return:
+    :param args: The args from the config table.
+    :return: The cookie writer matching the configured storage mode.
     """
-    driver.get(url.url)
-    for cookie in driver.get_cookies():
-        cookie_id = handle_cookie(cookie, url.url)
-        stats.cookies_extracted_fp = stats.cookies_extracted_fp + 1
-        session.add(ExtractedCookies(url_id=url.id, cookie_id=cookie_id))
+    batch_urls = get_param(args, 'cookie_batch_urls', DEFAULT_BATCH_URLS)
+    if get_param(args, 'dedup_cookies', False):
+        # The cookies that only differ in their value are the same cookie unless asked otherwise.
+        attributes = DEFAULT_HASH_ATTRIBUTES + (['value'] if get_param(args, 'cookie_hash_value', False) else [])
+        return DedupCookieWriter(progress, cache, resolver, batch_urls, attributes)
+    return CookieWriter(progress, cache, resolver, batch_urls)
 
 
-def handle_input(rows, stats, driver):
+def handle_input(urls, pool, writer, resolver, total=None):
     """
-    Handle all of the rows that were retrieved from the db.
-    :param rows: The rows retrieved from the db.
-    :param schedule_id: the id of the muncher schedule.
-    :param driver: The phantomJS driver for extracting the cookies.
+    Handle all of the urls that were retrieved from the db.
+    :param urls: An iterable of the (id, url) of the urls.
+    :param BrowserPool pool: The pool of phantomJS drivers for extracting the cookies.
+    :param CookieWriter writer: Saves the extracted cookies to the db.
+    :param CookieInfoResolver resolver: The cookies waiting for a cookiepedia lookup.
+    :param total: The amount of urls, None in case the urls are streamed while they are crawled.
     """
-    total = len(rows)
-    bar = Bar('Cookie Extracting', max=total)
-    print("Starting cookie extraction on {} urls...".format(total))
+    if total is None:
+        bar = Counter('Cookie Extracting ')
+        print("Starting cookie extraction with {} browsers...".format(pool.workers))
+    else:
+        bar = Bar('Cookie Extracting', max=total)
+        print("Starting cookie extraction on {} urls with {} browsers...".format(total, pool.workers))
     bar.start()
-    for row in rows:
-        handle_url(row, driver, stats)
+    for result in pool.run(urls):
+        writer.add(result)
+        resolver.flush()
         bar.next()
     bar.finish()
+    writer.flush()
+    resolver.flush(wait=True)
 
 
-def run(stats, args, driver_path):
+def create_cache(args):
+    """
+    :param args: The args from the config table.
+    :return: The cookie info cache configured by the args.
+    """
+    return create_cookie_cache(max_size=get_param(args, 'cookie_cache_size', DEFAULT_MAX_SIZE),
+                               ttl=get_param(args, 'cookie_cache_ttl', DEFAULT_TTL),
+                               store_path=get_param(args, 'cookie_cache_path', None))
+
+
+def create_progress(schedule_id, args):
     """
-    Read the urls from the urls table with the given schedule id and find the cookies for each url .
     :param schedule_id: The scheduled task id.
     :param args: The args from the config table.
+    :return: The progress counters of the cookie extraction of the schedule, starting from no cookies.
+    """
+    return StatsAccumulator(schedule_id, get_param(args, 'stats_flush_interval', DEFAULT_STATS_FLUSH_INTERVAL),
+                            initial={'cookies_extracted_fp': 0})
+
+
+def extract_cookies(urls, stats, args, driver_path, total=None, cache=None, progress=None):
+    """
+    Extracts the cookies of the urls and saves them to the db.
+    :param urls: An iterable of the (id, url) of the urls.
+    :param stats: The stats of the schedule.
+    :param args: The args from the config table.
     :param driver_path: the path to the driver.
+    :param total: The amount of urls, None in case the urls are streamed while they are crawled.
+    :param CookieInfoCache cache: An already warm cookie info cache that is kept open after the extraction, if None
+    a new one is created and warmed for this run.
+    :param StatsAccumulator progress: The progress counters of the schedule, if None new ones are created.
     """
-    logging.basicConfig(filename=args.log_file, level=logging.ERROR)
-    driver = webdriver.PhantomJS(executable_path=driver_path, service_log_path=args.log_file)
-    rows = session.query(UrlScans).filter(UrlScans.schedule_id == stats.schedule_id).all()
-    stats.cookies_extracted_fp = 0
+    create_driver, extract, reset = create_page_loader(get_param(args, 'page_load', None), driver_path,
+                                                       args.log_file)
+    pool = BrowserPool(create_driver,
+                       workers=get_param(args, 'workers', DEFAULT_WORKERS),
+                       max_retries=get_param(args, 'max_retries', DEFAULT_MAX_RETRIES),
+                       extract=extract, reset=reset,
+                       max_pages=get_param(args, 'driver_max_pages', DEFAULT_MAX_PAGES),
+                       max_memory_mb=get_param(args, 'driver_max_memory_mb', DEFAULT_MAX_MEMORY_MB))
+    shared_cache = cache is not None
+    if not shared_cache:
+        cache = create_cache(args)
+        cache.warm(session)
+    hits, misses = cache.hits, cache.misses
+    client = CookiepediaClient(path_format=get_param(args, 'cookiepedia_url', COOKIEPEDIA_PATH_FORMAT),
+                               concurrency=get_param(args, 'cookiepedia_concurrency', DEFAULT_CONCURRENCY),
+                               rate=get_param(args, 'cookiepedia_rate', DEFAULT_RATE),
+                               timeout=get_param(args, 'cookiepedia_timeout', DEFAULT_TIMEOUT),
+                               retries=get_param(args, 'cookiepedia_retries', DEFAULT_RETRIES))
+    if progress is None:
+        progress = create_progress(stats.schedule_id, args)
+    progress.flush()
     stats.cookies_log_path = args.log_file
     session.commit()
-    handle_input(rows, stats, driver)
-    driver.quit()
+    try:
+        resolver = CookieInfoResolver(client, cache)
+        writer = create_cookie_writer(args, progress, cache, resolver)
+        handle_input(urls, pool, writer, resolver, total)
+    finally:
+        client.close()
+        progress.set('cookie_cache_hits', cache.hits - hits)
+        progress.set('cookie_cache_misses', cache.misses - misses)
+        progress.flush()
+        if not shared_cache:
+            cache.close()
+
+
+def find_previous_schedule(schedule_id):
+    """
+    :param schedule_id: The scheduled task id.
+    :return: The id of the latest earlier schedule of the same domains whose cookie extraction finished, None in case
+    there isn't one.
+    """
+    domains = set(json.loads(session.query(db.MuncherConfig.json_params).join(
+        db.MuncherSchedule, db.MuncherSchedule.config_id == db.MuncherConfig.id).filter(
+        db.MuncherSchedule.id == schedule_id).scalar())['domains'].split())
+    candidates = session.query(db.MuncherSchedule.id, db.MuncherConfig.json_params) \
+        .join(db.MuncherConfig, db.MuncherConfig.id == db.MuncherSchedule.config_id) \
+        .join(db.MuncherStats, db.MuncherStats.schedule_id == db.MuncherSchedule.id) \
+        .filter(db.MuncherSchedule.id < schedule_id, db.MuncherStats.cookie_last_result == 'finished') \
+        .order_by(db.MuncherSchedule.id.desc())
+    for candidate_id, json_params in candidates:
+        if set(json.loads(json_params)['domains'].split()) == domains:
+            return candidate_id
+    return None
+
+
+def find_unchanged_urls(schedule_id, previous_schedule_id):
+    """
+    Matches the urls of the schedule with the urls of the previous schedule by their fingerprint.
+    :param schedule_id: The scheduled task id.
+    :param previous_schedule_id: The id of the previous schedule of the same domains.
+    :return: A dict from the id of every url whose content didn't change to the id of the url in the previous
+    schedule.
+    """
+    previous = {row.url_hash: (row.id, row.content_hash) for row in session.query(
+        db.UrlScans.id, db.UrlScans.url_hash, db.UrlScans.content_hash).filter(
+        db.UrlScans.schedule_id == previous_schedule_id, db.UrlScans.content_hash.isnot(None))}
+    unchanged = {}
+    for row in session.query(db.UrlScans.id, db.UrlScans.url_hash, db.UrlScans.content_hash).filter(
+            db.UrlScans.schedule_id == schedule_id, db.UrlScans.content_hash.isnot(None)):
+        previous_id, previous_hash = previous.get(row.url_hash, (None, None))
+        if previous_hash == row.content_hash:
+            unchanged[row.id] = previous_id
+    return unchanged
+
+
+def carry_over_cookies(unchanged, progress, batch_size=CARRY_OVER_BATCH_SIZE):
+    """
+    Links the cookies that were extracted from the unchanged urls in the previous schedule to their new urls.
+    :param unchanged: A dict from the id of every unchanged url to the id of the url in the previous schedule.
+    :param StatsAccumulator progress: The progress counters of the schedule.
+    :param batch_size: The amount of urls whose links are copied at once.
+    """
+    new_ids = {previous_id: url_id for url_id, previous_id in unchanged.items()}
+    previous_ids = list(new_ids)
+    for start in range(0, len(previous_ids), batch_size):
+        links = session.query(db.ExtractedCookies.url_id, db.ExtractedCookies.cookie_id).filter(
+            db.ExtractedCookies.url_id.in_(previous_ids[start:start + batch_size])).all()
+        if links:
+            session.execute(db.ExtractedCookies.__table__.insert().values([
+                {'url_id': new_ids[url_id], 'cookie_id': cookie_id} for url_id, cookie_id in links]))
+            session.commit()
+            progress.increment('cookies_extracted_fp', len(links))
+    progress.flush()
+
+
+def clear_extracted_cookies(schedule_id, batch_size=CARRY_OVER_BATCH_SIZE):
+    """
+    Removes the cookies saved by a previous, partial extraction of the schedule so a retry doesn't link them twice.
+    The cookies that are still linked to the urls of another schedule (carried over by an incremental re-scan) are
+    kept. The summary of the previous extraction is removed too, so the reports don't read it in case the new summary
+    fails.
+    :param schedule_id: The scheduled task id.
+    :param batch_size: The amount of cookies deleted at once.
+    """
+    clear_summary(session, schedule_id)
+    url_ids = session.query(db.UrlScans.id).filter(db.UrlScans.schedule_id == schedule_id).subquery()
+    cookie_ids = [cookie_id for cookie_id, in session.query(db.ExtractedCookies.cookie_id)
+                  .filter(db.ExtractedCookies.url_id.in_(url_ids)).distinct()]
+    if not cookie_ids:
+        session.commit()
+        return
+    links_table = db.ExtractedCookies.__table__
+    cookies_table = db.Cookies.__table__
+    session.execute(links_table.delete().where(links_table.c.url_id.in_(url_ids)))
+    for start in range(0, len(cookie_ids), batch_size):
+        session.execute(cookies_table.delete().where(and_(
+            cookies_table.c.id.in_(cookie_ids[start:start + batch_size]),
+            ~exists().where(links_table.c.cookie_id == cookies_table.c.id))))
+    session.commit()
+    print("removed the cookies of a previous extraction of schedule {}".format(schedule_id))
+
+
+def run(stats, args, driver_path, cache=None):
+    """
+    Read the urls from the urls table with the given schedule id and find the cookies for each url .
+    :param schedule_id: The scheduled task id.
+    :param args: The args from the config table.
+    :param driver_path: the path to the driver.
+    :param CookieInfoCache cache: An already warm cookie info cache, if None a new one is created.
+    """
+    logging.basicConfig(filename=args.log_file, level=logging.ERROR)
+    clear_extracted_cookies(stats.schedule_id)
+    rows = session.query(db.UrlScans.id, db.UrlScans.url).filter(db.UrlScans.schedule_id == stats.schedule_id).all()
+    if get_param(args, 'internal_only', False):
+        matcher = HostMatcher(urlparse(domain).netloc for domain in args.domains.split())
+        rows = [row for row in rows if matcher.matches(row.url)]
+    unchanged = {}
+    if get_param(args, 'incremental', False):
+        previous_schedule_id = get_param(args, 'previous_schedule', None) or find_previous_schedule(stats.schedule_id)
+        if previous_schedule_id:
+            unchanged = find_unchanged_urls(stats.schedule_id, previous_schedule_id)
+            rows = [row for row in rows if row.id not in unchanged]
+            print("{} urls didn't change since schedule {}, their cookies are carried over".format(
+                len(unchanged), previous_schedule_id))
+    progress = create_progress(stats.schedule_id, args)
+    extract_cookies(rows, stats, args, driver_path, total=len(rows), cache=cache, progress=progress)
+    carry_over_cookies(unchanged, progress)
 
 
 def get_stats(schedule_id):
-    if session.query(exists().where(MuncherStats.schedule_id == schedule_id)).scalar():
-        stats = session.query(MuncherStats).filter(MuncherStats.schedule_id == schedule_id).scalar()
+    if session.query(exists().where(db.MuncherStats.schedule_id == schedule_id)).scalar():
+        stats = session.query(db.MuncherStats).filter(db.MuncherStats.schedule_id == schedule_id).scalar()
         session.add(stats)
         return stats
     else:
@@ -182,25 +511,57 @@ def get_stats(schedule_id):
         return None
 
 
-def main():
-    parser = create_parser()
-    parser_args = parser.parse_args()
-    schedule = session.query(MuncherSchedule).get(parser_args.id)
-    config = session.query(MuncherConfig).get(schedule.config_id)
-    stats = get_stats(parser_args.id)
-    args, driver_path = format_arguments(DotMap(json.loads(config.json_params)), parser_args.os, parser_args.id)
+def summarize(schedule_id):
+    """
+    Builds the cookie summary the reports read, a failure only means the reports aggregate the cookies themselves.
+    :param schedule_id: The scheduled task id.
+    """
+    try:
+        with metrics.timer('cookie_summary_seconds'):
+            summarize_schedule(session, schedule_id)
+    except Exception as e:
+        session.rollback()
+        logging.error("failed summarizing the cookies of schedule {}: {}".format(schedule_id, e))
+
+
+def process_schedule(schedule_id, os_system, cache=None):
+    """
+    Extracts the cookies of all of the urls that were crawled in the schedule.
+    :param schedule_id: The scheduled task id.
+    :param os_system: The operation system the script runs on.
+    :param CookieInfoCache cache: An already warm cookie info cache, if None a new one is created for this run.
+    :return: The result of the extraction.
+    """
+    schedule = session.query(db.MuncherSchedule).get(schedule_id)
+    config = session.query(db.MuncherConfig).get(schedule.config_id)
+    stats = get_stats(schedule_id)
+    args, driver_path = format_arguments(DotMap(json.loads(config.json_params)), os_system, schedule_id)
+    # The worker processes of the orchestrator handle many schedules.
+    metrics.REGISTRY.reset()
+    reporter = metrics.start_reporting(get_param(args, 'metrics', None))
     try:
         start = datetime.datetime.now()
-        run(stats, args, driver_path)
-        stats.cookie_last_result = 'finished'
+        run(stats, args, driver_path, cache)
+        stats.cookie_last_result = result = 'finished'
         stats.cookie_scan_duration = (datetime.datetime.now() - start).seconds
-        session.commit()
-        session.close()
     except Exception as e:
         logging.error(e)
-        stats.cookie_last_result = 'aborted'
-        session.commit()
-        session.close()
+        stats.cookie_last_result = result = 'aborted'
+    finally:
+        reporter.stop()
+    # Committed first, a failed summary rolls back the session.
+    session.commit()
+    if result == 'finished':
+        summarize(schedule_id)
+    metrics.roll_up(stats, 'cookies')
+    session.commit()
+    session.close()
+    return result
+
+
+def main():
+    parser_args = create_parser().parse_args()
+    process_schedule(parser_args.id, parser_args.os)
 
 
 if __name__ == '__main__':
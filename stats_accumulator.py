@@ -0,0 +1,145 @@
+"""
+The progress counters of a run (crawled urls, extracted cookies) are kept in memory and written to
+tbl_Muncher_Stats every interval with a single UPDATE of the stats row, so the progress of a run is visible while it
+is in progress and a crashed run keeps its partial counts without a write for every crawled url or extracted cookie.
+A crawl also writes a heartbeat to the stats while it runs, so the orchestrator can tell a crawl that is running in
+another process from one that stopped.
+"""
+import datetime
+import logging
+import threading
+import time
+
+import db
+
+DEFAULT_STATS_FLUSH_INTERVAL = 5
+HEARTBEAT_COLUMN = 'crawl_heartbeat'
+DEFAULT_HEARTBEAT_INTERVAL = 30
+
+
+class StatsAccumulator(object):
+    """
+    Accumulates the counters of the stats of a schedule, safe to update from several threads. Only the columns that
+    were counted are written, so a crawl and a cookie extraction of the same schedule can run at the same time and the
+    stats object of the session of the run must not change the same columns.
+    """
+
+    def __init__(self, schedule_id, interval=DEFAULT_STATS_FLUSH_INTERVAL, initial=None, engine=None):
+        """
+        :param schedule_id: The schedule id of the stats.
+        :param interval: The minimal amount of seconds between the writes, 0 means every update is written.
+        :param initial: A dict from the columns to their initial values, for example the counts of a resumed crawl.
+        :param engine: The engine of the db, if None the engine of db.py is used.
+        """
+        self.schedule_id = schedule_id
+        self.interval = interval
+        self.engine = engine
+        self.values = dict(initial or {})
+        self._lock = threading.Lock()
+        self._dirty = bool(self.values)
+        self._last_flush = time.time()
+
+    def increment(self, column, amount=1):
+        """
+        :param column: The name of the counter column in the stats table, for example 'urls_scanned_fp'.
+        :param amount: The amount that is added to the counter.
+        """
+        with self._lock:
+            self.values[column] = self.values.get(column, 0) + amount
+            self._dirty = True
+        self.maybe_flush()
+
+    def set(self, column, value):
+        with self._lock:
+            self.values[column] = value
+            self._dirty = True
+        self.maybe_flush()
+
+    def get(self, column, default=0):
+        with self._lock:
+            return self.values.get(column, default)
+
+    def maybe_flush(self):
+        """
+        Writes the counters in case the interval passed since the last write. A failed write doesn't stop the run,
+        it is retried once the next interval passes and the final flush() raises in case it still fails.
+        """
+        if time.time() - self._last_flush >= self.interval:
+            try:
+                self.flush()
+            except Exception as e:
+                logging.error("failed writing the stats of schedule {}: {}".format(self.schedule_id, e))
+
+    def flush(self):
+        """
+        Writes the current counters to the stats row in its own transaction.
+        """
+        with self._lock:
+            if not self._dirty:
+                return
+            values = dict(self.values)
+            self._dirty = False
+            self._last_flush = time.time()
+        stats_table = db.MuncherStats.__table__
+        try:
+            with (self.engine or db.engine).begin() as connection:
+                connection.execute(stats_table.update().where(stats_table.c.schedule_id == self.schedule_id)
+                                   .values(**values))
+        except Exception:
+            # The counters are written again by the next flush.
+            with self._lock:
+                self._dirty = True
+            raise
+
+
+def has_heartbeat_column():
+    """
+    :return: True in case the heartbeat column was added to the stats by initial_db.migrate().
+    """
+    return HEARTBEAT_COLUMN in db.MuncherStats.__table__.c
+
+
+class Heartbeat(object):
+    """
+    Writes the current time to the heartbeat column of the stats of the crawled schedules every interval from a
+    background thread, and clears it once the crawls end.
+    """
+
+    def __init__(self, schedule_ids, interval=DEFAULT_HEARTBEAT_INTERVAL, engine=None):
+        """
+        :param schedule_ids: The ids of the schedules crawled by this process.
+        :param interval: The amount of seconds between the writes.
+        :param engine: The engine of the db, if None the engine of db.py is used.
+        """
+        self.schedule_ids = list(schedule_ids)
+        self.interval = interval
+        self.engine = engine
+        self._stop = threading.Event()
+        self._thread = None
+
+    def start(self):
+        if self.schedule_ids and has_heartbeat_column():
+            self.beat(datetime.datetime.now())
+            self._thread = threading.Thread(target=self._run, name='crawl-heartbeat', daemon=True)
+            self._thread.start()
+        return self
+
+    def _run(self):
+        while not self._stop.wait(self.interval):
+            self.beat(datetime.datetime.now())
+
+    def beat(self, value):
+        stats_table = db.MuncherStats.__table__
+        try:
+            with (self.engine or db.engine).begin() as connection:
+                connection.execute(stats_table.update().where(stats_table.c.schedule_id.in_(self.schedule_ids))
+                                   .values(**{HEARTBEAT_COLUMN: value}))
+        except Exception as e:
+            logging.error("failed writing the heartbeat of the schedules {}: {}".format(self.schedule_ids, e))
+
+    def stop(self):
+        if self._thread is None:
+            return
+        self._stop.set()
+        self._thread.join()
+        self.beat(None)
@@ -0,0 +1,57 @@
+import unittest
+
+from browser_pool import DriverSession
+
+
+class FakeDriver(object):
+    def __init__(self):
+        self.quit_calls = 0
+
+    def quit(self):
+        self.quit_calls += 1
+
+
+class DriverSessionTest(unittest.TestCase):
+    def setUp(self):
+        self.drivers = []
+        self.resets = []
+
+    def create_driver(self):
+        self.drivers.append(FakeDriver())
+        return self.drivers[-1]
+
+    def create_session(self, max_pages):
+        session = DriverSession(self.create_driver, self.resets.append, max_pages=max_pages, max_memory_mb=0)
+        self.addCleanup(session.quit)
+        return session
+
+    def load_pages(self, session, pages):
+        used = []
+        for _ in range(pages):
+            used.append(session.acquire())
+            session.release()
+        return used
+
+    def test_the_driver_is_recycled_after_max_pages(self):
+        session = self.create_session(max_pages=2)
+        used = self.load_pages(session, 5)
+        self.assertEqual(3, len(self.drivers))
+        self.assertEqual([self.drivers[0]] * 2 + [self.drivers[1]] * 2 + [self.drivers[2]], used)
+        self.assertEqual([1, 1, 0], [driver.quit_calls for driver in self.drivers])
+        self.assertEqual(2, session.recycles)
+
+    def test_a_driver_is_reset_only_after_its_first_page(self):
+        session = self.create_session(max_pages=3)
+        self.load_pages(session, 4)
+        # The first page of every driver starts clean, the next pages clear what the previous page left.
+        self.assertEqual([self.drivers[0], self.drivers[0]], self.resets)
+
+    def test_a_driver_without_a_page_limit_is_never_recycled(self):
+        session = self.create_session(max_pages=0)
+        self.load_pages(session, 10)
+        self.assertEqual(1, len(self.drivers))
+        self.assertEqual(9, len(self.resets))
+
+
+if __name__ == '__main__':
+    unittest.main()
@@ -0,0 +1,89 @@
+import datetime
+import os
+import tempfile
+import unittest
+from unittest import mock
+
+from sqlalchemy.orm import Session
+
+from cookie_cache import create_cookie_cache
+from cookiepedia import CookiepediaClient
+from fixtures import cookiepedia_server
+from fixtures.fake_db import use_fake_db
+
+work_dir = None
+server = None
+process2 = None
+db = None
+
+
+def setUpModule():
+    global work_dir, server, process2, db
+    work_dir = tempfile.TemporaryDirectory()
+    use_fake_db(os.path.join(work_dir.name, 'muncher.db'))
+    # process2 binds its session to the db on import.
+    import db
+    import process2
+    server = cookiepedia_server.serve_in_background()
+
+
+def tearDownModule():
+    server.shutdown()
+    db.configure()
+    work_dir.cleanup()
+
+
+class CookieInfoResolverTest(unittest.TestCase):
+    def setUp(self):
+        self.session = Session(db.engine)
+        patcher = mock.patch.object(process2, 'session', self.session)
+        patcher.start()
+        self.addCleanup(patcher.stop)
+        self.addCleanup(self.session.close)
+        self.client = CookiepediaClient(path_format=server.path_format, retries=0)
+        self.addCleanup(self.client.close)
+        self.resolver = process2.CookieInfoResolver(self.client, create_cookie_cache())
+        server.failing = set()
+
+    def save_cookie(self, name):
+        return db.insert_rows(self.session, db.Cookies.__table__, [
+            {'cookie_source': 0, 'cookie_attr': '{{"name": "{}"}}'.format(name),
+             'datetime': datetime.datetime.now()}])[0]
+
+    def info_ids(self, name):
+        return [info_id for info_id, in self.session.query(db.CookieInfo.id)
+                .filter(db.CookieInfo.cookie_name == name)]
+
+    def cookie_info_id(self, cookie_id):
+        self.session.expire_all()
+        return self.session.query(db.Cookies.cookie_info_id).filter(db.Cookies.id == cookie_id).scalar()
+
+    def test_a_failed_lookup_is_retried_by_the_next_cookie_of_the_name(self):
+        server.failing = {'_gid'}
+        first_id = self.save_cookie('_gid')
+        self.resolver.add('_gid', first_id)
+        self.resolver.flush(wait=True)
+        self.assertNotIn('_gid', self.resolver)
+        self.assertEqual([], self.info_ids('_gid'))
+
+        server.failing = set()
+        second_id = self.save_cookie('_gid')
+        self.resolver.add('_gid', second_id)
+        self.resolver.flush(wait=True)
+        self.assertEqual(self.info_ids('_gid'), [self.cookie_info_id(second_id)])
+        self.assertIsNone(self.cookie_info_id(first_id))
+
+    def test_a_name_saved_meanwhile_is_not_saved_again(self):
+        cookie_id = self.save_cookie('NID')
+        self.resolver.add('NID', cookie_id)
+        # Another worker saves the same name while the lookup is in flight.
+        self.session.add(db.CookieInfo(cookie_name='NID', about='About NID', purpose='Targeting/Advertising',
+                                       datetime=datetime.datetime.now()))
+        self.session.commit()
+        self.resolver.flush(wait=True)
+        self.assertEqual(1, len(self.info_ids('NID')))
+        self.assertEqual(self.info_ids('NID')[0], self.cookie_info_id(cookie_id))
+
+
+if __name__ == '__main__':
+    unittest.main()
@@ -0,0 +1,82 @@
+import datetime
+import os
+import tempfile
+import unittest
+from unittest import mock
+
+from sqlalchemy.orm import Session
+
+from cookie_summary import aggregate, load_summary
+from fixtures.fake_db import use_fake_db
+
+SITE = 'http://www.example.com'
+GA = ('Performance', '_ga')
+NID = ('Targeting/Advertising', 'NID')
+SID = ('Strictly Necessary', 'sid')
+
+work_dir = None
+process2 = None
+db = None
+
+
+def setUpModule():
+    global work_dir, process2, db
+    work_dir = tempfile.TemporaryDirectory()
+    use_fake_db(os.path.join(work_dir.name, 'muncher.db'))
+    # process2 binds its session to the db on import.
+    import db
+    import process2
+
+
+def tearDownModule():
+    db.configure()
+    work_dir.cleanup()
+
+
+class AggregateTest(unittest.TestCase):
+    def test_the_first_found_url_is_the_one_of_the_lowest_depth(self):
+        links = [(1, SITE + '/shop/cart', 10), (2, SITE + '/shop', 11), (3, SITE + '/', 12), (4, SITE + '/about', 13)]
+        entry = aggregate(links, dict.fromkeys([10, 11, 12, 13], GA))[GA]
+        self.assertEqual(SITE + '/', entry['first_found_url'])
+        self.assertEqual(0, entry['first_found_depth'])
+        self.assertEqual(10, entry['cookie_id'])
+
+    def test_a_url_with_several_cookies_of_a_key_is_counted_once(self):
+        links = [(1, SITE + '/', 10), (1, SITE + '/', 11), (1, SITE + '/', 12), (2, SITE + '/a', 13),
+                 (2, SITE + '/a', 14)]
+        entries = aggregate(links, {10: GA, 11: GA, 12: NID, 13: GA, 14: GA})
+        self.assertEqual(2, entries[GA]['url_count'])
+        self.assertEqual(1, entries[NID]['url_count'])
+
+    def test_the_keys_are_in_the_order_they_were_first_found(self):
+        links = [(1, SITE + '/a/b', 10), (1, SITE + '/a/b', 11), (2, SITE + '/', 12), (2, SITE + '/', 13)]
+        entries = aggregate(links, {10: NID, 11: SID, 12: GA, 13: NID})
+        self.assertEqual([NID, SID, GA], list(entries))
+        self.assertEqual(SITE + '/', entries[NID]['first_found_url'])
+        self.assertEqual(SITE + '/a/b', entries[SID]['first_found_url'])
+
+    def test_a_tie_on_the_depth_keeps_the_first_found_url(self):
+        links = [(1, SITE + '/a', 10), (2, SITE + '/b', 11)]
+        self.assertEqual(SITE + '/a', aggregate(links, {10: GA, 11: GA})[GA]['first_found_url'])
+
+
+class ClearExtractedCookiesTest(unittest.TestCase):
+    def setUp(self):
+        self.session = Session(db.engine)
+        patcher = mock.patch.object(process2, 'session', self.session)
+        patcher.start()
+        self.addCleanup(patcher.stop)
+        self.addCleanup(self.session.close)
+
+    def test_the_summary_of_a_previous_extraction_is_removed(self):
+        schedule_id = 9
+        self.session.add(db.CookieSummary(schedule_id=schedule_id, purpose=GA[0], cookie_name=GA[1], about='',
+                                          cookie_attr='{"name": "_ga"}', datetime=datetime.datetime.now(),
+                                          first_found_url=SITE + '/', first_found_depth=0, url_count=1))
+        self.session.commit()
+        process2.clear_extracted_cookies(schedule_id)
+        self.assertEqual([], load_summary(self.session, schedule_id))
+
+
+if __name__ == '__main__':
+    unittest.main()
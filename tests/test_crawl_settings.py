@@ -0,0 +1,54 @@
+import os
+import queue
+import tempfile
+import unittest
+
+from scrapy.crawler import Crawler
+
+from cookieMuncher.pipelines import CookiemuncherPipeline
+from cookieMuncher.spiders.cookie_muncher import CookieMuncherSpider, build_settings
+from fixtures.fake_db import use_fake_db
+import db
+
+START_URL = 'http://127.0.0.1:8000/'
+SCHEDULE_ID = 3
+
+work_dir = None
+
+
+def setUpModule():
+    global work_dir
+    work_dir = tempfile.TemporaryDirectory()
+    use_fake_db(os.path.join(work_dir.name, 'muncher.db'))
+
+
+def tearDownModule():
+    db.configure()
+    work_dir.cleanup()
+
+
+class CrawlSettingsTest(unittest.TestCase):
+    def create_crawler(self):
+        return Crawler(CookieMuncherSpider, build_settings(SCHEDULE_ID, depth=2, delay=0, user_agent=None,
+                                                          batch_size=2, flush_interval=0, print_items=False))
+
+    def test_a_crawler_is_built_from_the_settings(self):
+        crawler = self.create_crawler()
+        self.assertEqual(2, crawler.settings.getint('DEPTH_LIMIT'))
+        self.assertEqual(SCHEDULE_ID, crawler.settings.getint('schedule_id'))
+
+    def test_the_pipeline_feeds_the_saved_urls_to_the_queue_of_the_spider(self):
+        url_queue = queue.Queue()
+        crawler = self.create_crawler()
+        spider = CookieMuncherSpider.from_crawler(crawler, [START_URL], [], SCHEDULE_ID, url_queue=url_queue)
+        pipeline = CookiemuncherPipeline.from_crawler(crawler)
+        pipeline.open_spider(spider)
+        for page in range(3):
+            pipeline.process_item({'link': '{}{}'.format(START_URL, page)}, spider)
+        pipeline.close_spider(spider)
+        urls = [url for _, url in iter(url_queue.get_nowait, None)]
+        self.assertEqual(['{}{}'.format(START_URL, page) for page in range(3)], urls)
+
+
+if __name__ == '__main__':
+    unittest.main()
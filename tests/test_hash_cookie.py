@@ -0,0 +1,43 @@
+import unittest
+
+from utils import DEFAULT_HASH_ATTRIBUTES, hash_cookie
+
+SCHEDULE_ID = 7
+# The attributes hashed when the cookie_hash_value config param is set.
+VALUE_ATTRIBUTES = DEFAULT_HASH_ATTRIBUTES + ['value']
+
+
+def create_cookie(**attributes):
+    cookie = {'name': '_ga', 'value': 'GA1.2.123', 'domain': '.example.com', 'path': '/', 'httponly': False,
+              'secure': False, 'expiry': 1700000000, 'expires': 'Tue, 14 Nov 2023 22:13:20 GMT'}
+    cookie.update(attributes)
+    return cookie
+
+
+class HashCookieTest(unittest.TestCase):
+    def test_sightings_differing_only_in_expiration_share_a_hash(self):
+        first = create_cookie()
+        second = create_cookie(expiry=1700000001, expires='Tue, 14 Nov 2023 22:13:21 GMT')
+        self.assertEqual(hash_cookie(first, SCHEDULE_ID), hash_cookie(second, SCHEDULE_ID))
+
+    def test_sightings_differing_only_in_value_share_a_hash(self):
+        self.assertEqual(hash_cookie(create_cookie(), SCHEDULE_ID),
+                         hash_cookie(create_cookie(value='GA1.2.456'), SCHEDULE_ID))
+
+    def test_different_values_have_different_hashes_when_the_value_is_hashed(self):
+        self.assertNotEqual(hash_cookie(create_cookie(), SCHEDULE_ID, VALUE_ATTRIBUTES),
+                            hash_cookie(create_cookie(value='GA1.2.456'), SCHEDULE_ID, VALUE_ATTRIBUTES))
+
+    def test_identifying_attributes_change_the_hash(self):
+        for attributes in [{'name': '_gid'}, {'domain': 'www.example.com'}, {'path': '/shop'}, {'secure': True},
+                           {'httponly': True}]:
+            with self.subTest(attributes=attributes):
+                self.assertNotEqual(hash_cookie(create_cookie(), SCHEDULE_ID),
+                                    hash_cookie(create_cookie(**attributes), SCHEDULE_ID))
+
+    def test_different_schedules_have_different_hashes(self):
+        self.assertNotEqual(hash_cookie(create_cookie(), SCHEDULE_ID), hash_cookie(create_cookie(), SCHEDULE_ID + 1))
+
+
+if __name__ == '__main__':
+    unittest.main()
@@ -0,0 +1,37 @@
+import unittest
+
+from host_matcher import HostMatcher, extract_host
+
+
+class HostMatcherTest(unittest.TestCase):
+    def setUp(self):
+        self.matcher = HostMatcher(['www.example.com', 'tumblr.com'])
+
+    def test_the_domain_and_its_sub_domains_match(self):
+        self.assertTrue(self.matcher.matches('http://tumblr.com/'))
+        self.assertTrue(self.matcher.matches('https://staff.tumblr.com/post/1'))
+        self.assertTrue(self.matcher.matches('https://a.b.tumblr.com'))
+        self.assertTrue(self.matcher.matches('https://cdn.www.example.com/a.js'))
+
+    def test_a_parent_domain_of_a_domain_does_not_match(self):
+        self.assertFalse(self.matcher.matches('https://example.com/'))
+
+    def test_lookalike_suffixes_do_not_match(self):
+        self.assertFalse(self.matcher.matches('https://eviltumblr.com/'))
+        self.assertFalse(self.matcher.matches('https://tumblr.com.evil.com/'))
+        self.assertFalse(self.matcher.matches('https://evil.com/?q=tumblr.com'))
+        self.assertFalse(self.matcher.matches('https://tumblr.com@evil.com/'))
+
+    def test_ports_case_and_trailing_dots_are_ignored(self):
+        self.assertTrue(self.matcher.matches('https://Staff.TUMBLR.com:8443/'))
+        self.assertTrue(self.matcher.matches('https://tumblr.com./'))
+        self.assertTrue(HostMatcher(['tumblr.com:8080']).matches('http://tumblr.com/'))
+
+    def test_urls_without_a_host_do_not_match(self):
+        self.assertFalse(self.matcher.matches('/relative/tumblr.com'))
+        self.assertFalse(self.matcher.matches('mailto:staff@tumblr.com'))
+        self.assertEqual('', extract_host('tumblr.com/path'))
+
+
+if __name__ == '__main__':
+    unittest.main()
@@ -0,0 +1,65 @@
+import os
+import tempfile
+import unittest
+
+from scrapy import Spider
+from scrapy.http import HtmlResponse, Request
+from scrapy.settings import Settings
+
+from cookieMuncher.httpcache import DomainCacheStorage, cache_settings
+
+BODY = b'<html><body>' + b'x' * 1000 + b'</body></html>'
+
+
+class DomainCacheStorageTest(unittest.TestCase):
+    def setUp(self):
+        work_dir = tempfile.TemporaryDirectory()
+        self.addCleanup(work_dir.cleanup)
+        self.cache_dir = work_dir.name
+        self.spider = Spider('cookie_muncher')
+
+    def open_storage(self, max_size_mb=0):
+        settings = Settings(cache_settings({'enabled': True, 'dir': self.cache_dir, 'max_size_mb': max_size_mb}))
+        storage = DomainCacheStorage(settings)
+        storage.open_spider(self.spider)
+        return storage
+
+    def store(self, storage, url):
+        request = Request(url)
+        storage.store_response(self.spider, request, HtmlResponse(url, body=BODY, headers={'ETag': '"1"'}))
+        return request
+
+    def test_a_stored_response_is_retrieved_from_the_folder_of_its_domain(self):
+        storage = self.open_storage()
+        request = self.store(storage, 'http://www.example.com/page')
+        response = storage.retrieve_response(self.spider, request)
+        storage.close_spider(self.spider)
+        self.assertEqual(BODY, response.body)
+        self.assertEqual(b'"1"', response.headers['ETag'])
+        self.assertTrue(os.path.isdir(os.path.join(self.cache_dir, self.spider.name, 'www.example.com')))
+        self.assertIsNone(storage.retrieve_response(self.spider, Request('http://www.example.com/other')))
+
+    def test_the_least_recently_used_response_is_evicted(self):
+        storage = self.open_storage()
+        first = self.store(storage, 'http://www.example.com/1')
+        second = self.store(storage, 'http://www.example.com/2')
+        storage.retrieve_response(self.spider, first)
+        storage.max_size = storage.size
+        self.store(storage, 'http://www.example.org/3')
+        self.assertIsNotNone(storage.retrieve_response(self.spider, first))
+        self.assertIsNone(storage.retrieve_response(self.spider, second))
+        storage.close_spider(self.spider)
+
+    def test_the_size_of_the_cache_is_restored_from_the_journal(self):
+        storage = self.open_storage()
+        for page in range(3):
+            self.store(storage, 'http://www.example.com/{}'.format(page))
+        storage.close_spider(self.spider)
+        reopened = self.open_storage()
+        reopened.close_spider(self.spider)
+        self.assertEqual(storage.size, reopened.size)
+        self.assertEqual(list(storage.entries), list(reopened.entries))
+
+
+if __name__ == '__main__':
+    unittest.main()
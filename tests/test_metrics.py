@@ -0,0 +1,58 @@
+import unittest
+
+from metrics import Histogram, Registry
+
+BUCKETS = [0.1, 0.5, 1]
+
+
+class HistogramTest(unittest.TestCase):
+    def test_an_empty_histogram_has_no_quantiles(self):
+        self.assertEqual(0, Histogram(BUCKETS).quantile(0.5))
+
+    def test_a_quantile_is_the_upper_bound_of_its_bucket(self):
+        histogram = Histogram(BUCKETS)
+        for value in [0.05, 0.2, 0.3, 0.4]:
+            histogram.observe(value)
+        self.assertEqual(0.1, histogram.quantile(0.25))
+        self.assertEqual(0.5, histogram.quantile(0.5))
+        self.assertEqual(0.5, histogram.quantile(1))
+
+    def test_a_value_on_a_bound_is_counted_in_its_bucket(self):
+        histogram = Histogram(BUCKETS)
+        histogram.observe(0.5)
+        self.assertEqual([0, 1, 0, 0], histogram.counts)
+        self.assertEqual(0.5, histogram.quantile(1))
+
+    def test_a_quantile_above_all_of_the_bounds_is_the_maximal_value(self):
+        histogram = Histogram(BUCKETS)
+        for value in [0.05, 3, 7]:
+            histogram.observe(value)
+        self.assertEqual([1, 0, 0, 2], histogram.counts)
+        self.assertEqual(0.1, histogram.quantile(0.3))
+        self.assertEqual(7, histogram.quantile(0.5))
+        self.assertEqual(7, histogram.to_dict()['p95'])
+
+
+class RegistryTest(unittest.TestCase):
+    def test_the_updates_of_a_registry_are_forwarded_to_its_parent(self):
+        parent = Registry()
+        child = Registry(parent=parent)
+        child.increment('urls_saved', 3)
+        child.observe('db_flush_seconds', 0.2)
+        self.assertEqual(3, parent.counters['urls_saved'])
+        self.assertEqual(1, parent.histograms['db_flush_seconds'].count)
+
+    def test_the_updates_of_the_parent_are_not_forwarded_to_its_children(self):
+        parent = Registry()
+        first = Registry(parent=parent)
+        second = Registry(parent=parent)
+        first.increment('urls_saved')
+        second.increment('urls_saved', 2)
+        parent.increment('urls_saved', 4)
+        self.assertEqual(7, parent.counters['urls_saved'])
+        self.assertEqual({'urls_saved': 1}, first.counters)
+        self.assertEqual({'urls_saved': 2}, second.counters)
+
+
+if __name__ == '__main__':
+    unittest.main()
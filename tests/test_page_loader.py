@@ -0,0 +1,42 @@
+import unittest
+from http.cookiejar import Cookie
+
+from page_loader import HTTP, cookie_to_json, create_page_loader
+
+
+def create_cookie(rest):
+    return Cookie(version=0, name='sid', value='1', port=None, port_specified=False, domain='www.example.com',
+                  domain_specified=False, domain_initial_dot=False, path='/', path_specified=True, secure=False,
+                  expires=None, discard=True, comment=None, comment_url=None, rest=rest)
+
+
+class CookieToJsonTest(unittest.TestCase):
+    def test_the_http_only_flag_is_found_in_any_spelling(self):
+        for name in ['HttpOnly', 'httponly', 'HTTPONLY']:
+            with self.subTest(name=name):
+                self.assertTrue(cookie_to_json(create_cookie({name: None}))['httponly'])
+
+    def test_a_cookie_without_the_flag_is_not_http_only(self):
+        self.assertFalse(cookie_to_json(create_cookie({'SameSite': 'Lax'}))['httponly'])
+
+
+class HttpPageLoadTest(unittest.TestCase):
+    def create_fetcher(self, **params):
+        create_driver, _, _ = create_page_loader(dict(params, mode=HTTP), None, None)
+        fetcher = create_driver()
+        self.addCleanup(fetcher.quit)
+        return fetcher
+
+    def test_the_certificates_are_verified_by_default(self):
+        self.assertTrue(self.create_fetcher().verify)
+
+    def test_the_verification_can_be_turned_off(self):
+        self.assertFalse(self.create_fetcher(verify=False).verify)
+
+    def test_an_invalid_verify_is_refused(self):
+        with self.assertRaises(ValueError):
+            create_page_loader({'mode': HTTP, 'verify': 'no'}, None, None)
+
+
+if __name__ == '__main__':
+    unittest.main()
@@ -0,0 +1,72 @@
+import datetime
+import os
+import tempfile
+import unittest
+
+from sqlalchemy.orm import Session
+
+from fixtures.fake_db import create_schedule, use_fake_db
+import db
+
+PARAMS = {'domains': 'http://www.example.com/'}
+
+work_dir = None
+orchestrator = None
+stats_accumulator = None
+
+
+def setUpModule():
+    global work_dir, orchestrator, stats_accumulator
+    work_dir = tempfile.TemporaryDirectory()
+    use_fake_db(os.path.join(work_dir.name, 'muncher.db'))
+    import orchestrator
+    import stats_accumulator
+
+
+def tearDownModule():
+    db.configure()
+    work_dir.cleanup()
+
+
+class PendingSchedulesTest(unittest.TestCase):
+    def setUp(self):
+        self.session = Session(db.engine)
+        self.addCleanup(self.session.close)
+        self.orchestrator = orchestrator.Orchestrator(workers=1)
+        self.addCleanup(self.orchestrator._processes.shutdown)
+        self.addCleanup(self.orchestrator._threads.shutdown)
+        self.since = self.orchestrator.since = create_schedule(self.session, PARAMS)
+
+    def add_schedule(self, **stats):
+        schedule_id = create_schedule(self.session, PARAMS)
+        self.session.add(db.MuncherStats(schedule_id=schedule_id, **stats))
+        self.session.commit()
+        return schedule_id
+
+    def pending_ids(self):
+        self.session.expire_all()
+        return [schedule_id for schedule_id, _ in self.orchestrator.pending_schedules(self.session)
+                if schedule_id != self.since]
+
+    def test_a_schedule_with_a_fresh_heartbeat_is_skipped(self):
+        self.add_schedule(crawl_heartbeat=datetime.datetime.now())
+        self.assertEqual([], self.pending_ids())
+
+    def test_a_schedule_with_a_stale_or_no_heartbeat_is_pending(self):
+        stale = datetime.datetime.now() - datetime.timedelta(seconds=orchestrator.HEARTBEAT_GRACE + 1)
+        stale_id = self.add_schedule(crawl_heartbeat=stale)
+        stopped_id = self.add_schedule(crawl_heartbeat=None)
+        self.assertEqual([stale_id, stopped_id], self.pending_ids())
+
+    def test_a_heartbeat_marks_the_schedule_as_crawling_until_it_stops(self):
+        schedule_id = self.add_schedule()
+        heartbeat = stats_accumulator.Heartbeat([schedule_id], interval=60).start()
+        try:
+            self.assertEqual([], self.pending_ids())
+        finally:
+            heartbeat.stop()
+        self.assertEqual([schedule_id], self.pending_ids())
+
+
+if __name__ == '__main__':
+    unittest.main()
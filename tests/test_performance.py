@@ -0,0 +1,25 @@
+import unittest
+
+from scrapy.settings import default_settings
+
+from cookieMuncher.performance import DEFAULT_PROFILE, LEGACY_PROFILE, profile_settings
+
+
+class PerformanceProfileTest(unittest.TestCase):
+    def test_the_legacy_profile_matches_the_scrapy_defaults(self):
+        for setting, value in profile_settings(defaults=LEGACY_PROFILE).items():
+            with self.subTest(setting=setting):
+                self.assertEqual(getattr(default_settings, setting), value)
+
+    def test_missing_params_are_taken_from_the_defaults(self):
+        settings = profile_settings({'concurrent_requests': 64})
+        self.assertEqual(64, settings['CONCURRENT_REQUESTS'])
+        self.assertEqual(DEFAULT_PROFILE['download_timeout'], settings['DOWNLOAD_TIMEOUT'])
+
+    def test_an_invalid_param_is_refused(self):
+        with self.assertRaises(ValueError):
+            profile_settings({'concurrent_requests_per_domain': 0})
+
+
+if __name__ == '__main__':
+    unittest.main()
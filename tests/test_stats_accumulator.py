@@ -0,0 +1,72 @@
+import os
+import tempfile
+import unittest
+from unittest import mock
+
+from sqlalchemy.exc import OperationalError
+from sqlalchemy.orm import Session
+
+from fixtures.fake_db import use_fake_db
+from stats_accumulator import StatsAccumulator
+import db
+
+SCHEDULE_ID = 5
+
+work_dir = None
+
+
+def setUpModule():
+    global work_dir
+    work_dir = tempfile.TemporaryDirectory()
+    use_fake_db(os.path.join(work_dir.name, 'muncher.db'))
+
+
+def tearDownModule():
+    db.configure()
+    work_dir.cleanup()
+
+
+class StatsAccumulatorTest(unittest.TestCase):
+    def setUp(self):
+        self.session = Session(db.engine)
+        self.addCleanup(self.session.close)
+        self.session.query(db.MuncherStats).delete()
+        self.session.add(db.MuncherStats(schedule_id=SCHEDULE_ID, urls_scanned_fp=0))
+        self.session.commit()
+
+    def saved_count(self):
+        self.session.expire_all()
+        return self.session.query(db.MuncherStats.urls_scanned_fp) \
+            .filter(db.MuncherStats.schedule_id == SCHEDULE_ID).scalar()
+
+    def fail_writes(self):
+        error = OperationalError('UPDATE tbl_Muncher_Stats', {}, Exception('MySQL server has gone away'))
+        return mock.patch.object(db.engine, 'begin', side_effect=error)
+
+    def test_a_failed_flush_keeps_the_counters_dirty_and_raises(self):
+        stats = StatsAccumulator(SCHEDULE_ID, interval=0)
+        with self.fail_writes():
+            stats.increment('urls_scanned_fp', 2)
+            with self.assertRaises(OperationalError):
+                stats.flush()
+        self.assertEqual(0, self.saved_count())
+        stats.flush()
+        self.assertEqual(2, self.saved_count())
+
+    def test_the_counts_of_a_failed_flush_are_written_by_the_next_one(self):
+        stats = StatsAccumulator(SCHEDULE_ID, interval=0)
+        with self.fail_writes():
+            stats.increment('urls_scanned_fp')
+        stats.increment('urls_scanned_fp')
+        self.assertEqual(2, self.saved_count())
+
+    def test_an_unchanged_counter_is_not_written_again(self):
+        stats = StatsAccumulator(SCHEDULE_ID, interval=0)
+        stats.increment('urls_scanned_fp')
+        with self.fail_writes() as begin:
+            stats.flush()
+        begin.assert_not_called()
+
+
+if __name__ == '__main__':
+    unittest.main()
@@ -1,12 +1,17 @@
 import argparse
+import hashlib
 import json
 import os
-from urllib.parse import urlparse
+from urllib.parse import urlparse, urlsplit, urlunsplit
 
-from db import CookieInfo
+from cookiepedia import UNKNOWN_ABOUT, UNKNOWN_PURPOSE
+import db
 
 OUTPUT_FIXTURE = 'csv'
 LOG_FIXTURE = 'log'
+# The attributes that identify a cookie, the value and the expiration change between the sightings of the same
+# tracking or session cookie.
+DEFAULT_HASH_ATTRIBUTES = ['name', 'domain', 'path', 'secure', 'httponly']
 
 
 def check_directory_exists(path):
@@ -18,15 +23,64 @@ def check_directory_exists(path):
         os.makedirs(path)
 
 
+def get_param(args, name, default):
+    """
+    Returns the value of an optional config param, configs created before the param existed don't contain it.
+    :param DotMap args: The args from the config table.
+    :param name: The name of the param.
+    :param default: The value returned in case the param is missing.
+    :return: The value of the param.
+    """
+    return args[name] if name in args else default
+
+
+def fingerprint_url(url):
+    """
+    Creates a fingerprint of the url that is used for finding the same url in different schedules, the scheme and
+    the host are case insensitive and the fragment is ignored.
+    :param url: The url.
+    :return: The hex digest of the fingerprint.
+    """
+    parts = urlsplit(url)
+    normalized = urlunsplit((parts.scheme.lower(), parts.netloc.lower(), parts.path or '/', parts.query, ''))
+    return hashlib.sha1(normalized.encode()).hexdigest()
+
+
+def hash_cookie(cookie, schedule_id, attributes=DEFAULT_HASH_ATTRIBUTES):
+    """
+    Creates a stable hash of the identifying cookie attributes, identical cookies of a schedule have the same hash.
+    :param cookie: The json cookie retrieved using phantomJs.
+    :param schedule_id: The id of the schedule in which the cookie was found.
+    :param attributes: The attributes that are hashed, a missing attribute is hashed as None.
+    :return: The hex digest of the hash.
+    """
+    normalized = {key: cookie.get(key) for key in attributes}
+    return hashlib.sha1(json.dumps([schedule_id, normalized], sort_keys=True).encode()).hexdigest()
+
+
 def enrich_cookie(cookie, session):
     cookie_json = json.loads(cookie.cookie_attr)
-    cookie_info = session.query(CookieInfo).filter(CookieInfo.id == cookie.cookie_info_id).scalar()
-    cookie_json['about'] = cookie_info.about
-    cookie_json['purpose'] = cookie_info.purpose
+    cookie_info = session.query(db.CookieInfo).filter(db.CookieInfo.id == cookie.cookie_info_id).scalar()
+    # The cookie info is missing when the cookiepedia lookup of the cookie failed.
+    cookie_json['about'] = cookie_info.about if cookie_info else UNKNOWN_ABOUT
+    cookie_json['purpose'] = cookie_info.purpose if cookie_info else UNKNOWN_PURPOSE
     cookie_json['extraction_time'] = cookie.datetime
     return cookie_json
 
 
+def enrich_cookie_row(row):
+    """
+    Same as enrich_cookie but for a row that was already joined with its cookie info.
+    :param row: A row with the cookie_attr, datetime, about and purpose columns.
+    :return: The cookie json.
+    """
+    cookie_json = json.loads(row.cookie_attr)
+    cookie_json['about'] = row.about if row.about is not None else UNKNOWN_ABOUT
+    cookie_json['purpose'] = row.purpose if row.purpose is not None else UNKNOWN_PURPOSE
+    cookie_json['extraction_time'] = row.datetime
+    return cookie_json
+
+
 def create_parser():
     """
     Creates the parser with all of the expected arguments.